@@ -0,0 +1,288 @@
+import math
+import random
+import time
+from bisect import bisect_left
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ValidationError
+
+from .autosave import SessionClosed, upsert_answers
+from .fastpath import question_rows
+from .models import Question, Choice, Specialization, ExamSession, StudentAnswer, AdaptiveState, ItemCalibration
+from .snapshots import get_bank_version
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+CALIBRATION_VERSION_KEY = 'adaptive-index:calibration'
+QUESTION_TIMEOUT = 24 * 60 * 60
+
+# {specialization_id: ((bank version, calibration version), built at, DifficultyIndex)}, per process.
+_indexes = {}
+
+
+class DifficultyIndex(NamedTuple):
+    difficulties: list
+    question_ids: list
+    # {question_id: {choice_id: is_correct}}, to grade answers without a query.
+    choices: dict
+
+
+def _calibration_version():
+    version = cache.get(CALIBRATION_VERSION_KEY)
+    if version is None:
+        cache.add(CALIBRATION_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CALIBRATION_VERSION_KEY)
+    return version
+
+
+def invalidate_difficulty_indexes():
+    """Have every process rebuild its indexes, after a calibration changed the difficulties."""
+    try:
+        cache.incr(CALIBRATION_VERSION_KEY)
+    except ValueError:
+        cache.add(CALIBRATION_VERSION_KEY, time.time_ns(), None)
+
+
+def estimated_difficulty(attempts, correct, skipped):
+    """
+    Rasch difficulty implied by a question's running statistics: minus the
+    logit of its correct rate among answered attempts, smoothed so unseen
+    questions start at 0. Stands in until the question is calibrated.
+    """
+    answered = attempts - skipped
+    return math.log((answered - correct + 1) / (correct + 1))
+
+
+def _build_index(specialization_id):
+    questions = Question.objects.filter(specialization_id=specialization_id, is_ai_generated=False)
+    items = sorted(
+        (estimated_difficulty(attempts or 0, correct or 0, skipped or 0) if difficulty is None else difficulty, pk)
+        for pk, difficulty, attempts, correct, skipped in questions.values_list(
+            'id', 'calibration__difficulty', 'statistics__attempts', 'statistics__correct', 'statistics__skipped',
+        )
+    )
+    choices = {pk: {} for _, pk in items}
+    for question_id, choice_id, is_correct in Choice.objects.filter(question__in=questions).values_list(
+        'question_id', 'id', 'is_correct'
+    ):
+        choices[question_id][choice_id] = is_correct
+    return DifficultyIndex([difficulty for difficulty, _ in items], [pk for _, pk in items], choices)
+
+
+def difficulty_index(specialization_id):
+    """
+    The specialization's non-AI questions sorted by difficulty, with their
+    answer key. Calibrated difficulties win over those estimated from the
+    statistics. Each process keeps its own copy, built with two queries, and
+    only reads the versions from the shared cache: it is rebuilt once the bank
+    or the calibration changes, or after ADAPTIVE_INDEX_REFRESH seconds so
+    estimated difficulties follow new submissions.
+    """
+    version = (get_bank_version(specialization_id), _calibration_version())
+    entry = _indexes.get(specialization_id)
+    now = time.monotonic()
+    if entry is None or entry[0] != version or now - entry[1] > settings.ADAPTIVE_INDEX_REFRESH:
+        entry = _indexes[specialization_id] = (version, now, _build_index(specialization_id))
+    return entry[2]
+
+
+def question_payload(question_id, specialization_id):
+    """A question as served to the student, rendered once per bank version."""
+    key = f'adaptive-question:{question_id}:{get_bank_version(specialization_id)}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = question_rows([question_id])[0]
+        cache.set(key, payload, QUESTION_TIMEOUT)
+    return payload
+
+
+def select_question(index, ability, exclude, width=None, rng=random):
+    """
+    The next question for a student of the given ability, as (question id,
+    difficulty), or None when every question is in `exclude`. Under the Rasch
+    model a question is most informative where its difficulty equals the
+    ability, so this bisects the sorted index and walks outwards to the
+    `width` nearest questions not yet asked, then picks one of them at random
+    to spread exposure: O(log n + width + len(exclude)).
+    """
+    width = width or settings.ADAPTIVE_SELECTION_WIDTH
+    difficulties, question_ids = index[0], index[1]
+    right = bisect_left(difficulties, ability)
+    left = right - 1
+    candidates = []
+    while len(candidates) < width and (left >= 0 or right < len(difficulties)):
+        if right >= len(difficulties) or (left >= 0 and ability - difficulties[left] <= difficulties[right] - ability):
+            position, left = left, left - 1
+        else:
+            position, right = right, right + 1
+        if question_ids[position] not in exclude:
+            candidates.append(position)
+    if not candidates:
+        return None
+    position = rng.choice(candidates)
+    return question_ids[position], difficulties[position]
+
+
+def update_ability(ability, precision, difficulty, correct):
+    """
+    Fold one response into a normal ability estimate: a Newton step on the
+    posterior from the current mean, adding the item's information at it to
+    the precision. O(1) per answer; the N(0, 1) prior keeps the estimate
+    finite while every answer so far is right, or wrong.
+    """
+    p = 1.0 / (1.0 + math.exp(difficulty - ability))
+    precision += p * (1.0 - p)
+    ability += ((1.0 if correct else 0.0) - p) / precision
+    return ability, precision
+
+
+def standard_error(precision):
+    return 1.0 / math.sqrt(precision)
+
+
+def _advance(state, exclude, index):
+    """Ask the next question, or none once the exam is long or precise enough."""
+    state.current_question_id = state.current_difficulty = None
+    if state.answered >= state.length or standard_error(state.precision) <= settings.ADAPTIVE_STOP_STANDARD_ERROR:
+        return
+    selected = select_question(index, state.ability, exclude)
+    if selected is not None:
+        state.current_question_id, state.current_difficulty = selected
+        state.asked.append(selected[0])
+        ExamSession.questions.through.objects.create(examsession_id=state.session_id, question_id=selected[0])
+
+
+def start_adaptive_session(student, data):
+    """
+    Open an in-progress adaptive session and pick its first question. The
+    session is submitted like any other once its questions run out.
+    """
+    specialization_id = data['specialization_id']
+    if not Specialization.objects.filter(pk=specialization_id).exists():
+        raise ValidationError({'specialization_id': ['Unknown specialization.']})
+    index = difficulty_index(specialization_id)
+    if not index[1]:
+        raise ValidationError({'specialization_id': ['There are no questions to draw from.']})
+    with transaction.atomic():
+        session = ExamSession.objects.create(
+            student_id=student.id,
+            specialization_id=specialization_id,
+            exam_name=data['exam_name'],
+            status='in_progress',
+            started_at=timezone.now(),
+            completed_at=None,
+        )
+        state = AdaptiveState(session=session, length=min(data['num_questions'], len(index[1])))
+        _advance(state, (), index)
+        state.save()
+    return state
+
+
+def answer_question(student, session_id, question_id, choice_id):
+    """
+    Record the answer to the question the adaptive session is waiting on,
+    update the ability estimate and pick the next question. Returns the
+    updated AdaptiveState, or raises NotFound, SessionClosed or
+    ValidationError. Costs four queries once the specialization's index
+    is built: the locked read, the answer, the next question and the state.
+    """
+    with transaction.atomic():
+        state = AdaptiveState.objects.select_for_update().select_related('session').filter(
+            session_id=session_id, session__student_id=student.id,
+        ).first()
+        if state is None:
+            raise NotFound('No such adaptive exam session.')
+        if state.session.status != 'in_progress':
+            raise SessionClosed()
+        if state.current_question_id is None:
+            raise ValidationError({'question_id': ['This exam has no questions left; submit it.']})
+        if question_id != state.current_question_id:
+            raise ValidationError({'question_id': [f'Answer question {state.current_question_id} first.']})
+        index = difficulty_index(state.session.specialization_id)
+        choices = index.choices.get(question_id)
+        if choices is None:
+            # Moved or deleted since it was asked.
+            choices = dict(Choice.objects.filter(question_id=question_id).values_list('id', 'is_correct'))
+        if choice_id not in choices:
+            raise ValidationError({
+                'selected_choice_id': [f'Choice {choice_id} does not belong to question {question_id}.'],
+            })
+
+        upsert_answers([(state.session_id, question_id, choice_id)])
+        state.ability, state.precision = update_ability(
+            state.ability, state.precision, state.current_difficulty, choices[choice_id],
+        )
+        state.answered += 1
+        _advance(state, set(state.asked), index)
+        state.save()
+    return state
+
+
+def _fit_rasch(person, item, correct, iterations, tolerance):
+    """
+    Regularised joint maximum likelihood: alternate one Newton step for every
+    ability and every difficulty, each under a N(0, 1) prior so perfect and
+    zero scores stay finite, until no difficulty moves by `tolerance`.
+    Returns the difficulties, indexed like `item`.
+    """
+    people, items = person.max() + 1, item.max() + 1
+    ability, difficulty = np.zeros(people), np.zeros(items)
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(difficulty[item] - ability[person]))
+        residual, information = correct - p, p * (1.0 - p)
+        ability += np.clip(
+            (np.bincount(person, residual, people) - ability) / (np.bincount(person, information, people) + 1.0),
+            -1.0, 1.0,
+        )
+        p = 1.0 / (1.0 + np.exp(difficulty[item] - ability[person]))
+        residual, information = correct - p, p * (1.0 - p)
+        step = np.clip(
+            (-np.bincount(item, residual, items) - difficulty) / (np.bincount(item, information, items) + 1.0),
+            -1.0, 1.0,
+        )
+        difficulty += step
+        if np.abs(step).max() < tolerance:
+            break
+    return difficulty
+
+
+def calibrate_items(iterations=100, tolerance=1e-4):
+    """
+    Fit a Rasch difficulty for every question answered in a completed
+    session, from all stored answers at once, and save them as
+    ItemCalibration rows. Skipped questions carry no evidence and are left
+    out. Needs NumPy; meant to run offline, not per request. Returns the
+    number of questions calibrated.
+    """
+    if np is None:
+        raise RuntimeError('Item calibration requires the "numpy" package.')
+    rows = StudentAnswer.objects.filter(
+        exam_session__status='completed', selected_choice__isnull=False,
+    ).values_list('exam_session_id', 'question_id', 'selected_choice__is_correct')
+    data = np.array(list(rows.iterator(chunk_size=5000)), dtype=np.int64).reshape(-1, 3)
+    if not len(data):
+        return 0
+    _, person = np.unique(data[:, 0], return_inverse=True)
+    question_ids, item = np.unique(data[:, 1], return_inverse=True)
+    difficulty = _fit_rasch(person, item, data[:, 2].astype(float), iterations, tolerance)
+    responses = np.bincount(item, minlength=len(question_ids))
+
+    now = timezone.now()
+    with transaction.atomic():
+        ItemCalibration.objects.bulk_create(
+            [
+                ItemCalibration(question_id=int(pk), difficulty=float(b), responses=int(n), calibrated_at=now)
+                for pk, b, n in zip(question_ids, difficulty, responses)
+            ],
+            update_conflicts=True, unique_fields=['question'],
+            update_fields=['difficulty', 'responses', 'calibrated_at'], batch_size=1000,
+        )
+        transaction.on_commit(invalidate_difficulty_indexes)
+    return len(question_ids)
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import json
+import re
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class AIUpstreamError(Exception):
+    """The upstream model call failed."""
+
+
+class GeminiBackend:
+    """
+    Calls the Gemini generateContent REST endpoint. The blocking HTTP call
+    runs in the backend's own thread pool, sized to the proxy's concurrency
+    limit, so the event loop stays free while it waits and slow upstream
+    calls never queue behind other work on the loop's default executor.
+    """
+    endpoint = 'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent'
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or getattr(settings, 'AI_REQUEST_TIMEOUT', 60)
+        self.executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'AI_MAX_CONCURRENT_REQUESTS', 8), thread_name_prefix='gemini',
+        )
+
+    async def generate(self, prompt, *, model, api_key, temperature):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._post, prompt, model, api_key, temperature)
+
+    def _post(self, prompt, model, api_key, temperature):
+        body = json.dumps({
+            'contents': [{'parts': [{'text': prompt}]}],
+            'generationConfig': {'responseMimeType': 'application/json', 'temperature': temperature},
+        }).encode()
+        url = self.endpoint.format(model=urllib.parse.quote(model, safe=''))
+        request = urllib.request.Request(
+            url, data=body, headers={'Content-Type': 'application/json', 'x-goog-api-key': api_key},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.load(response)
+        except urllib.error.HTTPError as exc:
+            detail = exc.read().decode(errors='replace')[:500]
+            raise AIUpstreamError(f'Gemini returned HTTP {exc.code}: {detail}')
+        except (urllib.error.URLError, TimeoutError, ValueError) as exc:
+            raise AIUpstreamError(f'Gemini request failed: {exc}')
+        try:
+            return ''.join(part.get('text', '') for part in payload['candidates'][0]['content']['parts'])
+        except (KeyError, IndexError, TypeError):
+            raise AIUpstreamError('Gemini response has no candidates.')
+
+
+class StubBackend:
+    """
+    Offline stand-in for tests and load runs. Returns deterministic questions
+    derived from the prompt after an optional simulated latency
+    (settings.AI_STUB_DELAY seconds). The number of questions is read from the
+    first "<n> أسئلة" in the prompt. `active` and `peak` count calls in
+    flight, for load tests.
+    """
+
+    def __init__(self, delay=None):
+        self.delay = getattr(settings, 'AI_STUB_DELAY', 0) if delay is None else delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def generate(self, prompt, *, model, api_key, temperature):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        match = re.search(r'(\d+) أسئلة', prompt)
+        count = int(match.group(1)) if match else 1
+        digests = [hashlib.sha256(f'{prompt}\0{index}'.encode()).hexdigest() for index in range(count)]
+        return json.dumps([
+            {
+                'text': f'سؤال تجريبي {digest[:16]}',
+                'choices': [
+                    {'text': f'اختيار {digest[16 + choice * 8:24 + choice * 8]}', 'is_correct': choice == 0}
+                    for choice in range(4)
+                ],
+                'course_year': 1,
+                'mark': 5,
+            }
+            for digest in digests
+        ], ensure_ascii=False)
@@ -0,0 +1,57 @@
+from asgiref.sync import async_to_sync
+from django.core.files.storage import default_storage
+
+from ..jobs import JobError, job_handler
+from .pdf import PDFExtractionError, extract_chunks
+from .prompts import build_examples_prompt
+from .proxy import AIConfigurationError
+from .views import generate_from_chunks, generate_questions, save_generated_questions
+
+
+def _generate(generate, *args):
+    # Upstream and parse errors propagate and are retried; a missing key is not.
+    try:
+        return async_to_sync(generate)(*args)
+    except AIConfigurationError as exc:
+        raise JobError(str(exc)) from exc
+
+
+def _result(questions, payload):
+    if payload['save']:
+        saved, skipped = save_generated_questions(questions, payload['specialization_name'])
+        if saved is not None:
+            return {'saved': True, 'duplicates_skipped': skipped, 'questions': saved}
+    return {'saved': False, 'duplicates_skipped': 0, 'questions': questions}
+
+
+@job_handler('ai.generate_from_examples')
+def generate_from_examples(job):
+    payload = job.payload
+    prompt = build_examples_prompt(
+        payload['example_questions'], payload['specialization_name'], payload['num_questions'],
+    )
+    job.progress(0, 2, 'Generating questions')
+    questions = _generate(generate_questions, prompt, 0.7)
+    job.progress(1, 2, 'Saving questions')
+    return _result(questions, payload)
+
+
+def delete_upload(payload):
+    default_storage.delete(payload['file'])
+
+
+@job_handler('ai.generate_from_pdf', cleanup=delete_upload)
+def generate_from_pdf(job):
+    payload = job.payload
+    job.progress(0, 3, 'Extracting text')
+    try:
+        with default_storage.open(payload['file']) as upload:
+            chunks = extract_chunks(upload)
+    except PDFExtractionError as exc:
+        raise JobError(str(exc)) from exc
+    if not chunks:
+        raise JobError('No text could be extracted from the PDF.')
+    job.progress(1, 3, f'Generating questions from {len(chunks)} sections')
+    questions = _generate(generate_from_chunks, chunks, payload['specialization_name'], payload['num_questions'])
+    job.progress(2, 3, 'Saving questions')
+    return _result(questions, payload)
@@ -0,0 +1,203 @@
+import atexit
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - optional dependency
+    PdfReader = None
+
+HASH_BLOCK_SIZE = 1024 * 1024
+CHARS_PER_TOKEN = 4
+_WHITESPACE = re.compile(r'[ \t\r\f\v]+')
+
+
+class PDFExtractionError(Exception):
+    """The upload could not be read as a PDF."""
+
+
+def content_hash(stream):
+    """SHA-256 of a file object, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+@contextmanager
+def upload_path(upload):
+    """
+    A filesystem path for an uploaded file. Large uploads already live in a
+    temporary file; small in-memory ones are spooled to disk so worker
+    processes can open them.
+    """
+    if hasattr(upload, 'temporary_file_path'):
+        yield upload.temporary_file_path()
+        return
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as handle:
+        upload.seek(0)
+        shutil.copyfileobj(upload, handle)
+    try:
+        yield handle.name
+    finally:
+        os.unlink(handle.name)
+
+
+def _reader(path):
+    if PdfReader is None:
+        raise PDFExtractionError('PDF support requires the "pypdf" package.')
+    try:
+        return PdfReader(path)
+    except Exception as exc:
+        raise PDFExtractionError(f'Could not read PDF: {exc}')
+
+
+def _page_text(reader, index):
+    try:
+        text = reader.pages[index].extract_text()
+    except Exception as exc:
+        raise PDFExtractionError(f'Could not read page {index + 1} of the PDF: {exc}')
+    return _WHITESPACE.sub(' ', text or '').strip()
+
+
+def page_count(path):
+    try:
+        return len(_reader(path).pages)
+    except PDFExtractionError:
+        raise
+    except Exception as exc:
+        raise PDFExtractionError(f'Could not read PDF: {exc}')
+
+
+def _extract_range(path, start, stop):
+    reader = _reader(path)
+    return [_page_text(reader, index) for index in range(start, stop)]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process pool for page extraction, started on first use and shared by all requests."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max(settings.AI_PDF_WORKERS, 1))
+        return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def shutdown_executor():
+    executor = _executor
+    if executor is not None:
+        _discard_executor(executor)
+
+
+@receiver(setting_changed)
+def reset_executor(setting, **kwargs):
+    if setting == 'AI_PDF_WORKERS':
+        shutdown_executor()
+
+
+def iter_page_texts(path, workers=None, batch_size=None):
+    """
+    Yield the text of each page in order, one page at a time. Documents
+    longer than AI_PDF_PARALLEL_PAGES are split into page batches extracted in
+    the shared process pool; at most 2 * workers batches are in flight at
+    once. Closing the generator early cancels the outstanding batches. Raises
+    PDFExtractionError for an unreadable document or page.
+    """
+    total = page_count(path)
+    workers = workers or settings.AI_PDF_WORKERS
+    batch_size = batch_size or settings.AI_PDF_BATCH_PAGES
+    if total <= settings.AI_PDF_PARALLEL_PAGES or workers <= 1:
+        reader = _reader(path)
+        for index in range(total):
+            yield _page_text(reader, index)
+        return
+
+    ranges = [(start, min(start + batch_size, total)) for start in range(0, total, batch_size)]
+    executor = get_executor()
+    pending = []
+    try:
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < workers * 2:
+                start, stop = ranges[next_range]
+                pending.append(executor.submit(_extract_range, path, start, stop))
+                next_range += 1
+            yield from pending.pop(0).result()
+    except BrokenProcessPool as exc:
+        # A worker died, e.g. killed for memory; the next document gets a new pool.
+        _discard_executor(executor)
+        raise PDFExtractionError(f'PDF extraction failed: {exc}')
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def chunk_pages(pages, token_budget, max_chunks):
+    """
+    Pack page texts into at most max_chunks chunks of roughly token_budget
+    tokens each, splitting oversized pages. Stops consuming pages as soon as
+    the chunks are full, so the rest of the document is never extracted.
+    """
+    limit = token_budget * CHARS_PER_TOKEN
+    chunks, current = [], ''
+    for text in pages:
+        while text:
+            separator = '\n' if current else ''
+            room = limit - len(current) - len(separator)
+            piece, text = text[:room], text[room:]
+            current = f'{current}{separator}{piece}'
+            if len(current) >= limit:
+                chunks.append(current)
+                current = ''
+                if len(chunks) == max_chunks:
+                    return chunks
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def extract_chunks(upload, token_budget=None, max_chunks=None):
+    """
+    Prompt-sized text chunks for an uploaded PDF, cached by content hash so a
+    re-uploaded document skips extraction entirely.
+    """
+    token_budget = token_budget or settings.AI_PDF_TOKEN_BUDGET
+    max_chunks = max_chunks or settings.AI_PDF_MAX_CHUNKS
+    key = f'pdf-chunks:{content_hash(upload)}:{token_budget}:{max_chunks}'
+    chunks = cache.get(key)
+    if chunks is None:
+        with upload_path(upload) as path:
+            pages = iter_page_texts(path)
+            try:
+                chunks = chunk_pages(pages, token_budget, max_chunks)
+            finally:
+                pages.close()
+        cache.set(key, chunks, settings.AI_PDF_CACHE_TIMEOUT)
+    return chunks
@@ -0,0 +1,107 @@
+import json
+import re
+
+from django.utils import timezone
+
+
+class AIResponseError(ValueError):
+    """The model answered, but not with a usable list of questions."""
+
+
+OUTPUT_FORMAT = """قم بإرجاع إجابتك **فقط** كمصفوفة JSON صالحة. يجب أن تحتوي كل كائن في المصفوفة على الهيكل التالي بالضبط:
+```json
+{{
+  "text": "نص السؤال هنا",
+  "choices": [
+    {{ "text": "نص الاختيار الأول", "is_correct": boolean }},
+    {{ "text": "نص الاختيار الثاني", "is_correct": boolean }}
+    // ... يمكن أن يكون هناك المزيد من الاختيارات، عادة 3 أو 4
+  ],
+  "course_year": {course_year},
+  "mark": 5
+}}
+```
+تأكد من أن اختيارًا واحدًا فقط لكل سؤال لديه `"is_correct"` بقيمة `true`."""
+
+_FENCE = re.compile(r'^```(?:json)?\s*\n?(.*?)\n?\s*```$', re.DOTALL)
+
+
+def _next_course_year():
+    return timezone.now().year + 1
+
+
+def _format_example(question):
+    return json.dumps({
+        'text': question['text'],
+        'choices': [{'text': c['text'], 'is_correct': c['is_correct']} for c in question.get('choices', [])],
+        'course_year': question.get('course_year'),
+        'mark': question.get('mark'),
+    }, ensure_ascii=False, indent=2)
+
+
+def build_examples_prompt(example_questions, specialization_name, num_questions):
+    examples = '\n\n'.join(
+        f'مثال {index}:\n```json\n{_format_example(question)}\n```'
+        for index, question in enumerate(example_questions, start=1)
+    )
+    output_format = OUTPUT_FORMAT.format(course_year=_next_course_year())
+    return (
+        f"أنت خبير في إنشاء أسئلة امتحانات هندسة الحاسوب. قم بإنشاء {num_questions} أسئلة اختيار من متعدد (MCQ) جديدة لتخصص '{specialization_name}'.\n"
+        f"يجب أن تكون الأسئلة باللغة العربية. يجب أن تتبع الأسئلة الجديدة نفس أسلوب وصعوبة الأمثلة التالية، مع الالتزام الصارم بتنسيق JSON المحدد للإخراج.\n\n"
+        f"أمثلة على الأسئلة (لا تقم بتكرار هذه الأسئلة بالضبط، استخدمها كمرجع للأسلوب والمحتوى):\n"
+        f"{examples}\n\n"
+        f"التعليمات الخاصة بالإخراج:\n"
+        f"{output_format} لا تقم بتضمين أي نص أو تفسيرات إضافية خارج مصفوفة JSON."
+    )
+
+
+def build_pdf_prompt(pdf_text, specialization_name, num_questions):
+    output_format = OUTPUT_FORMAT.format(course_year=_next_course_year())
+    return (
+        f"أنت خبير في إنشاء أسئلة امتحانات هندسة الحاسوب. قم بإنشاء {num_questions} أسئلة اختيار من متعدد (MCQ) جديدة لتخصص '{specialization_name}' **بناءً على المحتوى التالي المستخرج من ملف PDF**:\n\n"
+        f"--- بداية محتوى PDF ---\n"
+        f"{pdf_text}\n"
+        f"--- نهاية محتوى PDF ---\n\n"
+        f"التعليمات الخاصة بالإخراج:\n"
+        f"يجب أن تكون الأسئلة باللغة العربية.\n"
+        f"{output_format}\n"
+        f"يجب أن تكون الأسئلة **مرتبطة بشكل مباشر بالمحتوى المقدم من ملف PDF**. لا تقم بتضمين أي نص أو تفسيرات إضافية خارج مصفوفة JSON."
+    )
+
+
+def parse_generated_questions(text):
+    """
+    Parse the model output into GeneratedQuestionPayload dicts, stripping a
+    code fence if present and forcing exactly one correct choice per question.
+    """
+    text = text.strip()
+    match = _FENCE.match(text)
+    if match:
+        text = match.group(1).strip()
+    try:
+        questions = json.loads(text)
+    except ValueError as exc:
+        raise AIResponseError(f'AI response is not valid JSON: {exc}')
+    if not isinstance(questions, list):
+        raise AIResponseError('AI response is not an array.')
+
+    parsed = []
+    for question in questions:
+        if not isinstance(question, dict) or not question.get('text') or not isinstance(question.get('choices'), list):
+            raise AIResponseError('AI response contains malformed question data.')
+        choices = [
+            {'text': str(choice.get('text', '')), 'is_correct': choice.get('is_correct') is True}
+            for choice in question['choices'] if isinstance(choice, dict)
+        ]
+        if len(choices) < 2:
+            raise AIResponseError('AI response contains a question with fewer than two choices.')
+        if sum(choice['is_correct'] for choice in choices) != 1:
+            for index, choice in enumerate(choices):
+                choice['is_correct'] = index == 0
+        try:
+            course_year = int(question.get('course_year') or _next_course_year())
+            mark = int(question.get('mark') or 5)
+        except (TypeError, ValueError) as exc:
+            raise AIResponseError(f'AI response contains a non-numeric course year or mark: {exc}')
+        parsed.append({'text': str(question['text']), 'choices': choices, 'course_year': course_year, 'mark': mark})
+    return parsed
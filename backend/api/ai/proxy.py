@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import os
+import time
+import weakref
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from ..models import AISettings
+
+
+class AIConfigurationError(Exception):
+    """No API key is configured for the AI backend."""
+
+
+@dataclass(frozen=True)
+class AIConfig:
+    api_key: str
+    model: str
+
+
+_config = None
+_config_expires_at = 0.0
+
+
+async def get_ai_config():
+    """
+    The AISettings row, read once and kept in process memory for
+    AI_SETTINGS_CACHE_TTL seconds. Saving AISettings clears it immediately.
+    """
+    global _config, _config_expires_at
+    if _config is None or time.monotonic() >= _config_expires_at:
+        row = await AISettings.objects.order_by('id').afirst()
+        if row is not None:
+            config = AIConfig(api_key=row.gemini_api_key, model=row.selected_model_name or settings.AI_DEFAULT_MODEL)
+        else:
+            config = AIConfig(api_key=os.environ.get('GEMINI_API_KEY', ''), model=settings.AI_DEFAULT_MODEL)
+        _config, _config_expires_at = config, time.monotonic() + settings.AI_SETTINGS_CACHE_TTL
+    return _config
+
+
+def clear_ai_config():
+    global _config
+    _config = None
+
+
+def response_cache_key(model, prompt):
+    digest = hashlib.sha256(f'{model}\0{prompt}'.encode()).hexdigest()
+    return f'ai-response:{digest}'
+
+
+class _LoopState:
+    def __init__(self, max_concurrency):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.inflight = {}
+
+
+class AIProxy:
+    """
+    Front for the upstream model. Responses are cached by (model, prompt);
+    identical prompts already in flight share one upstream call; and at most
+    max_concurrency upstream calls are outstanding per event loop.
+    """
+
+    def __init__(self, backend, max_concurrency, cache_timeout):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.cache_timeout = cache_timeout
+        self._states = weakref.WeakKeyDictionary()
+
+    def _state(self):
+        # Semaphores and futures belong to one event loop; under WSGI each
+        # request may run on its own loop.
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState(self.max_concurrency)
+        return state
+
+    async def generate(self, config, prompt, *, temperature):
+        if not config.api_key:
+            raise AIConfigurationError('No Gemini API key is configured.')
+        key = response_cache_key(config.model, prompt)
+        cached = await cache.aget(key)
+        if cached is not None:
+            return cached
+
+        state = self._state()
+        task = state.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(state, config, prompt, temperature, key))
+            state.inflight[key] = task
+            task.add_done_callback(lambda _: state.inflight.pop(key, None))
+        # Shielded so one cancelled client does not cancel the call for the others.
+        return await asyncio.shield(task)
+
+    async def _call(self, state, config, prompt, temperature, key):
+        async with state.semaphore:
+            text = await self.backend.generate(
+                prompt, model=config.model, api_key=config.api_key, temperature=temperature,
+            )
+        await cache.aset(key, text, self.cache_timeout)
+        return text
+
+
+_proxy = None
+
+
+def get_proxy():
+    global _proxy
+    if _proxy is None:
+        _proxy = AIProxy(
+            backend=import_string(settings.AI_BACKEND)(),
+            max_concurrency=settings.AI_MAX_CONCURRENT_REQUESTS,
+            cache_timeout=settings.AI_RESPONSE_CACHE_TIMEOUT,
+        )
+    return _proxy
+
+
+@receiver(setting_changed)
+def reset_proxy(setting, **kwargs):
+    global _proxy
+    if setting.startswith('AI_'):
+        _proxy = None
+        clear_ai_config()
@@ -0,0 +1,232 @@
+import asyncio
+import json
+
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from ..authentication import JWTAuthentication
+from ..dedup import filter_duplicates
+from ..jobs import enqueue
+from ..models import Specialization, Question, Choice
+from ..querysets import question_read_queryset
+from ..serializers import JobSerializer, QuestionSerializer
+from ..transfer import insert_questions
+from .backends import AIUpstreamError
+from .pdf import PDFExtractionError, extract_chunks
+from .prompts import AIResponseError, build_examples_prompt, build_pdf_prompt, parse_generated_questions
+from .proxy import AIConfigurationError, get_ai_config, get_proxy
+
+
+class ExampleChoiceSerializer(serializers.Serializer):
+    text = serializers.CharField()
+    is_correct = serializers.BooleanField(default=False)
+
+
+class ExampleQuestionSerializer(serializers.Serializer):
+    text = serializers.CharField()
+    choices = ExampleChoiceSerializer(many=True)
+    course_year = serializers.IntegerField(required=False)
+    mark = serializers.IntegerField(required=False)
+
+
+class GenerateFromExamplesSerializer(serializers.Serializer):
+    example_questions = ExampleQuestionSerializer(many=True, max_length=20)
+    specialization_name = serializers.CharField(max_length=100)
+    num_questions = serializers.IntegerField(min_value=1, max_value=50)
+    save = serializers.BooleanField(default=True)
+    background = serializers.BooleanField(default=False)
+
+
+class GenerateFromPDFSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    specialization_name = serializers.CharField(max_length=100)
+    num_questions = serializers.IntegerField(min_value=1, max_value=50)
+    save = serializers.BooleanField(default=True)
+    background = serializers.BooleanField(default=False)
+
+    def validate_file(self, upload):
+        if not upload.name.lower().endswith('.pdf'):
+            raise serializers.ValidationError('Only PDF files are supported.')
+        return upload
+
+
+async def authenticate(request):
+    """JWT authentication for plain async views; returns the user or None."""
+    try:
+        result = await JWTAuthentication().aauthenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
+
+def error_response(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+async def generate_questions(prompt, temperature):
+    """Run a prompt through the shared proxy and parse the questions."""
+    config = await get_ai_config()
+    text = await get_proxy().generate(config, prompt, temperature=temperature)
+    return parse_generated_questions(text)
+
+
+async def generate_from_chunks(chunks, specialization_name, num_questions):
+    """Spread the requested questions across the chunks and generate them in parallel."""
+    chunks = chunks[:num_questions]
+    results = await asyncio.gather(*[
+        generate_questions(build_pdf_prompt(chunk, specialization_name, count), temperature=0.6)
+        for chunk, count in zip(chunks, split_evenly(num_questions, len(chunks)))
+    ])
+    return [question for generated in results for question in generated]
+
+
+async def generate_with_proxy(generate, *args, **kwargs):
+    """Await a generation coroutine function, mapping failures to error responses."""
+    try:
+        return await generate(*args, **kwargs), None
+    except AIConfigurationError as exc:
+        return None, error_response(str(exc), 503)
+    except (AIUpstreamError, AIResponseError) as exc:
+        return None, error_response(str(exc), 502)
+
+
+def queue_generation(kind, payload, user):
+    """Queue a generation job; questions are saved only for admins who asked for it."""
+    job = enqueue(kind, {**payload, 'save': user.role == 'admin' and payload['save']}, user=user)
+    return JobSerializer(job).data
+
+
+def job_accepted(job):
+    response = JsonResponse(job, status=202)
+    response['Location'] = job['url']
+    return response
+
+
+def save_generated_questions(questions, specialization_name):
+    """
+    Save generated questions that are not near-duplicates of the bank or of
+    each other. Returns (serialized saved questions, number skipped), or
+    (None, 0) for an unknown specialization.
+    """
+    specialization = Specialization.objects.filter(name=specialization_name).first()
+    if specialization is None:
+        return None, 0
+    questions, duplicates = filter_duplicates(questions, specialization.pk)
+    saved = insert_questions([
+        (
+            Question(
+                text=question['text'], specialization=specialization, course_year=question['course_year'],
+                mark=question['mark'], is_ai_generated=True,
+            ),
+            [Choice(text=choice['text'], is_correct=choice['is_correct']) for choice in question['choices']],
+            [],
+        )
+        for question in questions
+    ])
+    questions = question_read_queryset().filter(id__in=[q.pk for q in saved]).order_by('id')
+    return QuestionSerializer(questions, many=True).data, len(duplicates)
+
+
+@csrf_exempt
+@require_POST
+async def generate_questions_from_examples(request):
+    """
+    Generate questions in the style of the given examples. Admin requests
+    are saved to the bank with is_ai_generated=True and returned with ids;
+    near-duplicates of existing questions are dropped. With background=true
+    the work is queued instead and the answer is 202 with the job to poll.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return error_response('Authentication credentials were not provided.', 401)
+    try:
+        payload = GenerateFromExamplesSerializer(data=json.loads(request.body or b'{}'))
+    except ValueError:
+        return error_response('Request body is not valid JSON.', 400)
+    if not payload.is_valid():
+        return JsonResponse(payload.errors, status=400)
+    data = payload.validated_data
+
+    if data.pop('background'):
+        return job_accepted(await sync_to_async(queue_generation)('ai.generate_from_examples', data, user))
+
+    prompt = build_examples_prompt(data['example_questions'], data['specialization_name'], data['num_questions'])
+    questions, error = await generate_with_proxy(generate_questions, prompt, temperature=0.7)
+    if error is not None:
+        return error
+    if user.role == 'admin' and data['save']:
+        saved, skipped = await sync_to_async(save_generated_questions)(questions, data['specialization_name'])
+        if saved is not None:
+            response = JsonResponse(saved, safe=False, status=201)
+            response['X-Duplicates-Skipped'] = str(skipped)
+            return response
+    return JsonResponse(questions, safe=False)
+
+
+def read_form(request):
+    """Parse a multipart body; uploads beyond FILE_UPLOAD_MAX_MEMORY_SIZE are streamed to disk."""
+    data = request.POST.dict()
+    data.update(request.FILES.dict())
+    return data
+
+
+def split_evenly(total, parts):
+    base, extra = divmod(total, parts)
+    return [base + (1 if index < extra else 0) for index in range(parts)]
+
+
+def queue_pdf_generation(data, user):
+    """Keep the upload in storage for the worker (see api.ai.jobs) and queue the job."""
+    upload = data.pop('file')
+    path = default_storage.save(f'jobs/{uuid4().hex}.pdf', upload)
+    return queue_generation('ai.generate_from_pdf', {**data, 'file': path}, user)
+
+
+@csrf_exempt
+@require_POST
+async def generate_questions_from_pdf(request):
+    """
+    Generate questions from an uploaded PDF. Text is extracted page by page
+    (cached by content hash), packed into prompt-sized chunks, and the
+    requested questions are spread across the chunks. Admin requests are
+    saved to the bank. With background=true the upload is kept and the work
+    queued, as for generate_questions_from_examples.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return error_response('Authentication credentials were not provided.', 401)
+    payload = GenerateFromPDFSerializer(data=await sync_to_async(read_form)(request))
+    if not payload.is_valid():
+        return JsonResponse(payload.errors, status=400)
+    data = payload.validated_data
+
+    if data.pop('background'):
+        return job_accepted(await sync_to_async(queue_pdf_generation)(data, user))
+
+    try:
+        chunks = await sync_to_async(extract_chunks, thread_sensitive=False)(data['file'])
+    except PDFExtractionError as exc:
+        return error_response(str(exc), 400)
+    if not chunks:
+        return error_response('No text could be extracted from the PDF.', 400)
+
+    questions, error = await generate_with_proxy(
+        generate_from_chunks, chunks, data['specialization_name'], data['num_questions'],
+    )
+    if error is not None:
+        return error
+    if user.role == 'admin' and data['save']:
+        saved, skipped = await sync_to_async(save_generated_questions)(questions, data['specialization_name'])
+        if saved is not None:
+            response = JsonResponse(saved, safe=False, status=201)
+            response['X-Duplicates-Skipped'] = str(skipped)
+            return response
+    return JsonResponse(questions, safe=False)
@@ -3,4 +3,10 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'api'
\ No newline at end of file
+    name = 'api'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        # Modules that register background job kinds (api.jobs.job_handler).
+        from . import autosave, submission  # noqa: F401
+        from .ai import jobs  # noqa: F401
@@ -0,0 +1,113 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import authentication, models
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .metrics import timed
+from .models import User
+
+ROLE_CLAIM = 'role'
+USERNAME_CLAIM = 'username'
+
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def get_cached_user(user_id):
+    """
+    The User with this id, kept in the cache for AUTH_USER_CACHE_TTL seconds,
+    or None if there is none. Saving or deleting the user drops the entry.
+    """
+    key = _user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+    return user
+
+
+def forget_user(user_id):
+    cache.delete(_user_key(user_id))
+
+
+def add_user_claims(token, user):
+    """Stamp the claims permission checks need, so they can run without loading the user."""
+    token[ROLE_CLAIM] = user.role
+    token[USERNAME_CLAIM] = user.username
+    return token
+
+
+class TokenUser(models.TokenUser):
+    """
+    Stateless user backed by the access token's claims: id, username and role
+    (read through TokenUser.__getattr__). Use get_user() where the full row is
+    needed.
+    """
+
+    @cached_property
+    def id(self):
+        # The claim is a string; as an int it compares and serializes like User.id.
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    def get_user(self):
+        return get_cached_user(self.id)
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    simplejwt authentication with its cost (token decode and user lookup)
+    recorded in the request metrics. Tokens carrying a role claim become a
+    TokenUser without touching the database, so a deactivated user keeps
+    access until the token expires. Tokens issued without the claim fall
+    back to the cached User row.
+    """
+
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views. Role-claim tokens are resolved on the
+        event loop; only the fallback user lookup runs in a thread.
+        """
+        with timed('auth'):
+            header = self.get_header(request)
+            if header is None:
+                return None
+            raw_token = self.get_raw_token(header)
+            if raw_token is None:
+                return None
+            validated_token = self.get_validated_token(raw_token)
+            if self.is_stateless(validated_token):
+                return api_settings.TOKEN_USER_CLASS(validated_token), validated_token
+            return await sync_to_async(self.get_user)(validated_token), validated_token
+
+    def is_stateless(self, validated_token):
+        return settings.JWT_STATELESS_AUTH and ROLE_CLAIM in validated_token
+
+    def get_user(self, validated_token):
+        if self.is_stateless(validated_token):
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as exc:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from exc
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
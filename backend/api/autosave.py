@@ -0,0 +1,237 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+from .jobs import enqueue, job_handler
+from .models import Choice, ExamSession, StudentAnswer
+
+FLUSH_SCHEDULED_KEY = 'exam-autosave:flush-scheduled'
+# Cache backends whose contents other processes cannot see.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class SessionClosed(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This exam session was already submitted.'
+    default_code = 'session_closed'
+
+
+def _session_key(session_id):
+    return f'exam-autosave:session:{session_id}'
+
+
+def _revision_key(session_id):
+    return f'exam-autosave:revision:{session_id}'
+
+
+def _answer_key(session_id, question_id):
+    return f'exam-autosave:answer:{session_id}:{question_id}'
+
+
+def session_questions(session_ids):
+    """{session_id: [question ids]} for the given sessions, in one query."""
+    questions = {pk: [] for pk in session_ids}
+    Through = ExamSession.questions.through
+    for session_id, question_id in Through.objects.filter(examsession_id__in=session_ids).order_by(
+        'question_id'
+    ).values_list('examsession_id', 'question_id'):
+        questions[session_id].append(question_id)
+    return questions
+
+
+def remember_session(session_id, student_id, choices):
+    """Cache what autosave checks requests against: the owner and {question_id: choice ids}."""
+    cache.set(_session_key(session_id), (student_id, choices), settings.AUTOSAVE_BUFFER_TIMEOUT)
+
+
+def forget_session(session_id, question_ids):
+    cache.delete_many(
+        [_session_key(session_id), _revision_key(session_id)]
+        + [_answer_key(session_id, pk) for pk in question_ids]
+    )
+
+
+def open_session(session_id, student_id, adaptive=False):
+    """
+    {question_id: choice ids} of the student's in-progress session, from the
+    cache after the first call, so autosaving costs no query. Raises NotFound
+    or SessionClosed, and ValidationError for an adaptive session unless
+    `adaptive`: those are answered one question at a time (api/adaptive.py),
+    and their questions are never cached since each answer adds one.
+    """
+    cached = cache.get(_session_key(session_id))
+    if cached is not None and cached[0] == student_id:
+        return cached[1]
+    row = ExamSession.objects.filter(pk=session_id, student_id=student_id).values_list('status', 'adaptive').first()
+    if row is None:
+        raise NotFound('No such exam session.')
+    state, adaptive_state = row
+    if state != 'in_progress':
+        raise SessionClosed()
+    if adaptive_state is not None and not adaptive:
+        raise ValidationError({'answers': ['Adaptive sessions are answered one question at a time.']})
+    question_ids = session_questions([session_id])[session_id]
+    choices = {pk: set() for pk in question_ids}
+    for question_id, choice_id in Choice.objects.filter(question_id__in=question_ids).values_list('question_id', 'id'):
+        choices[question_id].add(choice_id)
+    if adaptive_state is None:
+        remember_session(session_id, student_id, choices)
+    return choices
+
+
+def check_answers(choices, answers):
+    """Raise ValidationError unless every answer is to one of the questions, with one of its choices."""
+    errors = []
+    for answer in answers:
+        question_id, choice_id = answer['question_id'], answer['selected_choice_id']
+        if question_id not in choices:
+            errors.append(f'Question {question_id} is not part of this exam.')
+        elif choice_id is not None and choice_id not in choices[question_id]:
+            errors.append(f'Choice {choice_id} does not belong to question {question_id}.')
+    if errors:
+        raise ValidationError({'answers': errors})
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+def buffering_enabled():
+    """
+    Whether autosaves wait in the cache. Buffered answers must be visible to
+    the flush worker and to whichever web process takes the submission, so
+    by default (AUTOSAVE_BUFFERED = None) they are only buffered in a cache
+    shared between processes.
+    """
+    buffered = settings.AUTOSAVE_BUFFERED
+    return cache_is_shared() if buffered is None else buffered
+
+
+def save_answers(session_id, answers):
+    """Record autosaved answer changes: in the buffer when enabled, otherwise straight to StudentAnswer."""
+    if buffering_enabled():
+        buffer_answers(session_id, answers)
+    else:
+        write_answers(session_id, answers)
+
+
+def write_answers(session_id, answers):
+    """Upsert answer changes of an in-progress session, under its lock so a concurrent submission wins."""
+    if not answers:
+        return
+    with transaction.atomic():
+        if not ExamSession.objects.select_for_update().filter(pk=session_id, status='in_progress').exists():
+            raise SessionClosed()
+        upsert_answers((session_id, answer['question_id'], answer['selected_choice_id']) for answer in answers)
+
+
+def buffer_answers(session_id, answers):
+    """
+    Record answer changes in the cache, one key per question so concurrent
+    saves never overwrite each other's questions, then bump the session's
+    revision so the next flush picks it up. Answers are written before the
+    revision, and flushes read the revision first, so a flush never records
+    a revision newer than the answers it wrote.
+    """
+    if not answers:
+        return
+    timeout = settings.AUTOSAVE_BUFFER_TIMEOUT
+    cache.set_many({
+        _answer_key(session_id, answer['question_id']): answer['selected_choice_id'] for answer in answers
+    }, timeout)
+    key = _revision_key(session_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Seeded from the clock, so an evicted counter never comes back at a revision already flushed.
+        cache.add(key, time.time_ns(), timeout)
+    schedule_flush()
+
+
+def schedule_flush():
+    """Queue a flush job unless one is already due within the flush interval: one INSERT per interval at most."""
+    if cache.add(FLUSH_SCHEDULED_KEY, True, settings.AUTOSAVE_FLUSH_INTERVAL):
+        enqueue('sessions.flush_answers', {}, delay=settings.AUTOSAVE_FLUSH_INTERVAL)
+
+
+def buffered_answers(session_id, question_ids):
+    """{question_id: choice id or None} of the answers waiting in the cache."""
+    keys = {_answer_key(session_id, pk): pk for pk in question_ids}
+    return {keys[key]: choice_id for key, choice_id in cache.get_many(list(keys)).items()}
+
+
+def current_answers(session_id, question_ids):
+    """The session's latest answers: those flushed to the database, overlaid by those still buffered."""
+    answers = dict(StudentAnswer.objects.filter(exam_session_id=session_id).values_list(
+        'question_id', 'selected_choice_id'
+    ))
+    answers.update(buffered_answers(session_id, question_ids))
+    return answers
+
+
+def upsert_answers(answers):
+    """Insert or update StudentAnswer rows from (session_id, question_id, choice_id) triples in bulk."""
+    StudentAnswer.objects.bulk_create(
+        [
+            StudentAnswer(exam_session_id=session_id, question_id=question_id, selected_choice_id=choice_id)
+            for session_id, question_id, choice_id in answers
+        ],
+        update_conflicts=True, unique_fields=['exam_session', 'question'], update_fields=['selected_choice'],
+    )
+
+
+def flush_answers(batch_size=None, progress=None):
+    """
+    Write the buffered answers of every in-progress session that changed
+    since its last flush to StudentAnswer. A batch of sessions costs the same
+    few queries and one cache round trip whatever its size: the sessions are
+    locked, their answers upserted in bulk and their revisions updated in a
+    single statement. `progress(done, total)` is called after each batch.
+    Returns the number of sessions flushed.
+    """
+    batch_size = batch_size or settings.AUTOSAVE_FLUSH_BATCH
+    saved = dict(ExamSession.objects.filter(status='in_progress').values_list('id', 'saved_revision'))
+    revisions = cache.get_many([_revision_key(pk) for pk in saved])
+    dirty = {}
+    for session_id, saved_revision in saved.items():
+        revision = revisions.get(_revision_key(session_id))
+        if revision is not None and revision != saved_revision:
+            dirty[session_id] = revision
+
+    dirty_ids, flushed = sorted(dirty), 0
+    for start in range(0, len(dirty_ids), batch_size):
+        chunk = dirty_ids[start:start + batch_size]
+        with transaction.atomic():
+            # Locked and re-checked, so a session submitted meanwhile keeps the answers it was graded on.
+            live = list(ExamSession.objects.select_for_update().filter(
+                id__in=chunk, status='in_progress'
+            ).values_list('id', flat=True))
+            questions = session_questions(live)
+            keys = {
+                _answer_key(session_id, question_id): (session_id, question_id)
+                for session_id in live for question_id in questions[session_id]
+            }
+            upsert_answers((*keys[key], choice_id) for key, choice_id in cache.get_many(list(keys)).items())
+            ExamSession.objects.bulk_update(
+                [ExamSession(pk=session_id, saved_revision=dirty[session_id]) for session_id in live],
+                ['saved_revision'],
+            )
+        flushed += len(live)
+        if progress is not None:
+            progress(start + len(chunk), len(dirty_ids))
+    return flushed
+
+
+@job_handler('sessions.flush_answers')
+def flush_answers_job(job):
+    def progress(done, total):
+        job.progress(done, total, f'Flushed {done} of {total} sessions')
+
+    return {'sessions': flush_answers(progress=progress)}
@@ -0,0 +1,349 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from unittest import mock
+
+import django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, resolve
+
+from .models import (
+    AISettings, User, Specialization, Question, Attachment, AdminExamDefinition, ExamSession, Blob, QuestionStatistics,
+    Job, AdaptiveState
+)
+from .serializers import RoleTokenObtainPairSerializer
+from .synthetic import make_pdf
+from .transfer import iter_export_records, iter_ndjson
+
+BENCHMARK_ADMIN = 'benchmark-admin'
+BENCHMARK_PASSWORD = 'benchmark'
+# The AI routes run against the offline stub so no upstream calls are made or timed.
+AI_STUB_SETTINGS = {'AI_BACKEND': 'api.ai.backends.StubBackend', 'AI_STUB_DELAY': 0}
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    user: object = None
+    data: object = None
+    content_type: str = None
+    headers: dict = field(default_factory=dict)
+    # Writes run inside a transaction that is rolled back, so every
+    # iteration sees the same dataset.
+    rollback: bool = False
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    # Rounding first keeps float error (0.95 * 100 = 95.00000000000001) from skipping a rank.
+    index = max(0, min(len(ordered) - 1, math.ceil(round(fraction * len(ordered), 9)) - 1))
+    return ordered[index]
+
+
+def benchmark_users():
+    """An admin with a known password, and the student who took the latest exam session."""
+    admin, _ = User.objects.get_or_create(username=BENCHMARK_ADMIN, defaults={'role': 'admin', 'is_staff': True})
+    admin.set_password(BENCHMARK_PASSWORD)
+    admin.save(update_fields=['password'])
+    session = ExamSession.objects.filter(status='completed').order_by('-id').select_related('student').first()
+    student = session.student if session else User.objects.filter(role='student').order_by('id').first()
+    return admin, student
+
+
+def build_scenarios():
+    """
+    One or more requests per route in api/urls.py plus the JWT endpoints,
+    parameterised with ids from the current database. Needs at least one
+    question, exam definition and exam session (see generate_synthetic_data).
+    """
+    admin, student = benchmark_users()
+    session = ExamSession.objects.filter(student=student, status='completed').order_by('-id').first()
+    open_session = ExamSession.objects.filter(
+        student=student, status='in_progress', adaptive__isnull=True,
+    ).order_by('-id').first()
+    adaptive = AdaptiveState.objects.filter(
+        session__student=student, session__status='in_progress', current_question__isnull=False,
+    ).select_related('current_question').order_by('-session_id').first()
+    definition = AdminExamDefinition.objects.order_by('id').first()
+    if session is None or definition is None:
+        raise ValueError('Benchmarks need at least one exam session and exam definition.')
+    question = Question.objects.filter(
+        specialization_id=session.specialization_id, is_ai_generated=False,
+    ).order_by('id').first()
+    spec = Specialization.objects.get(pk=question.specialization_id)
+    choices = list(question.choices.order_by('id').values_list('id', flat=True))
+    search_term = question.text.split()[0]
+    blob = Blob.objects.order_by('pk').first()
+    thumbnail = Blob.objects.exclude(thumbnail='').order_by('pk').first()
+    statistics = QuestionStatistics.objects.order_by('question_id').first()
+    settings_row = AISettings.objects.order_by('id').first()
+    job = Job.objects.order_by('-id').first()
+    import_body = ''.join(iter_ndjson(record for _, record in zip(range(20), iter_export_records(spec.pk))))
+    refresh = str(RoleTokenObtainPairSerializer.get_token(admin))
+
+    submission = {
+        'specialization_id': spec.pk,
+        'admin_exam_definition_id': None,
+        'exam_name': 'Benchmark',
+        'questions_in_session': [{'id': question.pk}],
+        'answers': [{'question_id': question.pk, 'selected_choice_id': choices[0]}],
+    }
+    scenarios = [
+        Scenario('token obtain', 'post', '/api/token/', data={'username': BENCHMARK_ADMIN, 'password': BENCHMARK_PASSWORD}),
+        Scenario('token refresh', 'post', '/api/token/refresh/', data={'refresh': refresh}),
+        Scenario('api root', 'get', '/api/', admin),
+        Scenario('users list', 'get', '/api/users/', admin),
+        Scenario('users detail', 'get', f'/api/users/{student.pk}/', admin),
+        Scenario('specializations list', 'get', '/api/specializations/', admin),
+        Scenario('specializations detail', 'get', f'/api/specializations/{spec.pk}/', admin),
+        Scenario('specializations results', 'get', f'/api/specializations/{spec.pk}/results/', admin),
+        Scenario('questions list', 'get', '/api/questions/', student),
+        Scenario('questions list sparse', 'get', '/api/questions/?fields=id,text', student),
+        Scenario('questions list filtered', 'get', f'/api/questions/?specialization={spec.pk}&course_year=1', student),
+        Scenario('questions search', 'get', f'/api/questions/?search={search_term}', student),
+        Scenario('questions detail', 'get', f'/api/questions/{question.pk}/', student),
+        Scenario('questions create', 'post', '/api/questions/', admin, rollback=True, data={
+            'text': 'Benchmark question', 'specialization': spec.pk, 'course_year': 1, 'mark': 1,
+            'choices': [{'text': 'yes', 'is_correct': True}, {'text': 'no', 'is_correct': False}],
+        }),
+        Scenario('questions export', 'get', f'/api/questions/export/?specialization={spec.pk}', admin),
+        Scenario('questions import', 'post', '/api/questions/import/', admin, rollback=True, content_type='multipart',
+                 data={'file': ('questions.ndjson', import_body.encode())}),
+        Scenario('questions duplicates', 'get', f'/api/questions/duplicates/?specialization={spec.pk}', admin),
+        Scenario('exam definitions list', 'get', '/api/exam-definitions/', admin),
+        Scenario('exam definitions detail', 'get', f'/api/exam-definitions/{definition.pk}/', admin),
+        Scenario('exam definitions results', 'get', f'/api/exam-definitions/{definition.pk}/results/', admin),
+        Scenario('exam definitions variants', 'get', f'/api/exam-definitions/{definition.pk}/variants/', admin),
+        Scenario('exam definitions variants build', 'post', f'/api/exam-definitions/{definition.pk}/variants/', admin,
+                 rollback=True, data={'count': 20, 'num_questions': 20}),
+        Scenario('exam sessions list (student)', 'get', '/api/exam-sessions/', student),
+        Scenario('exam sessions list (admin)', 'get', '/api/exam-sessions/', admin),
+        Scenario('exam sessions list expanded', 'get', '/api/exam-sessions/?expand=student,specialization', admin),
+        Scenario('exam sessions detail', 'get', f'/api/exam-sessions/{session.pk}/', student),
+        Scenario('exam sessions regrade', 'post', '/api/exam-sessions/regrade/', admin, rollback=True,
+                 data={'specialization': spec.pk}),
+        Scenario('exam sessions start', 'post', '/api/exam-sessions/start/', student, rollback=True, data={
+            key: submission[key] for key in ('specialization_id', 'admin_exam_definition_id', 'exam_name')
+        } | {'questions_in_session': [{'id': question.pk}]}),
+        Scenario('exam sessions adaptive', 'post', '/api/exam-sessions/adaptive/', student, rollback=True, data={
+            'specialization_id': spec.pk, 'exam_name': 'Benchmark', 'num_questions': 20,
+        }),
+        Scenario('exam sessions in progress', 'get', '/api/exam-sessions/in-progress/', student),
+        Scenario('jobs list', 'get', '/api/jobs/', admin),
+        Scenario('ai settings list', 'get', '/api/ai-settings/', admin),
+        Scenario('item statistics list', 'get', '/api/item-statistics/?ordering=correct_rate', admin),
+        Scenario('start standard exam', 'post', '/api/student/exams/start-standard/', student, data={
+            'specialization_id': spec.pk, 'course_year': question.course_year, 'num_questions': 20,
+        }),
+        Scenario('submit exam', 'post', '/api/student/exam-sessions/submit/', student, data=submission, rollback=True),
+        Scenario('question bank', 'get', f'/api/question-bank/{spec.pk}/', student),
+        Scenario('question bank revalidate', 'get', f'/api/question-bank/{spec.pk}/', student, headers={
+            'If-None-Match': '*',
+        }),
+        Scenario('change feed', 'get', '/api/sync/?since=0', student),
+        Scenario('metrics', 'get', '/api/metrics/', admin),
+        Scenario('ai generate from examples', 'post', '/api/ai/generate-questions-from-examples/', admin,
+                 rollback=True, data={
+                     'example_questions': [{'text': question.text, 'choices': [{'text': 'a', 'is_correct': True}]}],
+                     'specialization_name': spec.name, 'num_questions': 5,
+                 }),
+        Scenario('ai generate queued', 'post', '/api/ai/generate-questions-from-examples/', admin,
+                 rollback=True, data={
+                     'example_questions': [{'text': question.text, 'choices': [{'text': 'a', 'is_correct': True}]}],
+                     'specialization_name': spec.name, 'num_questions': 5, 'background': True,
+                 }),
+        Scenario('ai generate from pdf', 'post', '/api/ai/generate-questions-from-pdf/', admin, rollback=True,
+                 content_type='multipart', data={
+                     'file': ('notes.pdf', make_pdf([question.text[:60]] * 3)),
+                     'specialization_name': spec.name, 'num_questions': 5,
+                 }),
+    ]
+    if settings_row is not None:
+        scenarios.append(Scenario('ai settings detail', 'get', f'/api/ai-settings/{settings_row.pk}/', admin))
+    if job is not None:
+        scenarios.append(Scenario('jobs detail', 'get', f'/api/jobs/{job.pk}/', admin))
+        scenarios.append(Scenario('jobs cancel', 'post', f'/api/jobs/{job.pk}/cancel/', admin, rollback=True))
+    if definition.paper_variants.exists():
+        scenarios.append(Scenario('exam definitions start', 'post', f'/api/exam-definitions/{definition.pk}/start/',
+                                  student))
+    if open_session is not None:
+        open_question = open_session.questions.order_by('id').first()
+        autosave = {'answers': [{
+            'question_id': open_question.pk, 'selected_choice_id': open_question.choices.order_by('id').first().pk,
+        }]}
+        scenarios.append(Scenario('exam sessions resume', 'get', f'/api/exam-sessions/{open_session.pk}/resume/', student))
+        scenarios.append(Scenario('exam sessions autosave', 'post', f'/api/exam-sessions/{open_session.pk}/autosave/',
+                                  student, rollback=True, data=autosave))
+        scenarios.append(Scenario('exam sessions submit', 'post', f'/api/exam-sessions/{open_session.pk}/submit/',
+                                  student, rollback=True, data=autosave))
+    if adaptive is not None:
+        scenarios.append(Scenario('exam sessions answer', 'post', f'/api/exam-sessions/{adaptive.session_id}/answer/',
+                                  student, rollback=True, data={
+                                      'question_id': adaptive.current_question_id,
+                                      'selected_choice_id': adaptive.current_question.choices.order_by('id').first().pk,
+                                  }))
+    if statistics is not None:
+        scenarios.append(Scenario('item statistics detail', 'get', f'/api/item-statistics/{statistics.pk}/', admin))
+    if blob is not None:
+        scenarios.append(Scenario('blob', 'get', f'/api/blobs/{blob.pk}/', student))
+        scenarios.append(Scenario('blob range', 'get', f'/api/blobs/{blob.pk}/', student, headers={'Range': 'bytes=0-511'}))
+    if thumbnail is not None:
+        scenarios.append(Scenario('blob thumbnail', 'get', f'/api/blobs/{thumbnail.pk}/thumbnail/', student))
+    return scenarios
+
+
+def route_names(resolver=None, prefix=''):
+    """Names of every URL pattern under the api/ include, router format-suffix variants folded."""
+    resolver = resolver or get_resolver()
+    names = set()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            names |= route_names(pattern, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern) and pattern.name and prefix.startswith('api/'):
+            names.add(pattern.name)
+    return names
+
+
+def uncovered_routes(scenarios):
+    covered = {resolve(scenario.path.split('?')[0]).url_name for scenario in scenarios}
+    return sorted(route_names() - covered)
+
+
+def _request(client, scenario):
+    headers = dict(scenario.headers)
+    if scenario.user is not None:
+        headers['Authorization'] = f'Bearer {RoleTokenObtainPairSerializer.get_token(scenario.user).access_token}'
+    method = getattr(client, scenario.method)
+    if scenario.data is None:
+        return lambda: method(scenario.path, headers=headers)
+    if scenario.content_type == 'multipart':
+        # Uploads are file objects consumed by each request, so build them per call.
+        return lambda: method(scenario.path, headers=headers, data={
+            key: SimpleUploadedFile(*value) if isinstance(value, tuple) else value
+            for key, value in scenario.data.items()
+        })
+    body = json.dumps(scenario.data)
+    return lambda: method(scenario.path, body, content_type='application/json', headers=headers)
+
+
+def _call(send, scenario):
+    if not scenario.rollback:
+        response = send()
+    else:
+        with transaction.atomic():
+            response = send()
+            transaction.set_rollback(True)
+    # Streaming responses only do their work as they are consumed.
+    size = sum(len(chunk) for chunk in response.streaming_content) if response.streaming else len(response.content)
+    return response.status_code, size
+
+
+def run_scenario(client, scenario, iterations=50, warmup=5):
+    """
+    Time one scenario. Latency comes from untraced iterations; query count
+    and peak Python memory from one extra iteration traced with tracemalloc,
+    which would otherwise inflate the timings.
+    """
+    send = _request(client, scenario)
+    for _ in range(warmup):
+        _call(send, scenario)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        status, size = _call(send, scenario)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            _call(send, scenario)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'name': scenario.name,
+        'method': scenario.method.upper(),
+        'path': scenario.path,
+        'status': status,
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': len(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'response_bytes': size,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset_counts():
+    return {
+        'specializations': Specialization.objects.count(),
+        'questions': Question.objects.count(),
+        'attachments': Attachment.objects.count(),
+        'students': User.objects.filter(role='student').count(),
+        'exam_sessions': ExamSession.objects.count(),
+    }
+
+
+def run_benchmarks(iterations=50, warmup=5, only=None, progress=None):
+    """Run every scenario (or those whose name contains `only`) and return the report dict."""
+    scenarios = [s for s in build_scenarios() if not only or only in s.name]
+    client = Client(SERVER_NAME='localhost')
+    results = []
+    # Without a stored key the AI routes would stop at the configuration check.
+    api_key = os.environ.get('GEMINI_API_KEY') or 'benchmark'
+    with override_settings(**AI_STUB_SETTINGS), mock.patch.dict(os.environ, {'GEMINI_API_KEY': api_key}):
+        for scenario in scenarios:
+            result = run_scenario(client, scenario, iterations=iterations, warmup=warmup)
+            results.append(result)
+            if progress:
+                progress(result)
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'warmup': warmup,
+            'dataset': dataset_counts(),
+            'uncovered_routes': [] if only else uncovered_routes(scenarios),
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline):
+    """Rows of (name, baseline p95, current p95, change %, baseline queries, current queries)."""
+    before = {result['name']: result for result in baseline['results']}
+    rows = []
+    for result in report['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        change = 100.0 * (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+        rows.append((result['name'], old['p95_ms'], result['p95_ms'], change, old['queries'], result['queries']))
+    return rows
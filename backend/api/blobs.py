@@ -0,0 +1,254 @@
+import hashlib
+import mimetypes
+import os
+import re
+import weakref
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+from .models import Blob
+from .snapshots import etag_matches
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+HASH_BLOCK_SIZE = 1024 * 1024
+STREAM_BLOCK_SIZE = 64 * 1024
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+_BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def content_hash(upload):
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for block in iter(lambda: upload.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(sha256, extension=''):
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension.lower()}'
+
+
+def blob_key(name):
+    """The SHA-256 a content-addressed storage name was derived from, or None."""
+    match = _BLOB_NAME.match(name or '')
+    return match.group(1) if match else None
+
+
+def _remove_on_rollback(sha256, name):
+    """
+    Delete a newly written file if the transaction (or savepoint) that wrote
+    it rolls back. Django drops pending on_commit callbacks on rollback, so a
+    callback released without having run marks one.
+    """
+    outcome = {'committed': False}
+
+    def committed():
+        outcome['committed'] = True
+
+    def discard():
+        if outcome['committed']:
+            return
+        try:
+            if Blob.objects.filter(pk=sha256).exists():
+                return  # Another transaction stored the same bytes meanwhile.
+        except DatabaseError:
+            return
+        default_storage.delete(name)
+
+    weakref.finalize(committed, discard)
+    transaction.on_commit(committed)
+
+
+def store(upload, file_name=None):
+    """
+    Return the Blob holding the upload's bytes, writing them only if no blob
+    with the same content exists yet, and take one reference for the caller.
+    The reference is taken under the row lock, so collect_garbage cannot
+    delete the blob in between.
+    """
+    file_name = file_name or os.path.basename(upload.name or '')
+    sha256 = content_hash(upload)
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=sha256).first()
+        if blob is None or not default_storage.exists(blob.file.name):
+            name = blob_name(sha256, os.path.splitext(file_name)[1])
+            if not default_storage.exists(name):
+                name = default_storage.save(name, upload)
+                _remove_on_rollback(sha256, name)
+            content_type = getattr(upload, 'content_type', None) or mimetypes.guess_type(file_name)[0]
+            blob, _ = Blob.objects.update_or_create(pk=sha256, defaults={
+                'file': name, 'size': upload.size, 'content_type': content_type or 'application/octet-stream',
+            })
+        Blob.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1)
+        blob.ref_count += 1
+    return blob
+
+
+def _change_refs(sha256s, sign):
+    by_count = {}
+    for sha256, count in Counter(key for key in sha256s if key).items():
+        by_count.setdefault(count, []).append(sha256)
+    for count, keys in by_count.items():
+        Blob.objects.filter(pk__in=keys).update(ref_count=F('ref_count') + sign * count)
+    return [key for keys in by_count.values() for key in keys]
+
+
+def acquire(sha256s):
+    """Add one reference per occurrence, with one UPDATE per distinct count."""
+    _change_refs(sha256s, 1)
+
+
+def release(sha256s):
+    """Drop references; blobs left unreferenced are removed after commit."""
+    released = _change_refs(sha256s, -1)
+    if released:
+        transaction.on_commit(lambda: collect_garbage(released))
+
+
+def collect_garbage(sha256s):
+    """
+    Delete unreferenced blobs and their files. A blob re-acquired meanwhile is
+    kept; the files go before the row deletion commits, so a concurrent
+    store() waits on the row and then writes the bytes afresh.
+    """
+    for blob in Blob.objects.filter(pk__in=sha256s, ref_count=0):
+        with transaction.atomic():
+            deleted, _ = Blob.objects.filter(pk=blob.pk, ref_count=0).delete()
+            if deleted:
+                for name in (blob.file.name, blob.thumbnail.name):
+                    if name:
+                        default_storage.delete(name)
+
+
+def parse_range(header, size):
+    """
+    (start, stop) for a single "bytes=" range, None to serve the whole file
+    (no header, or a multi-range request), or ValueError if unsatisfiable.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        stop = min(int(last) + 1, size) if last else size
+    elif last:
+        start, stop = max(size - int(last), 0), size
+    else:
+        return None
+    if start >= size or start >= stop:
+        raise ValueError(header)
+    return start, stop
+
+
+def _iter_range(handle, start, stop):
+    try:
+        handle.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            block = handle.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    finally:
+        handle.close()
+
+
+def serve_file(request, name, content_type, etag, size):
+    """
+    Response for an immutable stored file. With ATTACHMENT_SENDFILE set the
+    front-end server streams it (and handles Range); otherwise FileResponse
+    lets the WSGI server use sendfile for whole files, and single byte
+    ranges are streamed from an offset.
+    """
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+    elif settings.ATTACHMENT_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f'{settings.ATTACHMENT_ACCEL_PREFIX}{name}'
+    elif settings.ATTACHMENT_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = default_storage.path(name)
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is None:
+            response = FileResponse(default_storage.open(name, 'rb'), content_type=content_type)
+        else:
+            start, stop = byte_range
+            response = StreamingHttpResponse(
+                _iter_range(default_storage.open(name, 'rb'), start, stop), status=206, content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+            response['Content-Length'] = str(stop - start)
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response['Expires'] = http_date(2 ** 31 - 1)
+    return response
+
+
+def _render_thumbnail(path, size):
+    with Image.open(path) as image:
+        image.thumbnail(size)
+        out = BytesIO()
+        image.convert('RGB').save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+def _thumbnail_job(args):
+    sha256, path, size = args
+    try:
+        return sha256, _render_thumbnail(path, size)
+    except Exception:
+        return sha256, None
+
+
+def generate_thumbnails(workers=None, limit=None):
+    """
+    Render missing thumbnails for image blobs in a process pool, outside the
+    request path. Thumbnails are content-addressed by their source blob.
+    Returns (rendered, failed).
+    """
+    if Image is None:
+        raise RuntimeError('Thumbnail generation requires the "Pillow" package.')
+    workers = workers or settings.ATTACHMENT_THUMBNAIL_WORKERS
+    size = tuple(settings.ATTACHMENT_THUMBNAIL_SIZE)
+    pending = Blob.objects.filter(thumbnail='', content_type__startswith='image/').order_by('pk')
+    if limit:
+        pending = pending[:limit]
+    jobs = [(sha256, default_storage.path(name), size) for sha256, name in pending.values_list('pk', 'file')]
+    rendered = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for sha256, data in executor.map(_thumbnail_job, jobs, chunksize=8):
+            if data is None:
+                failed += 1
+                continue
+            name = f'thumbnails/{sha256[:2]}/{sha256}.jpg'
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(data))
+            Blob.objects.filter(pk=sha256).update(thumbnail=name)
+            rendered += 1
+    return rendered, failed
@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from .models import ChangeLogEntry, ChangeLogPrune, AdminExamDefinition
+from .querysets import question_read_queryset
+from .serializers import QuestionSerializer, AdminExamDefinitionSerializer
+
+FEED_PAGE_SIZE = 500
+
+
+class CursorExpired(Exception):
+    """The journal was pruned past the client's cursor; `cursor` is where to resume after a full reload."""
+
+    def __init__(self, cursor):
+        super().__init__(f'The change log no longer reaches back to this cursor; resume from {cursor}.')
+        self.cursor = cursor
+
+
+def record_change(entity, object_id, specialization_id, deleted=False):
+    ChangeLogEntry.objects.create(
+        entity=entity, object_id=object_id, specialization_id=specialization_id, deleted=deleted,
+    )
+
+
+def record_question_changes(question_ids, specialization_id):
+    """Journal many question upserts with one insert, for bulk writers that bypass signals."""
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(entity='question', object_id=pk, specialization_id=specialization_id)
+        for pk in question_ids
+    ])
+
+
+def settled_entries():
+    """
+    Journal entries old enough to serve: CHANGE_FEED_SETTLE_SECONDS after they
+    were written, any transaction holding a lower id has committed.
+    """
+    entries = ChangeLogEntry.objects.all()
+    if settings.CHANGE_FEED_SETTLE_SECONDS:
+        entries = entries.filter(
+            changed_at__lte=timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS),
+        )
+    return entries
+
+
+def prune_horizon():
+    """Id of the last pruned entry; 0 while nothing was pruned."""
+    return ChangeLogPrune.objects.aggregate(horizon=Max('through_id'))['horizon'] or 0
+
+
+def changes_since(since, limit=FEED_PAGE_SIZE, specialization_id=None, include_definitions=True):
+    """
+    Collapse the journal after `since` into the current state of every touched
+    row plus tombstones. Cost is proportional to the number of changes, not to
+    the size of the bank. Raises CursorExpired, carrying the cursor to resume
+    from after a full reload, when `since` predates the last prune.
+    """
+    if since < prune_horizon():
+        cursor = settled_entries().aggregate(cursor=Max('id'))['cursor'] or 0
+        raise CursorExpired(cursor)
+    entries = settled_entries().filter(id__gt=since).order_by('id')
+    if specialization_id is not None:
+        entries = entries.filter(specialization_id=specialization_id)
+    if not include_definitions:
+        entries = entries.filter(entity='question')
+    entries = list(entries.values_list('id', 'entity', 'object_id', 'deleted')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for seq, entity, object_id, deleted in entries:
+        latest[(entity, object_id)] = deleted
+
+    upserts = {'question': [], 'exam_definition': []}
+    deleted = {'question': [], 'exam_definition': []}
+    for (entity, object_id), is_deleted in latest.items():
+        (deleted if is_deleted else upserts)[entity].append(object_id)
+
+    questions = question_read_queryset().in_bulk(upserts['question'])
+    definitions = AdminExamDefinition.objects.in_bulk(upserts['exam_definition'])
+    # A row journaled as changed may have been deleted after this page's last entry.
+    deleted['question'] += [pk for pk in upserts['question'] if pk not in questions]
+    deleted['exam_definition'] += [pk for pk in upserts['exam_definition'] if pk not in definitions]
+
+    feed = {
+        'cursor': entries[-1][0] if entries else since,
+        'has_more': has_more,
+        'questions': QuestionSerializer([questions[pk] for pk in sorted(questions)], many=True).data,
+        'deleted': {'questions': sorted(deleted['question'])},
+    }
+    if include_definitions:
+        feed['exam_definitions'] = AdminExamDefinitionSerializer(
+            [definitions[pk] for pk in sorted(definitions)], many=True
+        ).data
+        feed['deleted']['exam_definitions'] = sorted(deleted['exam_definition'])
+    return feed
+
+
+def prune_changes(retention_days=None):
+    """
+    Compact the journal, dropping every entry a later one for the same row
+    and specialization supersedes, which no client needs whatever its cursor,
+    then drop all entries older than `retention_days`. Cursors from before
+    the dropped entries get CursorExpired from then on. Returns the number of
+    entries deleted.
+    """
+    retention_days = settings.CHANGE_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    superseded = ChangeLogEntry.objects.filter(Exists(ChangeLogEntry.objects.filter(
+        entity=OuterRef('entity'), object_id=OuterRef('object_id'),
+        specialization_id=OuterRef('specialization_id'), id__gt=OuterRef('id'),
+    )))
+    with transaction.atomic():
+        deleted, _ = superseded.delete()
+        expired = ChangeLogEntry.objects.filter(changed_at__lt=timezone.now() - timedelta(days=retention_days))
+        through_id = expired.aggregate(through_id=Max('id'))['through_id']
+        if through_id is not None:
+            deleted += ChangeLogEntry.objects.filter(id__lte=through_id).delete()[0]
+            ChangeLogPrune.objects.create(through_id=through_id)
+    return deleted
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from .autosave import cache_is_shared
+
+
+@register()
+def check_autosave_buffer(app_configs, **kwargs):
+    if settings.AUTOSAVE_BUFFERED and not cache_is_shared():
+        return [Warning(
+            'AUTOSAVE_BUFFERED is on but the default cache is local to each process.',
+            hint='The flush worker and other web processes cannot see buffered answers, which are then lost. '
+                 'Configure a shared cache (REDIS_URL) or leave AUTOSAVE_BUFFERED unset.',
+            id='api.W001',
+        )]
+    return []
+
+
+@register(deploy=True)
+def check_version_counters(app_configs, **kwargs):
+    if not cache_is_shared():
+        return [Warning(
+            'The question bank, sampling pool and exam paper versions live in a cache local to each process.',
+            hint='A write bumps the version in its own process only, so other processes keep serving stale '
+                 'banks, pools and ETags. Configure a shared cache (REDIS_URL) or run a single process.',
+            id='api.W002',
+        )]
+    return []
@@ -0,0 +1,85 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+REPLICA_ALIAS = 'replica'
+# Advisory lock key guarding the derived statistics and rollups.
+STATISTICS_LOCK = 0x5374617473
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def apply_sqlite_pragmas(connection):
+    """
+    Per-connection SQLite tuning from settings.SQLITE_PRAGMAS: busy_timeout
+    makes writers queue for the lock instead of failing with "database is
+    locked". The WAL journal mode, which lets readers proceed during a write,
+    is a property of the database file and set by a migration instead, so
+    opening a connection never rewrites it.
+    """
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def lock_statistics(shared=False):
+    """
+    Serialise the transaction against others touching the item statistics
+    and result rollups: incremental submissions take the lock shared, so they
+    only wait for a full rebuild, which takes it exclusively. Held until the
+    transaction ends. SQLite transactions begin IMMEDIATE and so already hold
+    the database-wide write lock.
+    """
+    if connection.vendor == 'postgresql':
+        function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {function}(%s)', [STATISTICS_LOCK])
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    """
+    Sends reads made while a ReplicaReadMixin view handles a read-only action
+    to the "replica" database, when one is configured. Reads inside a
+    transaction on the primary stay there so they see its writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and replica_configured() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data, so objects read from either may be related.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaReadMixin:
+    """
+    View mixin that reads from the replica during the actions listed in
+    replica_actions. Replication lag means a client may briefly not see its
+    own writes on these actions.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if getattr(self, 'action', None) in self.replica_actions:
+            self._replica_token = _use_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _use_replica.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
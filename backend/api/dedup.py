@@ -0,0 +1,188 @@
+import hashlib
+import random
+import struct
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Question, Choice, QuestionSignature, QuestionLSHBucket
+from .search import normalize
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20250623)  # Fixed seed: signatures must be comparable across processes and runs.
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_BAND_KEY_MASK = (1 << 59) - 1
+_PACK = struct.Struct(f'<{NUM_PERM}Q')
+
+
+def shingles(text):
+    """Character shingles of the whitespace-collapsed normalized text."""
+    text = ' '.join(normalize(text).split())
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'little')
+
+
+def minhash(text):
+    hashes = [_hash(shingle) for shingle in shingles(text)] or [0]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def band_keys(signature):
+    """One bucket key per band; the band number sits in the high bits."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<{ROWS}Q', *rows), digest_size=8).digest()
+        keys.append((band << 59) | (int.from_bytes(digest, 'little') & _BAND_KEY_MASK))
+    return keys
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / NUM_PERM
+
+
+def question_document(text, choice_texts):
+    return '\n'.join([text, *sorted(choice_texts)])
+
+
+def _documents(question_ids):
+    documents = {pk: [text, []] for pk, text in Question.objects.filter(id__in=question_ids).values_list('id', 'text')}
+    for question_id, text in Choice.objects.filter(question_id__in=documents).values_list('question_id', 'text'):
+        documents[question_id][1].append(text)
+    return {pk: question_document(text, choices) for pk, (text, choices) in documents.items()}
+
+
+def index_questions(question_ids):
+    """(Re)compute signatures and LSH buckets for the given questions."""
+    question_ids = list(question_ids)
+    if not question_ids:
+        return
+    signatures = {pk: minhash(document) for pk, document in _documents(question_ids).items()}
+    with transaction.atomic():
+        QuestionSignature.objects.filter(question_id__in=question_ids).delete()
+        QuestionLSHBucket.objects.filter(question_id__in=question_ids).delete()
+        QuestionSignature.objects.bulk_create([
+            QuestionSignature(question_id=pk, minhash=_PACK.pack(*signature))
+            for pk, signature in signatures.items()
+        ])
+        QuestionLSHBucket.objects.bulk_create([
+            QuestionLSHBucket(question_id=pk, key=key)
+            for pk, signature in signatures.items()
+            for key in band_keys(signature)
+        ])
+
+
+def rebuild_index(chunk_size=1000):
+    QuestionSignature.objects.all().delete()
+    QuestionLSHBucket.objects.all().delete()
+    ids = list(Question.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        index_questions(ids[start:start + chunk_size])
+    return len(ids)
+
+
+def _load_signatures(question_ids):
+    rows = QuestionSignature.objects.filter(question_id__in=question_ids).values_list('question_id', 'minhash')
+    return {pk: _PACK.unpack(bytes(packed)) for pk, packed in rows}
+
+
+def find_near_duplicates(text, choice_texts, threshold=None, specialization_id=None):
+    """
+    Existing questions whose estimated similarity to the candidate reaches
+    the threshold, best first. Only questions sharing an LSH bucket are
+    compared, via two indexed queries, instead of scanning the bank.
+    """
+    threshold = settings.AI_DUPLICATE_THRESHOLD if threshold is None else threshold
+    signature = minhash(question_document(text, choice_texts))
+    candidates = QuestionLSHBucket.objects.filter(key__in=band_keys(signature))
+    if specialization_id is not None:
+        candidates = candidates.filter(question__specialization_id=specialization_id)
+    candidate_ids = set(candidates.values_list('question_id', flat=True))
+    matches = [
+        (pk, similarity(signature, other))
+        for pk, other in _load_signatures(candidate_ids).items()
+    ]
+    return sorted([m for m in matches if m[1] >= threshold], key=lambda m: -m[1])
+
+
+def filter_duplicates(questions, specialization_id, threshold=None):
+    """
+    Split generated question payloads into (unique, duplicates), checking
+    each against the bank and against the earlier questions of the batch.
+    """
+    threshold = settings.AI_DUPLICATE_THRESHOLD if threshold is None else threshold
+    unique, duplicates, accepted = [], [], []
+    for question in questions:
+        choice_texts = [choice['text'] for choice in question['choices']]
+        signature = minhash(question_document(question['text'], choice_texts))
+        if any(similarity(signature, other) >= threshold for other in accepted) or find_near_duplicates(
+            question['text'], choice_texts, threshold, specialization_id
+        ):
+            duplicates.append(question)
+        else:
+            unique.append(question)
+            accepted.append(signature)
+    return unique, duplicates
+
+
+def duplicate_clusters(threshold=None, specialization_id=None):
+    """
+    Groups of near-duplicate questions across the bank. Work is proportional
+    to the number of colliding buckets rather than to all pairs of questions.
+    """
+    threshold = settings.AI_DUPLICATE_THRESHOLD if threshold is None else threshold
+    buckets = QuestionLSHBucket.objects.all()
+    if specialization_id is not None:
+        buckets = buckets.filter(question__specialization_id=specialization_id)
+    shared_keys = buckets.values('key').annotate(n=Count('id')).filter(n__gt=1).values('key')
+    members = defaultdict(set)
+    for key, question_id in buckets.filter(key__in=shared_keys).values_list('key', 'question_id'):
+        members[key].add(question_id)
+
+    pairs = set()
+    for ids in members.values():
+        ids = sorted(ids)
+        pairs.update((a, b) for i, a in enumerate(ids) for b in ids[i + 1:])
+    signatures = _load_signatures({pk for pair in pairs for pk in pair})
+
+    parent = {}
+
+    def find(pk):
+        parent.setdefault(pk, pk)
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    best = {}
+    for a, b in pairs:
+        if a not in signatures or b not in signatures:
+            continue
+        score = similarity(signatures[a], signatures[b])
+        if score >= threshold:
+            parent[find(a)] = find(b)
+            best[(a, b)] = score
+
+    clusters, cluster_scores = defaultdict(list), defaultdict(float)
+    for pk in parent:
+        clusters[find(pk)].append(pk)
+    for (a, _), score in best.items():
+        root = find(a)
+        cluster_scores[root] = max(cluster_scores[root], score)
+    result = [
+        {'question_ids': sorted(ids), 'similarity': cluster_scores[root]}
+        for root, ids in clusters.items()
+    ]
+    return sorted(result, key=lambda cluster: (-cluster['similarity'], cluster['question_ids']))
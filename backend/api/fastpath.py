@@ -0,0 +1,212 @@
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from rest_framework import serializers
+
+from .metrics import timed_function
+from .models import Question, Choice, Attachment, ExamSession, StudentAnswer
+
+_datetime = serializers.DateTimeField()
+
+QUESTION_VALUES = ['id', 'text', 'specialization_id', 'course_year', 'mark', 'is_ai_generated']
+SESSION_VALUES = [
+    'id', 'student_id', 'specialization_id', 'admin_exam_definition_id', 'exam_name', 'score', 'completed_at',
+]
+USER_COLUMNS = ['id', 'username', 'email', 'first_name', 'last_name', 'role']
+SPECIALIZATION_COLUMNS = ['id', 'name']
+SESSION_DETAIL_FIELDS = [
+    'id', 'answers', 'questions', 'student', 'specialization', 'admin_exam_definition',
+    'exam_name', 'score', 'completed_at',
+]
+SESSION_LIST_FIELDS = ['id', 'student', 'specialization', 'admin_exam_definition', 'exam_name', 'score', 'completed_at']
+DEFINITION_COLUMNS = [
+    'id', 'name', 'description', 'durationMinutes', 'passingGradePercent', 'createdAt',
+    'showResultImmediately', 'allowRetries', 'allowNavigateBack', 'allowAutoGrading', 'specialization_id',
+]
+DEFINITION_FIELDS = DEFINITION_COLUMNS[:-1] + ['specialization']
+RELATED_COLUMNS = {
+    'student': (USER_COLUMNS, USER_COLUMNS),
+    'specialization': (SPECIALIZATION_COLUMNS, SPECIALIZATION_COLUMNS),
+    'admin_exam_definition': (DEFINITION_COLUMNS, DEFINITION_FIELDS),
+}
+
+
+def _wanted(fields, name):
+    return fields is None or name in fields
+
+
+def _pick(row, fields):
+    return row if fields is None else {key: value for key, value in row.items() if key in fields}
+
+
+def question_values(fields=None):
+    """Question columns for .values(), narrowed to the requested fields."""
+    return [column for column in QUESTION_VALUES if column == 'id' or _wanted(fields, column.replace('_id', ''))]
+
+
+def session_values(expand=(), detail=False, fields=None):
+    """
+    Session columns for .values(), with the expanded foreign keys joined in
+    so build_exam_sessions needs no query for them.
+    """
+    if detail:
+        expand = RELATED_COLUMNS
+    columns = [
+        column for column in SESSION_VALUES if column in ('id', 'completed_at') or _wanted(fields, column.replace('_id', ''))
+    ]
+    for name, (related_columns, _) in RELATED_COLUMNS.items():
+        if name in expand and _wanted(fields, name):
+            columns += [f'{name}__{column}' for column in related_columns]
+    return columns
+
+
+def _related(row, name):
+    related_columns, keys = RELATED_COLUMNS[name]
+    if row[f'{name}__id'] is None:
+        return None
+    related = {key: row[f'{name}__{column}'] for column, key in zip(related_columns, keys)}
+    if name == 'admin_exam_definition':
+        related['createdAt'] = _datetime.to_representation(related['createdAt'])
+    return related
+
+
+def _url_builder(name):
+    # Reversing once and formatting per row avoids a resolver walk per attachment.
+    template = reverse(name, args=['__sha256__']).replace('__sha256__', '{}')
+    return template.format
+
+
+def _file_url(name, request):
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def attachment_rows(question_ids, summary=False, request=None):
+    """{question_id: [attachment dict]} matching AttachmentSerializer or AttachmentSummarySerializer."""
+    blob_url, thumbnail_url = _url_builder('blob'), _url_builder('blob-thumbnail')
+    columns = ['id', 'question_id', 'attachment_type', 'file_name', 'blob_id', 'blob__thumbnail']
+    if not summary:
+        columns += ['file', 'content']
+    grouped = {}
+    for row in Attachment.objects.filter(question_id__in=question_ids).order_by('id').values_list(*columns):
+        pk, question_id, attachment_type, file_name, blob_id, thumbnail = row[:6]
+        url = blob_url(blob_id) if blob_id else None
+        thumb = thumbnail_url(blob_id) if blob_id and thumbnail else None
+        if summary:
+            item = {
+                'id': pk, 'question': question_id, 'attachment_type': attachment_type, 'file_name': file_name,
+                'url': url, 'thumbnail_url': thumb,
+            }
+        else:
+            item = {
+                'id': pk, 'url': url, 'thumbnail_url': thumb, 'attachment_type': attachment_type,
+                'file': _file_url(row[6], request), 'content': row[7], 'file_name': file_name,
+                'question': question_id, 'blob': blob_id,
+            }
+        grouped.setdefault(question_id, []).append(item)
+    return grouped
+
+
+@timed_function('serialize')
+def build_questions(rows, summary=False, request=None, fields=None):
+    """
+    Question dicts for rows of Question.objects.values(*question_values()),
+    with choices and attachments loaded in one query each instead of through
+    model instances and nested serializers. The output matches
+    QuestionSerializer (or QuestionListSerializer with summary=True) key for
+    key.
+    """
+    rows = list(rows)
+    question_ids = [row['id'] for row in rows]
+    choices, attachments = {}, {}
+    if _wanted(fields, 'choices'):
+        for pk, question_id, text, is_correct in Choice.objects.filter(
+            question_id__in=question_ids
+        ).order_by('id').values_list('id', 'question_id', 'text', 'is_correct'):
+            choices.setdefault(question_id, []).append({'id': pk, 'text': text, 'is_correct': is_correct})
+    if _wanted(fields, 'attachments'):
+        attachments = attachment_rows(question_ids, summary=summary, request=request)
+    return [
+        _pick({
+            'id': row['id'], 'text': row.get('text'), 'specialization': row.get('specialization_id'),
+            'course_year': row.get('course_year'), 'mark': row.get('mark'),
+            'is_ai_generated': row.get('is_ai_generated'),
+            'choices': choices.get(row['id'], []), 'attachments': attachments.get(row['id'], []),
+        }, fields)
+        for row in rows
+    ]
+
+
+def question_rows(question_ids, summary=False, request=None, fields=None):
+    """build_questions for the given ids, in their order; missing ids are skipped."""
+    question_ids = list(question_ids)
+    by_id = {row['id']: row for row in Question.objects.filter(id__in=question_ids).values(*question_values(fields))}
+    rows = [by_id[pk] for pk in question_ids if pk in by_id]
+    return build_questions(rows, summary=summary, request=request, fields=fields)
+
+
+@timed_function('serialize')
+def build_exam_sessions(rows, expand=(), detail=False, request=None, fields=None):
+    """
+    Session dicts for rows of ExamSession.objects.values(*session_values(...))
+    given the same arguments. With detail=True they match
+    ExamSessionSerializer; otherwise ExamSessionListSerializer with the given
+    expansions. Answers and questions cost one query each, plus one each for
+    the questions' choices and attachments.
+    """
+    rows = list(rows)
+    session_ids = [row['id'] for row in rows]
+    if detail:
+        expand = {'answers', 'questions', *RELATED_COLUMNS}
+    expand = {name for name in expand if _wanted(fields, name)}
+
+    answers, questions = {}, {}
+    if 'answers' in expand:
+        for pk, session_id, question_id, choice_id in StudentAnswer.objects.filter(
+            exam_session_id__in=session_ids
+        ).order_by('id').values_list('id', 'exam_session_id', 'question_id', 'selected_choice_id'):
+            answers.setdefault(session_id, []).append(
+                {'id': pk, 'exam_session': session_id, 'question': question_id, 'selected_choice': choice_id}
+            )
+    if 'questions' in expand:
+        Through = ExamSession.questions.through
+        links = list(Through.objects.filter(examsession_id__in=session_ids).order_by('question_id').values(
+            'examsession_id', *(f'question__{column}' for column in QUESTION_VALUES)
+        ))
+        question_by_id = {}
+        for link in links:
+            question_by_id.setdefault(link['question__id'], {
+                column: link[f'question__{column}'] for column in QUESTION_VALUES
+            })
+        built = {row['id']: row for row in build_questions(question_by_id.values(), request=request)}
+        for link in links:
+            questions.setdefault(link['examsession_id'], []).append(built[link['question__id']])
+
+    order = SESSION_DETAIL_FIELDS if detail else SESSION_LIST_FIELDS + [
+        name for name in ('answers', 'questions') if name in expand
+    ]
+    result = []
+    for row in rows:
+        pk = row['id']
+        values = {
+            'id': pk,
+            'answers': answers.get(pk, []),
+            'questions': questions.get(pk, []),
+            'exam_name': row.get('exam_name'),
+            'score': row.get('score'),
+            'completed_at': _datetime.to_representation(row['completed_at']),
+        }
+        for name in RELATED_COLUMNS:
+            values[name] = _related(row, name) if name in expand else row.get(f'{name}_id')
+        result.append(_pick({name: values[name] for name in order if name in values}, fields))
+    return result
+
+
+def exam_session_rows(session_ids, expand=(), detail=False, request=None, fields=None):
+    """build_exam_sessions for the given ids, in their order; missing ids are skipped."""
+    session_ids = list(session_ids)
+    columns = session_values(expand, detail=detail, fields=fields)
+    by_id = {row['id']: row for row in ExamSession.objects.filter(id__in=session_ids).values(*columns)}
+    rows = [by_id[pk] for pk in session_ids if pk in by_id]
+    return build_exam_sessions(rows, expand=expand, detail=detail, request=request, fields=fields)
@@ -0,0 +1,47 @@
+def query_list(request, param):
+    """Comma-separated query parameter as a set of names, or None if absent."""
+    if request is None:
+        return None
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin driven by the 'fields' and 'expand' context entries.
+    Fields named in `expandable_fields = {'name': (SerializerClass, kwargs)}`
+    are swapped for the richer serializer when expanded; with 'fields' set,
+    every other top-level field is dropped.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get('expand') or set()
+        for name, (serializer_class, options) in self.expandable_fields.items():
+            if name in expand:
+                self.fields[name] = serializer_class(read_only=True, **options)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class SparseFieldsetViewMixin:
+    """Reads ?fields= and ?expand= for get_queryset and passes them to the serializer."""
+
+    @property
+    def requested_fields(self):
+        return query_list(self.request, 'fields')
+
+    @property
+    def requested_expand(self):
+        return query_list(self.request, 'expand') or set()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.requested_fields
+        context['expand'] = self.requested_expand
+        return context
@@ -0,0 +1,53 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+def parse_int(value):
+    return int(value)
+
+
+def parse_bool(value):
+    lowered = value.lower()
+    if lowered in ('true', '1'):
+        return True
+    if lowered in ('false', '0'):
+        return False
+    raise ValueError(value)
+
+
+def parse_timestamp(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class QueryParamFilterBackend(BaseFilterBackend):
+    """
+    Applies exact/range filters declared on the view as
+    `filter_params = {'param': ('orm_lookup', parser)}`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        errors = {}
+        for param, (lookup, parser) in getattr(view, 'filter_params', {}).items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                lookups[lookup] = parser(value)
+            except (TypeError, ValueError):
+                errors[param] = [f'Invalid value: {value!r}.']
+        if errors:
+            raise ValidationError(errors)
+        return queryset.filter(**lookups)
@@ -0,0 +1,157 @@
+import math
+
+from django.db import transaction
+from django.db.models import F
+
+from .db import lock_statistics
+from .models import Question, ExamSession, StudentAnswer, QuestionStatistics, ChoiceStatistics
+
+
+def score_fraction(score, question_ids, answer_key):
+    """The session score as a fraction of the marks available in the session."""
+    total = sum(answer_key[pk][0] for pk in question_ids if pk in answer_key)
+    return score / total if total else 0.0
+
+
+def classify_answers(question_ids, answers, answer_key):
+    """
+    Split a session's questions into correct, incorrect and skipped ids and
+    collect the picked choice ids. Unanswered questions count as skipped.
+    """
+    selected = {answer['question_id']: answer['selected_choice_id'] for answer in answers}
+    correct, incorrect, skipped, picks = [], [], [], []
+    for pk in question_ids:
+        if pk not in answer_key:
+            continue
+        choice_id = selected.get(pk)
+        if choice_id is None:
+            skipped.append(pk)
+        else:
+            picks.append(choice_id)
+            (correct if answer_key[pk][2].get(choice_id) else incorrect).append(pk)
+    return correct, incorrect, skipped, picks
+
+
+def record_submission(question_ids, answers, answer_key, score):
+    """
+    Fold one graded session into the statistics with a fixed number of
+    UPDATE ... SET x = x + n queries, so concurrent submissions never lose
+    increments. Call inside the submission transaction; it waits for a
+    running rebuild_statistics.
+    """
+    lock_statistics(shared=True)
+    fraction = score_fraction(score, question_ids, answer_key)
+    correct, incorrect, skipped, picks = classify_answers(question_ids, answers, answer_key)
+    QuestionStatistics.objects.bulk_create(
+        [QuestionStatistics(question_id=pk) for pk in correct + incorrect + skipped], ignore_conflicts=True,
+    )
+    groups = [
+        (correct, {'correct': F('correct') + 1, 'correct_score_sum': F('correct_score_sum') + fraction}),
+        (incorrect, {}),
+        (skipped, {'skipped': F('skipped') + 1}),
+    ]
+    for ids, extra in groups:
+        if ids:
+            QuestionStatistics.objects.filter(question_id__in=ids).update(
+                attempts=F('attempts') + 1,
+                score_sum=F('score_sum') + fraction,
+                score_sq_sum=F('score_sq_sum') + fraction * fraction,
+                **extra,
+            )
+    if picks:
+        ChoiceStatistics.objects.bulk_create([ChoiceStatistics(choice_id=pk) for pk in picks], ignore_conflicts=True)
+        ChoiceStatistics.objects.filter(choice_id__in=picks).update(picks=F('picks') + 1)
+
+
+def correct_rate(stats):
+    return stats.correct / stats.attempts if stats.attempts else None
+
+
+def discrimination(stats):
+    """
+    Point-biserial correlation between answering correctly and the session
+    score; None while every attempt has the same outcome or score.
+    """
+    n, k = stats.attempts, stats.correct
+    if k == 0 or k == n:
+        return None
+    mean = stats.score_sum / n
+    variance = stats.score_sq_sum / n - mean * mean
+    if variance <= 1e-12:
+        return None
+    mean_correct = stats.correct_score_sum / k
+    mean_incorrect = (stats.score_sum - stats.correct_score_sum) / (n - k)
+    p = k / n
+    return (mean_correct - mean_incorrect) / math.sqrt(variance) * math.sqrt(p * (1 - p))
+
+
+def _full_answer_key():
+    key = {}
+    for question_id, mark, choice_id, is_correct in Question.objects.values_list(
+        'id', 'mark', 'choices__id', 'choices__is_correct'
+    ).iterator(chunk_size=2000):
+        _, _, choices = key.setdefault(question_id, (mark, None, {}))
+        if choice_id is not None:
+            choices[choice_id] = is_correct
+    return key
+
+
+def rebuild_statistics(chunk_size=1000):
+    """
+    Recompute every statistic from the stored sessions and answers, reading
+    sessions in chunks of chunk_size. Scan and swap run in one transaction
+    holding the statistics lock, so no submission lands in between and is
+    lost; submissions wait until it commits. Returns the number of sessions
+    folded in.
+    """
+    with transaction.atomic():
+        lock_statistics()
+        return _rebuild_statistics(chunk_size)
+
+
+def _rebuild_statistics(chunk_size):
+    answer_key = _full_answer_key()
+    question_stats, choice_picks = {}, {}
+    Through = ExamSession.questions.through
+    session_ids = list(ExamSession.objects.filter(status='completed').order_by('id').values_list('id', flat=True))
+    for start in range(0, len(session_ids), chunk_size):
+        chunk = session_ids[start:start + chunk_size]
+        scores = dict(ExamSession.objects.filter(id__in=chunk).values_list('id', 'score'))
+        questions, answers = {pk: [] for pk in chunk}, {pk: [] for pk in chunk}
+        for session_id, question_id in Through.objects.filter(examsession_id__in=chunk).values_list(
+            'examsession_id', 'question_id'
+        ):
+            questions[session_id].append(question_id)
+        for session_id, question_id, choice_id in StudentAnswer.objects.filter(exam_session_id__in=chunk).values_list(
+            'exam_session_id', 'question_id', 'selected_choice_id'
+        ):
+            answers[session_id].append({'question_id': question_id, 'selected_choice_id': choice_id})
+
+        for session_id in chunk:
+            question_ids = list(dict.fromkeys(
+                questions[session_id] + [answer['question_id'] for answer in answers[session_id]]
+            ))
+            fraction = score_fraction(scores[session_id], question_ids, answer_key)
+            correct, incorrect, skipped, picks = classify_answers(question_ids, answers[session_id], answer_key)
+            for pk in correct + incorrect + skipped:
+                stats = question_stats.get(pk)
+                if stats is None:
+                    stats = question_stats[pk] = QuestionStatistics(question_id=pk)
+                stats.attempts += 1
+                stats.score_sum += fraction
+                stats.score_sq_sum += fraction * fraction
+            for pk in correct:
+                question_stats[pk].correct += 1
+                question_stats[pk].correct_score_sum += fraction
+            for pk in skipped:
+                question_stats[pk].skipped += 1
+            for pk in picks:
+                choice_picks[pk] = choice_picks.get(pk, 0) + 1
+
+    QuestionStatistics.objects.all().delete()
+    ChoiceStatistics.objects.all().delete()
+    QuestionStatistics.objects.bulk_create(question_stats.values(), batch_size=chunk_size)
+    ChoiceStatistics.objects.bulk_create(
+        [ChoiceStatistics(choice_id=pk, picks=picks) for pk, picks in choice_picks.items()], batch_size=chunk_size,
+    )
+    return len(session_ids)
@@ -0,0 +1,233 @@
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+
+class JobError(Exception):
+    """A failure retrying will not fix; the job fails without further attempts."""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled, or its lease taken over, while it ran."""
+
+
+@dataclass(frozen=True)
+class JobKind:
+    name: str
+    run: object
+    cleanup: object = None
+
+
+_kinds = {}
+
+
+def job_handler(name, cleanup=None):
+    """
+    Register `run(context)` as the handler for jobs of this kind. It returns
+    the JSON result; raising JobError fails the job, any other exception
+    retries it. `cleanup(payload)` runs once the job reaches a final status.
+    """
+    def decorator(run):
+        _kinds[name] = JobKind(name, run, cleanup)
+        return run
+    return decorator
+
+
+def enqueue(kind, payload, user=None, max_attempts=None, delay=0):
+    """Queue a job: a single INSERT, so request handlers return at once."""
+    if kind not in _kinds:
+        raise ValueError(f'Unknown job kind {kind!r}.')
+    return Job.objects.create(
+        kind=kind, payload=payload, created_by_id=user.id if user is not None else None,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS, run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def retry_delay(attempts):
+    """Seconds before retrying after the given number of failed attempts: exponential, capped, jittered."""
+    delay = min(settings.JOB_RETRY_MAX_DELAY, settings.JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(1 - settings.JOB_RETRY_JITTER, 1)
+
+
+def _finish(job_id, status, worker=None, **fields):
+    """
+    Move a job to a final status. With `worker`, only while that worker still
+    holds it. Returns whether the row changed.
+    """
+    jobs = Job.objects.filter(pk=job_id)
+    if worker is not None:
+        jobs = jobs.filter(status='running', locked_by=worker)
+    else:
+        jobs = jobs.exclude(status__in=TERMINAL_STATUSES)
+    changed = jobs.update(status=status, finished_at=timezone.now(), locked_until=None, **fields)
+    if changed:
+        _cleanup(Job.objects.only('kind', 'payload').get(pk=job_id))
+    return bool(changed)
+
+
+def _cleanup(job):
+    kind = _kinds.get(job.kind)
+    if kind is not None and kind.cleanup is not None:
+        try:
+            kind.cleanup(job.payload)
+        except Exception:
+            logger.exception('Cleanup of job %s failed', job.pk)
+
+
+def cancel(job):
+    """Cancel a queued or running job. A running handler stops at its next progress report."""
+    return _finish(job.pk, 'cancelled')
+
+
+def claim(worker, limit=1):
+    """
+    Claim up to `limit` runnable jobs for `worker`: queued jobs that are due,
+    and running jobs whose lease expired. Rows are locked with SELECT ... FOR
+    UPDATE SKIP LOCKED where the database supports it, so concurrent workers
+    never claim the same job; on SQLite the transaction's write lock does the
+    same. Each claim counts as an attempt.
+    """
+    now = timezone.now()
+    lease = now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+    claimed, lost = [], []
+    with transaction.atomic():
+        rows = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status='queued', run_after__lte=now) | Q(status='running', locked_until__lt=now)
+        ).order_by('run_after', 'id')[:limit]
+        for job in rows:
+            if job.status == 'running' and job.attempts >= job.max_attempts:
+                lost.append(job)
+                continue
+            job.status, job.locked_by, job.locked_until = 'running', worker, lease
+            job.attempts += 1
+            job.started_at = job.started_at or now
+            claimed.append(job)
+        Job.objects.bulk_update(claimed, ['status', 'locked_by', 'locked_until', 'attempts', 'started_at'])
+    for job in lost:
+        _finish(job.pk, 'failed', error='The worker running this job stopped before it finished.')
+    return claimed
+
+
+class JobContext:
+    """What a handler sees of its job: the payload and a way to report progress."""
+
+    def __init__(self, job, worker):
+        self.job_id = job.pk
+        self.payload = job.payload
+        self.attempt = job.attempts
+        self.worker = worker
+
+    def progress(self, done, total=1, message=''):
+        """
+        Record progress as done/total and renew the lease. Raises JobCancelled
+        when the job was cancelled or claimed by another worker meanwhile.
+        """
+        updated = Job.objects.filter(pk=self.job_id, status='running', locked_by=self.worker).update(
+            progress=min(1.0, done / total) if total else 1.0, progress_message=message[:255],
+            locked_until=timezone.now() + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+        )
+        if not updated:
+            raise JobCancelled(f'Job {self.job_id} is no longer held by {self.worker}.')
+
+
+def run_job(job, worker):
+    """Run a claimed job to its next status: succeeded, failed, or queued again for a retry."""
+    kind = _kinds.get(job.kind)
+    try:
+        if kind is None:
+            raise JobError(f'Unknown job kind {job.kind!r}.')
+        result = kind.run(JobContext(job, worker))
+    except JobCancelled:
+        logger.info('Job %s was cancelled or reclaimed while running', job.pk)
+    except Exception as exc:
+        error = ''.join(traceback.format_exception(exc))[-5000:]
+        if isinstance(exc, JobError) or job.attempts >= job.max_attempts:
+            logger.warning('Job %s (%s) failed after %s attempts: %s', job.pk, job.kind, job.attempts, exc)
+            _finish(job.pk, 'failed', worker, error=error)
+        else:
+            delay = retry_delay(job.attempts)
+            logger.info('Job %s (%s) failed, retrying in %.1fs: %s', job.pk, job.kind, delay, exc)
+            Job.objects.filter(pk=job.pk, status='running', locked_by=worker).update(
+                status='queued', error=error, locked_by='', locked_until=None,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+    else:
+        _finish(job.pk, 'succeeded', worker, result=result, progress=1.0, error='')
+
+
+def execute(job_id, worker):
+    """Pool entry point: run one claimed job by id, with Django's per-request connection hygiene."""
+    close_old_connections()
+    try:
+        job = Job.objects.filter(pk=job_id, status='running', locked_by=worker).first()
+        if job is not None:
+            run_job(job, worker)
+    finally:
+        close_old_connections()
+
+
+def default_worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def work(concurrency=None, pool='thread', burst=False, poll_interval=None, stop=None, name=None):
+    """
+    Claim jobs and run them on a pool of `concurrency` threads or processes
+    until `stop` is set, or with `burst` until nothing is left to run. Scale
+    out by starting more worker processes; they coordinate through the job
+    rows alone. Returns the number of jobs run.
+    """
+    concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+    poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    stop = stop or threading.Event()
+    worker = name or default_worker_name()
+    if pool == 'process':
+        # Spawned, not forked, so children never share the parent's database connections. The
+        # initializer must not import this module: its models can only load after setup.
+        executor = ProcessPoolExecutor(
+            concurrency, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+        )
+    else:
+        executor = ThreadPoolExecutor(concurrency, thread_name_prefix='job')
+    running, count = set(), 0
+    try:
+        while not stop.is_set():
+            jobs = claim(worker, concurrency - len(running)) if len(running) < concurrency else []
+            for job in jobs:
+                running.add(executor.submit(execute, job.pk, worker))
+            count += len(jobs)
+            if jobs:
+                continue
+            if burst and not running:
+                break
+            if running:
+                done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        logger.error('Job execution crashed', exc_info=future.exception())
+            else:
+                stop.wait(poll_interval)
+        wait(running)
+    finally:
+        executor.shutdown(wait=True)
+        close_old_connections()
+    return count
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.db.models import Count
+from django.test import override_settings
+
+from . import metrics
+from .ai.proxy import get_proxy
+from .autosave import FLUSH_SCHEDULED_KEY, flush_answers, forget_session
+from .benchmark import AI_STUB_SETTINGS, benchmark_users, percentile
+from .models import User, Question, Choice, StudentAnswer, Job
+from .serializers import RoleTokenObtainPairSerializer
+from .submission import start_session
+
+AI_LOAD_PATH = '/api/ai/generate-questions-from-examples/'
+AUTOSAVE_LOAD_PREFIX = 'autosave-load-'
+
+
+async def asgi_request(app, method, path, body=b'', headers=()):
+    """
+    Send one HTTP request through an ASGI application in this process and
+    return (status, body). The connection never reports a disconnect.
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'content-length', str(len(body)).encode()), *headers],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status, chunks = None, []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status, b''.join(chunks)
+
+
+def _example_body(index):
+    # A distinct example per request, so no two prompts share a cached or coalesced upstream call.
+    return json.dumps({
+        'example_questions': [{
+            'text': f'Load test question {index}?',
+            'choices': [{'text': 'Yes', 'is_correct': True}, {'text': 'No', 'is_correct': False}],
+        }],
+        'specialization_name': 'Load test',
+        'num_questions': 1,
+        'save': False,
+    }).encode()
+
+
+async def _fire(app, requests, token):
+    headers = [(b'content-type', b'application/json'), (b'authorization', f'Bearer {token}'.encode())]
+    peak_threads = threading.active_count()
+    done = False
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    async def one(index):
+        start = time.perf_counter()
+        status, _ = await asgi_request(app, 'POST', AI_LOAD_PATH, _example_body(index), headers)
+        return status, (time.perf_counter() - start) * 1000
+
+    sampler = asyncio.ensure_future(sample_threads())
+    # Warm the process-wide AI configuration so the burst below does no database reads.
+    await asgi_request(app, 'POST', AI_LOAD_PATH, _example_body(-1), headers)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[one(index) for index in range(requests)])
+    elapsed = time.perf_counter() - start
+    done = True
+    await sampler
+    return results, elapsed, peak_threads
+
+
+def run_ai_load_test(requests=300, delay=1.0):
+    """
+    Send `requests` concurrent AI generation requests through Django's ASGI
+    handler, in this process, against the stub backend with `delay` seconds
+    of simulated upstream latency, and report how long the burst took.
+    Served concurrently, the burst takes about `delay`; a server that held a
+    worker per request would need about requests * delay / workers.
+    """
+    admin, _ = benchmark_users()
+    token = str(RoleTokenObtainPairSerializer.get_token(admin).access_token)
+    api_key = os.environ.get('GEMINI_API_KEY') or 'load-test'
+    stub = {
+        **AI_STUB_SETTINGS, 'AI_STUB_DELAY': delay, 'AI_MAX_CONCURRENT_REQUESTS': requests,
+        # Every request is slow by construction; logging each one would be noise.
+        'METRICS_SLOW_REQUEST_SECONDS': float('inf'),
+    }
+    with override_settings(**stub), mock.patch.dict(os.environ, {'GEMINI_API_KEY': api_key}):
+        backend = get_proxy().backend
+        results, elapsed, peak_threads = asyncio.run(_fire(ASGIHandler(), requests, token))
+    latencies = [latency for _, latency in results]
+    return {
+        'requests': requests,
+        'upstream_delay_s': delay,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(requests / elapsed, 1),
+        'statuses': dict(Counter(status for status, _ in results)),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'max_ms': round(max(latencies), 3),
+        'peak_upstream_in_flight': backend.peak,
+        'peak_threads': peak_threads,
+    }
+
+
+def _open_load_sessions(students, questions):
+    """
+    `students` throwaway student accounts, each with an in-progress session on
+    the first `questions` questions of the best-stocked specialization.
+    Returns [(session id, access token)] and {question_id: [choice ids]}.
+    """
+    specialization_id = Question.objects.filter(is_ai_generated=False).values('specialization_id').annotate(
+        n=Count('id')
+    ).order_by('-n').values_list('specialization_id', flat=True).first()
+    if specialization_id is None:
+        raise ValueError('The autosave load test needs questions (see generate_synthetic_data).')
+    question_ids = list(Question.objects.filter(
+        specialization_id=specialization_id, is_ai_generated=False,
+    ).order_by('id').values_list('id', flat=True)[:questions])
+    choices = {pk: [] for pk in question_ids}
+    for question_id, choice_id in Choice.objects.filter(question_id__in=question_ids).values_list('question_id', 'id'):
+        choices[question_id].append(choice_id)
+
+    User.objects.filter(username__startswith=AUTOSAVE_LOAD_PREFIX).delete()
+    users = User.objects.bulk_create([
+        User(username=f'{AUTOSAVE_LOAD_PREFIX}{n}', role='student') for n in range(students)
+    ])
+    data = {
+        'specialization_id': specialization_id, 'admin_exam_definition_id': None, 'exam_name': 'Autosave load test',
+        'questions_in_session': [{'id': pk} for pk in question_ids],
+    }
+    sessions = [
+        (start_session(user, data).pk, str(RoleTokenObtainPairSerializer.get_token(user).access_token))
+        for user in users
+    ]
+    return sessions, choices
+
+
+async def _autosave_burst(app, sessions, choices, clicks):
+    question_ids = list(choices)
+
+    async def student(session_id, token):
+        headers = [(b'content-type', b'application/json'), (b'authorization', f'Bearer {token}'.encode())]
+        results = []
+        for click in range(clicks):
+            question_id = question_ids[click % len(question_ids)]
+            body = json.dumps({'answers': [
+                {'question_id': question_id, 'selected_choice_id': random.choice(choices[question_id])},
+            ]}).encode()
+            start = time.perf_counter()
+            status, _ = await asgi_request(app, 'POST', f'/api/exam-sessions/{session_id}/autosave/', body, headers)
+            results.append((status, (time.perf_counter() - start) * 1000))
+        return results
+
+    start = time.perf_counter()
+    per_student = await asyncio.gather(*[student(session_id, token) for session_id, token in sessions])
+    return [result for results in per_student for result in results], time.perf_counter() - start
+
+
+def run_autosave_load_test(students=1000, clicks=5, questions=20):
+    """
+    Open an exam session for each of `students` throwaway students, have all
+    of them autosave `clicks` answers at once through Django's ASGI handler
+    in this process, then flush the buffer to the database as the periodic
+    job would. The students and everything they wrote are deleted again.
+    """
+    last_job = Job.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    sessions = []
+    try:
+        sessions, choices = _open_load_sessions(students, questions)
+        cache.delete(FLUSH_SCHEDULED_KEY)
+        metrics.reset()
+        # Web requests and the flush share this process, so even a local cache buffers safely here.
+        with override_settings(METRICS_SLOW_REQUEST_SECONDS=float('inf'), AUTOSAVE_BUFFERED=True):
+            results, elapsed = asyncio.run(_autosave_burst(ASGIHandler(), sessions, choices, clicks))
+        requests, sums = metrics.totals('examsession-autosave')
+        session_ids = [session_id for session_id, _ in sessions]
+        answers = StudentAnswer.objects.filter(exam_session_id__in=session_ids)
+        unflushed = answers.count()
+        start = time.perf_counter()
+        flushed = flush_answers()
+        flush_elapsed = time.perf_counter() - start
+        latencies = [latency for _, latency in results]
+        return {
+            'students': students,
+            'clicks_per_student': clicks,
+            'requests': len(results),
+            'elapsed_s': round(elapsed, 3),
+            'requests_per_s': round(len(results) / elapsed, 1),
+            'statuses': dict(Counter(status for status, _ in results)),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'max_ms': round(max(latencies), 3),
+            'queries_per_autosave': round(sums['request_queries'] / requests, 3) if requests else None,
+            'flush_jobs_queued': Job.objects.filter(id__gt=last_job, kind='sessions.flush_answers').count(),
+            'answers_in_db_before_flush': unflushed,
+            'sessions_flushed': flushed,
+            'answers_in_db_after_flush': answers.count(),
+            'flush_s': round(flush_elapsed, 3),
+        }
+    finally:
+        for session_id, _ in sessions:
+            forget_session(session_id, list(choices))
+        Job.objects.filter(id__gt=last_job, kind='sessions.flush_answers').delete()
+        User.objects.filter(username__startswith=AUTOSAVE_LOAD_PREFIX).delete()
+        cache.delete(FLUSH_SCHEDULED_KEY)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.adaptive import calibrate_items
+
+
+class Command(BaseCommand):
+    help = 'Fit Rasch item difficulties for adaptive exams from all stored answers (needs numpy).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--tolerance', type=float, default=1e-4)
+
+    def handle(self, *args, **options):
+        try:
+            total = calibrate_items(iterations=options['iterations'], tolerance=options['tolerance'])
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Calibrated {total} questions.'))
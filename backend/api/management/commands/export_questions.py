@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.transfer import iter_csv, iter_export_records, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Stream the question bank, with choices and attachments, as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='File to write to; defaults to stdout.')
+        parser.add_argument('--format', dest='file_format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--specialization', type=int, help='Only export this specialization id.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        records = iter_export_records(options['specialization'], chunk_size=options['chunk_size'])
+        lines = iter_csv(records) if options['file_format'] == 'csv' else iter_ndjson(records)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.synthetic import SYNTHETIC_PASSWORD, generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Insert a reproducible synthetic dataset (specializations, questions with choices and attachments, '
+        'students, exam sessions with answers) for benchmarking.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--specializations', type=int, default=5)
+        parser.add_argument('--questions', type=int, default=1000)
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--sessions', type=int, default=1000)
+        parser.add_argument('--questions-per-session', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same data. Use a new seed to add more.')
+        parser.add_argument('--label', default='synthetic', help='Prefix for generated names.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        counts = generate_dataset(
+            specializations=options['specializations'],
+            questions=options['questions'],
+            students=options['students'],
+            sessions=options['sessions'],
+            questions_per_session=options['questions_per_session'],
+            seed=options['seed'],
+            label=options['label'],
+            chunk_size=options['chunk_size'],
+        )
+        summary = ', '.join(f'{count} {name.replace("_", " ")}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary}.'))
+        self.stdout.write(f'Synthetic students log in with the password "{SYNTHETIC_PASSWORD}".')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.blobs import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Render missing thumbnails for image attachments in a worker process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--limit', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            rendered, failed = generate_thumbnails(workers=options['workers'], limit=options['limit'])
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} thumbnails ({failed} failed).'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.transfer import import_records, parse_upload
+
+
+class Command(BaseCommand):
+    help = 'Import questions with choices and attachments from an NDJSON or CSV file in bounded-memory chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=['ndjson', 'csv'])
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        try:
+            stream = open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(exc)
+        with stream:
+            result = import_records(parse_upload(stream, file_format), chunk_size=options['chunk_size'])
+        for error in result['errors']:
+            self.stderr.write(f"record {error['record']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} questions ({result['error_count']} records skipped)."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = 'Compact the change journal and drop entries older than the retention period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Defaults to CHANGE_LOG_RETENTION_DAYS.')
+
+    def handle(self, *args, **options):
+        deleted = prune_changes(retention_days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change log entries.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.dedup import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Drop and rebuild the MinHash/LSH near-duplicate index over questions and their choices.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = rebuild_index(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} questions.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.item_stats import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-question and per-choice statistics from all stored exam sessions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = rebuild_statistics(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Folded in {total} exam sessions.'))
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.loadtest import run_ai_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        'Send a burst of concurrent AI generation requests through the ASGI application in this process, '
+        'against the stub backend with simulated upstream latency, and report how long the burst took.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Concurrent requests in the burst.')
+        parser.add_argument('--delay', type=float, default=1.0, help='Simulated upstream latency in seconds.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        report = run_ai_load_test(requests=options['requests'], delay=options['delay'])
+        for key, value in report.items():
+            self.stdout.write(f'{key:<26}{value}')
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}.'))
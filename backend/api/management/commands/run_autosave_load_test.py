@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.loadtest import run_autosave_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        'Have many students autosave exam answers at once through the ASGI application in this process, '
+        'then flush the buffered answers to the database, and report the latencies, query counts and flush time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000, help='Students answering at the same time.')
+        parser.add_argument('--clicks', type=int, default=5, help='Answers each student saves, one request each.')
+        parser.add_argument('--questions', type=int, default=20, help='Questions in each exam.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        report = run_autosave_load_test(
+            students=options['students'], clicks=options['clicks'], questions=options['questions'],
+        )
+        for key, value in report.items():
+            self.stdout.write(f'{key:<28}{value}')
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}.'))
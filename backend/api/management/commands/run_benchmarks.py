@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every API route and the JWT endpoints against the current database and report p50/p95/p99 '
+        'latency, query count and peak memory. Populate the database with generate_synthetic_data first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', help='Run only scenarios whose name contains this text.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--compare', help='A previous JSON report to compare p95 latency and queries against.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+
+        self.stdout.write(f'{"scenario":<36}{"status":>7}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+                          f'{"queries":>9}{"peak KiB":>10}')
+
+        def progress(result):
+            self.stdout.write(
+                f'{result["name"]:<36}{result["status"]:>7}{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}'
+                f'{result["p99_ms"]:>10.2f}{result["queries"]:>9}{result["peak_memory_kb"]:>10.1f}'
+            )
+
+        try:
+            report = run_benchmarks(
+                iterations=options['iterations'], warmup=options['warmup'], only=options['only'], progress=progress,
+            )
+        except ValueError as exc:
+            raise CommandError(f'{exc} Run generate_synthetic_data first.')
+
+        for name in report['meta']['uncovered_routes']:
+            self.stderr.write(f'Route {name} has no benchmark scenario.')
+        if baseline is not None:
+            self.stdout.write(f'\nCompared with {baseline["meta"].get("commit") or options["compare"]}:')
+            for name, old_p95, new_p95, change, old_queries, new_queries in compare(report, baseline):
+                self.stdout.write(
+                    f'{name:<36}{old_p95:>10.2f} -> {new_p95:<10.2f}{change:>+8.1f}%  queries {old_queries} -> {new_queries}'
+                )
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}.'))
@@ -0,0 +1,40 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import default_worker_name, work
+
+
+class Command(BaseCommand):
+    help = (
+        'Run background jobs (AI generation, PDF ingestion, regrading) from the database queue. Start one '
+        'process per host or more; they share the queue through row locks, with no broker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help='Jobs run at once (default JOB_WORKER_CONCURRENCY).')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run jobs on threads (default) or on child processes, for CPU-bound work.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is ready to run.')
+        parser.add_argument('--name', help='Worker name recorded on claimed jobs (default host:pid).')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stderr.write('Stopping after the running jobs finish.')
+            stop.set()
+
+        previous = {signum: signal.signal(signum, shutdown) for signum in (signal.SIGTERM, signal.SIGINT)}
+        name = options['name'] or default_worker_name()
+        self.stdout.write(f'Worker {name} started.')
+        try:
+            count = work(
+                concurrency=options['concurrency'], pool=options['pool'], burst=options['burst'], stop=stop,
+                name=name,
+            )
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Worker {name} ran {count} jobs.'))
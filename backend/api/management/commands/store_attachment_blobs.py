@@ -0,0 +1,27 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.blobs import store
+from api.models import Attachment
+
+
+class Command(BaseCommand):
+    help = 'Move attachment files uploaded before content-addressed storage into shared blobs.'
+
+    def handle(self, *args, **options):
+        legacy = Attachment.objects.filter(blob__isnull=True).exclude(file='').exclude(file__isnull=True)
+        moved = 0
+        for attachment in legacy.iterator():
+            old_name = attachment.file.name
+            if not default_storage.exists(old_name):
+                self.stderr.write(f'Attachment {attachment.pk}: {old_name} is missing, skipped.')
+                continue
+            with transaction.atomic():
+                with default_storage.open(old_name, 'rb') as handle:
+                    blob = store(handle, attachment.file_name or old_name)
+                Attachment.objects.filter(pk=attachment.pk).update(file=blob.file.name, blob=blob)
+            if not Attachment.objects.filter(file=old_name).exists():
+                default_storage.delete(old_name)
+            moved += 1
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} attachment files into blob storage.'))
@@ -0,0 +1,281 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+_routes = {}
+
+# Names and help text of the exported series, in output order.
+HISTOGRAMS = {
+    'request_duration_seconds': 'Request latency from the metrics middleware to the response.',
+    'request_queries': 'SQL queries executed per request.',
+    'response_size_bytes': 'Response body size; streamed responses count as 0.',
+}
+TOTALS = {
+    'db_query_duration_seconds': 'Time spent executing SQL.',
+    'serialize_duration_seconds': 'Time spent in serializers and renderers, excluding the SQL they triggered.',
+    'auth_duration_seconds': 'Time spent authenticating the request (JWT decode and user lookup).',
+}
+
+
+class RequestMetrics:
+    """Measurements for the request being handled; timed() finds it through a context variable."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.timings = dict.fromkeys(['serialize', 'auth'], 0.0)
+        self.statements = {}
+        self._depth = 0
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        count, total = self.statements.get(sql, (0, 0.0))
+        self.statements[sql] = (count + 1, total + duration)
+
+    def top_queries(self, limit):
+        ranked = sorted(self.statements.items(), key=lambda item: -item[1][1])[:limit]
+        return [{'sql': sql[:500], 'count': count, 'seconds': round(total, 6)} for sql, (count, total) in ranked]
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the wall time of the block, minus SQL run inside it, to the current
+    request's phase. Nested blocks count once, at the outermost level.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics._depth:
+        yield
+        return
+    metrics._depth += 1
+    start, sql_start = time.perf_counter(), metrics.sql_time
+    try:
+        yield
+    finally:
+        metrics._depth -= 1
+        metrics.timings[phase] += (time.perf_counter() - start) - (metrics.sql_time - sql_start)
+
+
+def timed_function(phase):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SerializationTimingMixin:
+    """
+    Generic view mixin charging the serializers it hands out to the serialize
+    phase: their to_representation is timed on the instance, so no class is
+    patched. Encoding is timed by the renderer.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        serializer.to_representation = timed_function('serialize')(serializer.to_representation)
+        return serializer
+
+
+class _Series:
+    def __init__(self):
+        self.count = 0
+        self.histograms = {
+            'request_duration_seconds': [0] * (len(settings.METRICS_LATENCY_BUCKETS) + 1),
+            'request_queries': [0] * (len(settings.METRICS_QUERY_BUCKETS) + 1),
+            'response_size_bytes': [0] * (len(settings.METRICS_SIZE_BUCKETS) + 1),
+        }
+        self.sums = dict.fromkeys(list(HISTOGRAMS) + list(TOTALS), 0.0)
+
+
+def _buckets(name):
+    return {
+        'request_duration_seconds': settings.METRICS_LATENCY_BUCKETS,
+        'request_queries': settings.METRICS_QUERY_BUCKETS,
+        'response_size_bytes': settings.METRICS_SIZE_BUCKETS,
+    }[name]
+
+
+def observe(route, method, status, duration, metrics, size):
+    values = {
+        'request_duration_seconds': duration,
+        'request_queries': metrics.queries,
+        'response_size_bytes': size,
+        'db_query_duration_seconds': metrics.sql_time,
+        'serialize_duration_seconds': metrics.timings['serialize'],
+        'auth_duration_seconds': metrics.timings['auth'],
+    }
+    with _lock:
+        series = _routes.get((route, method, status))
+        if series is None:
+            series = _routes[(route, method, status)] = _Series()
+        series.count += 1
+        for name, value in values.items():
+            series.sums[name] += value
+            if name in series.histograms:
+                series.histograms[name][bisect_left(_buckets(name), value)] += 1
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+def totals(route):
+    """(request count, {measure: sum}) recorded for a route so far, over every method and status."""
+    count, sums = 0, dict.fromkeys(list(HISTOGRAMS) + list(TOTALS), 0.0)
+    with _lock:
+        for (name, _, _), series in _routes.items():
+            if name == route:
+                count += series.count
+                for key, value in series.sums.items():
+                    sums[key] += value
+    return count, sums
+
+
+def _labels(route, method, status, **extra):
+    pairs = {'route': route, 'method': method, 'status': status, **extra}
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in pairs.values())
+    return ','.join(f'{key}="{value}"' for key, value in zip(pairs, escaped))
+
+
+def render_metrics():
+    """The registry in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        snapshot = {
+            key: (series.count, {name: list(counts) for name, counts in series.histograms.items()}, dict(series.sums))
+            for key, series in sorted(_routes.items())
+        }
+    prefix = settings.METRICS_PREFIX
+    lines = [f'# HELP {prefix}_requests_total Requests handled.', f'# TYPE {prefix}_requests_total counter']
+    lines += [f'{prefix}_requests_total{{{_labels(*key)}}} {count}' for key, (count, _, _) in snapshot.items()]
+    for name, help_text in HISTOGRAMS.items():
+        bounds = _buckets(name)
+        lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} histogram']
+        for key, (count, histograms, sums) in snapshot.items():
+            cumulative = 0
+            for bound, observed in zip(list(bounds) + ['+Inf'], histograms[name]):
+                cumulative += observed
+                lines.append(f'{prefix}_{name}_bucket{{{_labels(*key, le=bound)}}} {cumulative}')
+            lines.append(f'{prefix}_{name}_sum{{{_labels(*key)}}} {sums[name]:g}')
+            lines.append(f'{prefix}_{name}_count{{{_labels(*key)}}} {count}')
+    for name, help_text in TOTALS.items():
+        lines += [f'# HELP {prefix}_{name}_total {help_text}', f'# TYPE {prefix}_{name}_total counter']
+        lines += [f'{prefix}_{name}_total{{{_labels(*key)}}} {sums[name]:g}' for key, (_, _, sums) in snapshot.items()]
+    return '\n'.join(lines) + '\n'
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    # View names keep the label set small; raw paths would create a series per id.
+    return match.view_name if match is not None and match.view_name else 'unmatched'
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper that charges the statement to the request being measured, if any."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - start)
+
+
+def watch_queries(connection):
+    """
+    Install record_queries on a database connection. It stays installed for
+    the connection's lifetime: connections are per thread, and async views
+    run their queries on threads the middleware never sees, but the context
+    variable travels with them through sync_to_async. It goes first, because
+    connection.execute_wrapper() blocks pop the last wrapper when they exit,
+    and a connection may open inside one.
+    """
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_queries)
+
+
+class MetricsMiddleware:
+    """
+    Records per route, method and status: latency, SQL query count and time
+    (through record_queries), serialization and authentication time, and
+    response size. Requests slower than METRICS_SLOW_REQUEST_SECONDS are
+    logged with their most expensive statements. Metrics live in process
+    memory, so each worker process exports its own series. Works in both
+    sync and async chains, so under ASGI it does not force async views onto
+    a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, duration):
+        route = _route(request)
+        size = 0 if response.streaming else len(response.content)
+        observe(route, request.method, response.status_code, duration, metrics, size)
+        if duration >= settings.METRICS_SLOW_REQUEST_SECONDS:
+            log_slow_request(request, route, duration, metrics)
+        return response
+
+
+def log_slow_request(request, route, duration, metrics):
+    details = {
+        'route': route,
+        'duration': round(duration, 6),
+        'queries': metrics.queries,
+        'sql_seconds': round(metrics.sql_time, 6),
+        'serialize_seconds': round(metrics.timings['serialize'], 6),
+        'auth_seconds': round(metrics.timings['auth'], 6),
+        'top_queries': metrics.top_queries(settings.METRICS_SLOW_REQUEST_TOP_QUERIES),
+    }
+    logger.warning(
+        'Slow request %s %s: %s', request.method, request.path, json.dumps(details, ensure_ascii=False),
+        extra={'metrics': details},
+    )
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="examsession",
+            index=models.Index(
+                fields=["student", "-completed_at", "-id"],
+                name="session_student_completed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="examsession",
+            index=models.Index(
+                fields=["specialization", "-completed_at", "-id"],
+                name="session_spec_completed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="examsession",
+            index=models.Index(
+                fields=["-completed_at", "-id"], name="session_completed_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["specialization", "course_year", "is_ai_generated", "id"],
+                name="question_spec_year_ai_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["is_ai_generated", "id"], name="question_ai_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,101 @@
+import re
+
+from django.db import migrations
+
+# Frozen copies of the schema and normalization in api/search.py as of this
+# migration, so later changes there cannot alter what it does.
+SEARCH_TABLE = "api_question_search"
+
+SQLITE_CREATE = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    f"USING fts5(body, tokenize='unicode61 remove_diacritics 2')",
+]
+SQLITE_INSERT = f"INSERT INTO {SEARCH_TABLE} (rowid, body) VALUES (%s, %s)"
+
+POSTGRES_CREATE = [
+    f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+    f"question_id bigint PRIMARY KEY REFERENCES api_question (id) ON DELETE CASCADE, "
+    f"document tsvector NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_gin ON {SEARCH_TABLE} USING gin (document)",
+]
+POSTGRES_INSERT = f"INSERT INTO {SEARCH_TABLE} (question_id, document) VALUES (%s, to_tsvector('simple', %s))"
+
+STATEMENTS = {
+    "sqlite": (SQLITE_CREATE, SQLITE_INSERT),
+    "postgresql": (POSTGRES_CREATE, POSTGRES_INSERT),
+}
+
+ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ARABIC_LETTERS = str.maketrans(
+    {
+        "\u0622": "\u0627",
+        "\u0623": "\u0627",
+        "\u0625": "\u0627",
+        "\u0671": "\u0627",
+        "\u0649": "\u064a",
+        "\u0629": "\u0647",
+    }
+)
+
+
+def normalize(text):
+    return (
+        ARABIC_DIACRITICS.sub("", text).translate(ARABIC_LETTERS).lower()
+        if text
+        else ""
+    )
+
+
+def build_documents(apps, question_ids):
+    Question = apps.get_model("api", "Question")
+    Choice = apps.get_model("api", "Choice")
+    Attachment = apps.get_model("api", "Attachment")
+    parts = {
+        pk: [text]
+        for pk, text in Question.objects.filter(id__in=question_ids).values_list(
+            "id", "text"
+        )
+    }
+    for question_id, text in Choice.objects.filter(question_id__in=parts).values_list(
+        "question_id", "text"
+    ):
+        parts[question_id].append(text)
+    attachments = Attachment.objects.filter(question_id__in=parts).values_list(
+        "question_id", "content", "file_name"
+    )
+    for question_id, content, file_name in attachments:
+        parts[question_id].extend(filter(None, (content, file_name)))
+    return [(pk, normalize("\n".join(texts))) for pk, texts in parts.items()]
+
+
+def create_search_index(apps, schema_editor):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    create, insert = statements
+    with schema_editor.connection.cursor() as cursor:
+        for statement in create:
+            cursor.execute(statement)
+    Question = apps.get_model("api", "Question")
+    ids = list(Question.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(ids), 1000):
+        documents = build_documents(apps, ids[start : start + 1000])
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(insert, documents)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in STATEMENTS:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_question_session_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,158 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:32
+
+import hashlib
+import random
+import re
+import struct
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copies of the signatures in api/dedup.py and the normalization in
+# api/search.py as of this migration, so later changes there cannot alter it.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+PRIME = (1 << 61) - 1
+rng = random.Random(20250623)
+PERMUTATIONS = [
+    (rng.randrange(1, PRIME), rng.randrange(0, PRIME)) for _ in range(NUM_PERM)
+]
+BAND_KEY_MASK = (1 << 59) - 1
+PACK = struct.Struct(f"<{NUM_PERM}Q")
+
+ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ARABIC_LETTERS = str.maketrans(
+    {
+        "\u0622": "\u0627",
+        "\u0623": "\u0627",
+        "\u0625": "\u0627",
+        "\u0671": "\u0627",
+        "\u0649": "\u064a",
+        "\u0629": "\u0647",
+    }
+)
+
+
+def normalize(text):
+    return (
+        ARABIC_DIACRITICS.sub("", text).translate(ARABIC_LETTERS).lower()
+        if text
+        else ""
+    )
+
+
+def minhash(text):
+    text = " ".join(normalize(text).split())
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text} if text else set()
+    else:
+        shingles = {
+            text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)
+        }
+    hashes = [
+        int.from_bytes(
+            hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little"
+        )
+        for shingle in shingles
+    ] or [0]
+    return tuple(min((a * h + b) % PRIME for h in hashes) for a, b in PERMUTATIONS)
+
+
+def band_keys(signature):
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS : (band + 1) * ROWS]
+        digest = hashlib.blake2b(
+            struct.pack(f"<{ROWS}Q", *rows), digest_size=8
+        ).digest()
+        keys.append((band << 59) | (int.from_bytes(digest, "little") & BAND_KEY_MASK))
+    return keys
+
+
+def index_existing_questions(apps, schema_editor):
+    Question = apps.get_model("api", "Question")
+    Choice = apps.get_model("api", "Choice")
+    QuestionSignature = apps.get_model("api", "QuestionSignature")
+    QuestionLSHBucket = apps.get_model("api", "QuestionLSHBucket")
+    ids = list(Question.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(ids), 1000):
+        chunk = ids[start : start + 1000]
+        documents = {
+            pk: [text, []]
+            for pk, text in Question.objects.filter(id__in=chunk).values_list(
+                "id", "text"
+            )
+        }
+        for question_id, text in Choice.objects.filter(
+            question_id__in=chunk
+        ).values_list("question_id", "text"):
+            documents[question_id][1].append(text)
+        signatures = {
+            pk: minhash("\n".join([text, *sorted(choices)]))
+            for pk, (text, choices) in documents.items()
+        }
+        QuestionSignature.objects.bulk_create(
+            [
+                QuestionSignature(question_id=pk, minhash=PACK.pack(*signature))
+                for pk, signature in signatures.items()
+            ]
+        )
+        QuestionLSHBucket.objects.bulk_create(
+            [
+                QuestionLSHBucket(question_id=pk, key=key)
+                for pk, signature in signatures.items()
+                for key in band_keys(signature)
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_change_log"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuestionSignature",
+            fields=[
+                (
+                    "question",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="signature",
+                        serialize=False,
+                        to="api.question",
+                    ),
+                ),
+                ("minhash", models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="QuestionLSHBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.BigIntegerField(db_index=True)),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lsh_buckets",
+                        to="api.question",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(index_existing_questions, migrations.RunPython.noop),
+    ]
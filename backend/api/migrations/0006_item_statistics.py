@@ -0,0 +1,123 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_statistics(apps, schema_editor):
+    # A frozen copy of api.item_stats.rebuild_statistics as of this migration.
+    Question = apps.get_model("api", "Question")
+    ExamSession = apps.get_model("api", "ExamSession")
+    StudentAnswer = apps.get_model("api", "StudentAnswer")
+    QuestionStatistics = apps.get_model("api", "QuestionStatistics")
+    ChoiceStatistics = apps.get_model("api", "ChoiceStatistics")
+    Through = ExamSession.questions.through
+
+    answer_key = {}
+    for question_id, mark, choice_id, is_correct in Question.objects.values_list(
+        "id", "mark", "choices__id", "choices__is_correct"
+    ).iterator(chunk_size=2000):
+        _, choices = answer_key.setdefault(question_id, (mark, {}))
+        if choice_id is not None:
+            choices[choice_id] = is_correct
+
+    question_stats, choice_picks = {}, {}
+    session_ids = list(ExamSession.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(session_ids), 1000):
+        chunk = session_ids[start : start + 1000]
+        scores = dict(
+            ExamSession.objects.filter(id__in=chunk).values_list("id", "score")
+        )
+        questions = {pk: [] for pk in chunk}
+        selected = {pk: {} for pk in chunk}
+        for session_id, question_id in Through.objects.filter(
+            examsession_id__in=chunk
+        ).values_list("examsession_id", "question_id"):
+            questions[session_id].append(question_id)
+        for session_id, question_id, choice_id in StudentAnswer.objects.filter(
+            exam_session_id__in=chunk
+        ).values_list("exam_session_id", "question_id", "selected_choice_id"):
+            selected[session_id][question_id] = choice_id
+
+        for session_id in chunk:
+            question_ids = [
+                pk
+                for pk in dict.fromkeys(
+                    questions[session_id] + list(selected[session_id])
+                )
+                if pk in answer_key
+            ]
+            total = sum(answer_key[pk][0] for pk in question_ids)
+            fraction = scores[session_id] / total if total else 0.0
+            for pk in question_ids:
+                stats = question_stats.get(pk)
+                if stats is None:
+                    stats = question_stats[pk] = QuestionStatistics(question_id=pk)
+                stats.attempts += 1
+                stats.score_sum += fraction
+                stats.score_sq_sum += fraction * fraction
+                choice_id = selected[session_id].get(pk)
+                if choice_id is None:
+                    stats.skipped += 1
+                    continue
+                choice_picks[choice_id] = choice_picks.get(choice_id, 0) + 1
+                if answer_key[pk][1].get(choice_id):
+                    stats.correct += 1
+                    stats.correct_score_sum += fraction
+
+    QuestionStatistics.objects.bulk_create(question_stats.values(), batch_size=1000)
+    ChoiceStatistics.objects.bulk_create(
+        [
+            ChoiceStatistics(choice_id=pk, picks=picks)
+            for pk, picks in choice_picks.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_question_duplicate_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChoiceStatistics",
+            fields=[
+                (
+                    "choice",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="statistics",
+                        serialize=False,
+                        to="api.choice",
+                    ),
+                ),
+                ("picks", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="QuestionStatistics",
+            fields=[
+                (
+                    "question",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="statistics",
+                        serialize=False,
+                        to="api.question",
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("correct", models.PositiveIntegerField(default=0)),
+                ("skipped", models.PositiveIntegerField(default=0)),
+                ("score_sum", models.FloatField(default=0)),
+                ("score_sq_sum", models.FloatField(default=0)),
+                ("correct_score_sum", models.FloatField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_statistics, migrations.RunPython.noop),
+    ]
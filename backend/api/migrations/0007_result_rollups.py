@@ -0,0 +1,131 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    # A frozen copy of api.rollups.rebuild_rollups as of this migration.
+    ExamSession = apps.get_model("api", "ExamSession")
+    ResultRollup = apps.get_model("api", "ResultRollup")
+    Through = ExamSession.questions.through
+    bins = settings.RESULT_HISTOGRAM_BINS
+
+    rollups = {}
+    session_ids = list(ExamSession.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(session_ids), 1000):
+        chunk = session_ids[start : start + 1000]
+        totals = dict.fromkeys(chunk, 0)
+        for session_id, mark in Through.objects.filter(
+            examsession_id__in=chunk
+        ).values_list("examsession_id", "question__mark"):
+            totals[session_id] += mark
+        rows = (
+            ExamSession.objects.filter(id__in=chunk)
+            .order_by("id")
+            .values_list(
+                "id",
+                "student_id",
+                "student__username",
+                "specialization_id",
+                "admin_exam_definition_id",
+                "admin_exam_definition__passingGradePercent",
+                "score",
+            )
+        )
+        for (
+            session_id,
+            student_id,
+            username,
+            specialization_id,
+            definition_id,
+            passing,
+            score,
+        ) in rows:
+            total = totals[session_id]
+            percent = 100.0 * score / total if total else 0.0
+            entry = {
+                "session": session_id,
+                "student": student_id,
+                "username": username,
+                "score": score,
+                "percent": round(percent, 2),
+            }
+            percent = min(max(percent, 0.0), 100.0)
+            scopes = [("specialization", specialization_id)]
+            if definition_id is not None:
+                scopes.append(("definition", definition_id))
+            for scope, pk in scopes:
+                rollup = rollups.get((scope, pk))
+                if rollup is None:
+                    rollup = rollups[(scope, pk)] = ResultRollup(
+                        scope=scope, object_id=pk, histogram=[0] * bins, leaderboard=[]
+                    )
+                rollup.count += 1
+                rollup.score_sum += percent
+                rollup.score_sq_sum += percent * percent
+                if passing is not None and percent >= passing:
+                    rollup.pass_count += 1
+                rollup.histogram[min(int(percent * bins / 100), bins - 1)] += 1
+                # Each student's best attempt; earlier sessions win ties.
+                board = rollup.leaderboard
+                previous = next((e for e in board if e["student"] == student_id), None)
+                if previous is not None:
+                    if previous["percent"] >= entry["percent"]:
+                        continue
+                    board.remove(previous)
+                board.append(dict(entry))
+                board.sort(key=lambda e: (-e["percent"], e["session"]))
+                del board[settings.RESULT_LEADERBOARD_SIZE :]
+
+    ResultRollup.objects.bulk_create(rollups.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_item_statistics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResultRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[
+                            ("definition", "Exam definition"),
+                            ("specialization", "Specialization"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("score_sum", models.FloatField(default=0)),
+                ("score_sq_sum", models.FloatField(default=0)),
+                ("pass_count", models.PositiveIntegerField(default=0)),
+                ("histogram", models.JSONField(default=list)),
+                ("leaderboard", models.JSONField(default=list)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "object_id"),
+                        name="result_rollup_scope_object_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
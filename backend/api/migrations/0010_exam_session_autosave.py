@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_background_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="examsession",
+            name="saved_revision",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="examsession",
+            name="started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="examsession",
+            name="status",
+            field=models.CharField(
+                choices=[("in_progress", "In progress"), ("completed", "Completed")],
+                default="completed",
+                max_length=11,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="examsession",
+            name="completed_at",
+            field=models.DateTimeField(
+                blank=True, default=django.utils.timezone.now, null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="examsession",
+            name="score",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="examsession",
+            index=models.Index(
+                condition=models.Q(("status", "in_progress")),
+                fields=["student", "id"],
+                name="session_in_progress_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="studentanswer",
+            constraint=models.UniqueConstraint(
+                fields=("exam_session", "question"),
+                name="answer_session_question_unique",
+            ),
+        ),
+    ]
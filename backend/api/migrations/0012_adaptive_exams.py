@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_exam_paper_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ItemCalibration",
+            fields=[
+                (
+                    "question",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="calibration",
+                        serialize=False,
+                        to="api.question",
+                    ),
+                ),
+                ("difficulty", models.FloatField()),
+                ("responses", models.PositiveIntegerField()),
+                ("calibrated_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="AdaptiveState",
+            fields=[
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="adaptive",
+                        serialize=False,
+                        to="api.examsession",
+                    ),
+                ),
+                ("ability", models.FloatField(default=0.0)),
+                ("precision", models.FloatField(default=1.0)),
+                ("length", models.PositiveIntegerField()),
+                ("answered", models.PositiveIntegerField(default=0)),
+                ("current_difficulty", models.FloatField(blank=True, null=True)),
+                (
+                    "current_question",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="api.question",
+                    ),
+                ),
+            ],
+        ),
+    ]
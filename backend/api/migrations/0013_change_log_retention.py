@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_adaptive_exams"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLogPrune",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("through_id", models.BigIntegerField()),
+                ("pruned_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="changelogentry",
+            index=models.Index(
+                fields=["entity", "object_id", "id"], name="changelog_object_seq_idx"
+            ),
+        ),
+    ]
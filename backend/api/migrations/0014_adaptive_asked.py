@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+def backfill_asked(apps, schema_editor):
+    AdaptiveState = apps.get_model("api", "AdaptiveState")
+    Through = apps.get_model("api", "ExamSession").questions.through
+    states = list(AdaptiveState.objects.all())
+    asked = {}
+    for session_id, question_id in (
+        Through.objects.filter(
+            examsession_id__in=[state.session_id for state in states],
+        )
+        .order_by("id")
+        .values_list("examsession_id", "question_id")
+    ):
+        asked.setdefault(session_id, []).append(question_id)
+    for state in states:
+        state.asked = asked.get(state.session_id, [])
+    AdaptiveState.objects.bulk_update(states, ["asked"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_change_log_retention"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="adaptivestate",
+            name="asked",
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(backfill_asked, migrations.RunPython.noop),
+    ]
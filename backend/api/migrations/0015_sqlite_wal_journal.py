@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    # The journal mode is stored in the database file, so it is set once here
+    # rather than on every connection; it cannot change inside a transaction.
+    if schema_editor.connection.vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode = WAL")
+
+
+def disable_wal(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode = DELETE")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("api", "0014_adaptive_asked"),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, disable_wal, elidable=True),
+    ]
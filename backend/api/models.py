@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 # Independent Models
 class User(AbstractUser):
@@ -30,6 +31,12 @@ class Question(models.Model):
     mark = models.IntegerField()
     is_ai_generated = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['specialization', 'course_year', 'is_ai_generated', 'id'], name='question_spec_year_ai_idx'),
+            models.Index(fields=['is_ai_generated', 'id'], name='question_ai_idx'),
+        ]
+
     def __str__(self):
         return self.text[:50]
 
@@ -41,6 +48,22 @@ class Choice(models.Model):
     def __str__(self):
         return self.text
 
+class Blob(models.Model):
+    """
+    A stored file named by the SHA-256 of its content, shared by every
+    attachment with the same bytes. Deleted once ref_count drops to zero.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100)
+    ref_count = models.PositiveIntegerField(default=0)
+    thumbnail = models.FileField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
 class Attachment(models.Model):
     ATTACHMENT_TYPE_CHOICES = (
         ('image', 'Image'),
@@ -53,6 +76,7 @@ class Attachment(models.Model):
     file = models.FileField(upload_to='attachments/', blank=True, null=True)
     content = models.TextField(blank=True, null=True)
     file_name = models.CharField(max_length=255, blank=True, null=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='attachments')
 
     def __str__(self):
         return self.file_name or f"{self.attachment_type} for {self.question.id}"
@@ -73,15 +97,59 @@ class AdminExamDefinition(models.Model):
     def __str__(self):
         return self.name
 
+class ExamPaperVariant(models.Model):
+    """
+    A pre-built paper for an exam definition: its questions and each
+    question's choices in one shuffled order. Exam start hands the variants
+    out in turn (see api/papers.py).
+    """
+    definition = models.ForeignKey(AdminExamDefinition, on_delete=models.CASCADE, related_name='paper_variants')
+    number = models.PositiveIntegerField()
+    # [[question_id, [choice_id, ...]], ...] in presentation order.
+    layout = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['definition', 'number'], name='paper_variant_number_unique'),
+        ]
+
+    def __str__(self):
+        return f"Variant {self.number} of {self.definition.name}"
+
 class ExamSession(models.Model):
+    """
+    A submitted exam, or one still being taken: an in-progress session has no
+    score or completion time yet, and its answers are autosaved (see
+    api/autosave.py) until the student submits it.
+    """
+    STATUS_CHOICES = (
+        ('in_progress', 'In progress'),
+        ('completed', 'Completed'),
+    )
     student = models.ForeignKey(User, on_delete=models.CASCADE)
     admin_exam_definition = models.ForeignKey(AdminExamDefinition, on_delete=models.CASCADE, null=True, blank=True)
     specialization = models.ForeignKey(Specialization, on_delete=models.CASCADE)
     exam_name = models.CharField(max_length=255)
-    score = models.IntegerField()
-    completed_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=11, choices=STATUS_CHOICES, default='completed')
+    score = models.IntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(default=timezone.now, null=True, blank=True)
+    # Autosave revision last written to StudentAnswer.
+    saved_revision = models.BigIntegerField(default=0)
     questions = models.ManyToManyField(Question)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', '-completed_at', '-id'], name='session_student_completed_idx'),
+            models.Index(fields=['specialization', '-completed_at', '-id'], name='session_spec_completed_idx'),
+            models.Index(fields=['-completed_at', '-id'], name='session_completed_idx'),
+            # Only sessions still being taken, which the autosave flush scans.
+            models.Index(
+                fields=['student', 'id'], condition=models.Q(status='in_progress'), name='session_in_progress_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Exam for {self.student.username} on {self.exam_name}"
 
@@ -90,5 +158,164 @@ class StudentAnswer(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     selected_choice = models.ForeignKey(Choice, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['exam_session', 'question'], name='answer_session_question_unique'),
+        ]
+
+    def __str__(self):
+        return f"Answer by {self.exam_session.student.username} for question {self.question.id}"
+
+class AdaptiveState(models.Model):
+    """
+    Where an adaptive exam session stands: the student's ability estimate, as
+    the mean and precision of a normal distribution on the Rasch scale, and
+    the question awaiting an answer (see api/adaptive.py).
+    """
+    session = models.OneToOneField(ExamSession, on_delete=models.CASCADE, primary_key=True, related_name='adaptive')
+    ability = models.FloatField(default=0.0)
+    precision = models.FloatField(default=1.0)
+    length = models.PositiveIntegerField()
+    answered = models.PositiveIntegerField(default=0)
+    # None once the exam has asked its last question.
+    current_question = models.ForeignKey(Question, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    current_difficulty = models.FloatField(null=True, blank=True)
+    # Question ids in the order they were asked, so picking the next needs no query.
+    asked = models.JSONField(default=list)
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only journal of writes to the question bank and exam definitions.
+    The auto-incrementing id is the change sequence clients sync from; rows
+    with deleted=True are tombstones.
+    """
+    ENTITY_CHOICES = (
+        ('question', 'Question'),
+        ('exam_definition', 'Exam definition'),
+    )
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField()
+    specialization_id = models.BigIntegerField(null=True, blank=True)
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['specialization_id', 'id'], name='changelog_spec_seq_idx'),
+            # Finds the entries a later one supersedes, for compaction.
+            models.Index(fields=['entity', 'object_id', 'id'], name='changelog_object_seq_idx'),
+        ]
+
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f"{self.entity} {self.object_id} {action} (#{self.id})"
+
+class ChangeLogPrune(models.Model):
+    """
+    A prune of the change journal: entries up to through_id are gone, so
+    clients holding an older cursor must load the bank afresh.
+    """
+    through_id = models.BigIntegerField()
+    pruned_at = models.DateTimeField(auto_now_add=True)
+
+class QuestionSignature(models.Model):
+    """MinHash signature of a question's normalized text and choices."""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    minhash = models.BinaryField()
+
+class QuestionLSHBucket(models.Model):
+    """One LSH band of a signature; questions sharing a key are duplicate candidates."""
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='lsh_buckets')
+    key = models.BigIntegerField(db_index=True)
+
+class QuestionStatistics(models.Model):
+    """
+    Running sums over every graded attempt at a question, updated on each
+    submission. Scores are session score as a fraction of the session's
+    total marks; rates and discrimination are derived from the sums on read.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    attempts = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_sq_sum = models.FloatField(default=0)
+    correct_score_sum = models.FloatField(default=0)
+
+class ItemCalibration(models.Model):
+    """
+    Rasch difficulty of a question, fitted offline from the stored answers by
+    "manage.py calibrate_items". Higher is harder; 0 is average.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='calibration')
+    difficulty = models.FloatField()
+    responses = models.PositiveIntegerField()
+    calibrated_at = models.DateTimeField()
+
+class ChoiceStatistics(models.Model):
+    choice = models.OneToOneField(Choice, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    picks = models.PositiveIntegerField(default=0)
+
+class ResultRollup(models.Model):
+    """
+    Running aggregates of session results for one exam definition or one
+    specialization, maintained as sessions are submitted. Scores are
+    percentages of the marks available in each session.
+    """
+    SCOPE_CHOICES = (
+        ('definition', 'Exam definition'),
+        ('specialization', 'Specialization'),
+    )
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    object_id = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_sq_sum = models.FloatField(default=0)
+    pass_count = models.PositiveIntegerField(default=0)
+    histogram = models.JSONField(default=list)
+    leaderboard = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'object_id'], name='result_rollup_scope_object_uniq'),
+        ]
+
+class Job(models.Model):
+    """
+    Background work run by the run_worker command (see api/jobs.py). Workers
+    claim queued jobs whose run_after has passed and hold them for a lease
+    that progress reports renew; a running job whose lease ran out belonged
+    to a worker that died and is claimed again.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    )
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    progress = models.FloatField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+            models.Index(fields=['created_by', '-id'], name='job_owner_idx'),
+        ]
+
     def __str__(self):
-        return f"Answer by {self.exam_session.student.username} for question {self.question.id}"
\ No newline at end of file
+        return f"{self.kind} job {self.id} ({self.status})"
@@ -0,0 +1,33 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class QuestionCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'id'
+
+
+class ExamSessionCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-completed_at', '-id')
+
+
+class QuestionSearchPagination(LimitOffsetPagination):
+    """Pages over the bounded, ranked id list returned by the search index."""
+    default_limit = 50
+    max_limit = 200
+
+
+class ItemStatisticsPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 200
+
+
+class JobCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
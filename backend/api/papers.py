@@ -0,0 +1,168 @@
+import random
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .fastpath import question_rows
+from .models import AdminExamDefinition, Question, Choice, ExamPaperVariant
+from .renderers import render_json
+from .sampling import get_question_pool
+from .snapshots import get_bank_version
+
+PAPER_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def _variants_key(definition_id):
+    return f'exam-paper:variants:{definition_id}'
+
+
+def _turn_key(definition_id):
+    return f'exam-paper:turn:{definition_id}'
+
+
+def _paper_key(variant_id, bank_version):
+    return f'exam-paper:body:{variant_id}:{bank_version}'
+
+
+def _draw_questions(definition, question_ids, num_questions, course_year, rng):
+    if question_ids is not None:
+        question_ids = list(dict.fromkeys(question_ids))
+        known = set(Question.objects.filter(
+            id__in=question_ids, specialization_id=definition.specialization_id,
+        ).values_list('id', flat=True))
+        missing = [pk for pk in question_ids if pk not in known]
+        if missing:
+            raise ValidationError({'question_ids': [f'Not questions of the exam specialization: {missing}']})
+        return question_ids
+    if course_year is not None:
+        pool = get_question_pool(definition.specialization_id, course_year)
+    else:
+        pool = list(Question.objects.filter(
+            specialization_id=definition.specialization_id, is_ai_generated=False,
+        ).values_list('id', flat=True))
+    if not pool:
+        raise ValidationError({'num_questions': ['There are no questions to draw from.']})
+    return rng.sample(pool, min(num_questions, len(pool)))
+
+
+def build_variants(definition, count, question_ids=None, num_questions=None, course_year=None, seed=None):
+    """
+    Replace the definition's paper variants with `count` new ones over the
+    same questions: `question_ids`, or `num_questions` non-AI questions drawn
+    from the definition's specialization (and course year). Every variant
+    shuffles the question order and each question's choice order. The
+    papers are rendered into the cache once the transaction commits, ahead of
+    the students starting the exam.
+    """
+    rng = random.Random(seed)
+    question_ids = _draw_questions(definition, question_ids, num_questions, course_year, rng)
+    choices = {pk: [] for pk in question_ids}
+    for question_id, choice_id in Choice.objects.filter(question_id__in=question_ids).order_by('id').values_list(
+        'question_id', 'id'
+    ):
+        choices[question_id].append(choice_id)
+    variants = [
+        ExamPaperVariant(definition=definition, number=number, layout=[
+            [pk, rng.sample(choices[pk], len(choices[pk]))] for pk in rng.sample(question_ids, len(question_ids))
+        ])
+        for number in range(1, count + 1)
+    ]
+    with transaction.atomic():
+        ExamPaperVariant.objects.filter(definition=definition).delete()
+        ExamPaperVariant.objects.bulk_create(variants)
+        transaction.on_commit(lambda: warm_papers(definition.pk))
+    return variants
+
+
+def render_paper(definition_id, number, layout, questions):
+    """
+    Rendered JSON of one variant, given {question_id: build_questions dict}.
+    Questions deleted since the variant was built are left out; choices
+    added since come after the shuffled ones.
+    """
+    paper = []
+    for question_id, choice_order in layout:
+        question = questions.get(question_id)
+        if question is None:
+            continue
+        position = {pk: index for index, pk in enumerate(choice_order)}
+        paper.append({
+            **question,
+            'choices': sorted(question['choices'], key=lambda choice: position.get(choice['id'], len(position))),
+        })
+    return render_json({'definition': definition_id, 'variant': number, 'questions': paper})
+
+
+def _render_variants(definition_id, version, variants):
+    question_ids = list(dict.fromkeys(pk for _, _, layout in variants for pk, _ in layout))
+    questions = {question['id']: question for question in question_rows(question_ids)}
+    return {
+        _paper_key(variant_id, version): render_paper(definition_id, number, layout, questions)
+        for variant_id, number, layout in variants
+    }
+
+
+def warm_papers(definition_id):
+    """
+    Render every variant of the definition into the cache with one batch of
+    queries, and cache the list that exam start picks from. Returns that
+    list, (specialization_id, [variant ids]), or None for an unknown
+    definition.
+    """
+    specialization_id = AdminExamDefinition.objects.filter(pk=definition_id).values_list(
+        'specialization_id', flat=True
+    ).first()
+    if specialization_id is None:
+        return None
+    variants = list(ExamPaperVariant.objects.filter(definition_id=definition_id).order_by('number').values_list(
+        'id', 'number', 'layout'
+    ))
+    if variants:
+        version = get_bank_version(specialization_id)
+        cache.set_many(_render_variants(definition_id, version, variants), PAPER_TIMEOUT)
+    entry = (specialization_id, [variant_id for variant_id, _, _ in variants])
+    cache.set(_variants_key(definition_id), entry, None)
+    return entry
+
+
+def forget_papers(definition_id):
+    cache.delete(_variants_key(definition_id))
+
+
+def _next_turn(definition_id, count):
+    key = _turn_key(definition_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Start each process's round at a random variant, so they do not all begin with the first.
+        cache.add(key, random.randrange(count), None)
+        return cache.incr(key)
+
+
+def assign_paper(definition_id):
+    """
+    The next paper of the definition, handing its variants out round-robin,
+    as rendered JSON; None when it has no variants. Once warm this is four
+    cache reads and no query or serialization. A paper whose questions were
+    edited since it was rendered is rendered again on first use.
+    """
+    entry = cache.get(_variants_key(definition_id))
+    if entry is None:
+        entry = warm_papers(definition_id)
+    if entry is None or not entry[1]:
+        return None
+    specialization_id, variant_ids = entry
+    variant_id = variant_ids[_next_turn(definition_id, len(variant_ids)) % len(variant_ids)]
+    version = get_bank_version(specialization_id)
+    body = cache.get(_paper_key(variant_id, version))
+    if body is None:
+        variants = list(ExamPaperVariant.objects.filter(pk=variant_id).values_list('id', 'number', 'layout'))
+        if not variants:
+            # Rebuilt or deleted since the list was cached.
+            forget_papers(definition_id)
+            return assign_paper(definition_id)
+        rendered = _render_variants(definition_id, version, variants)
+        cache.set_many(rendered, PAPER_TIMEOUT)
+        body = rendered[_paper_key(variant_id, version)]
+    return body
@@ -0,0 +1,84 @@
+from django.db.models import F, FloatField, Prefetch
+from django.db.models.functions import Cast
+
+from .models import Question, Choice, Attachment, ExamSession, StudentAnswer, QuestionStatistics
+
+QUESTION_COLUMNS = {'text', 'specialization', 'course_year', 'mark', 'is_ai_generated'}
+ATTACHMENT_SUMMARY_COLUMNS = ['id', 'question', 'attachment_type', 'file_name', 'blob__thumbnail']
+SESSION_COLUMNS = {'student', 'specialization', 'admin_exam_definition', 'exam_name', 'score'}
+SESSION_RELATIONS = ['student', 'specialization', 'admin_exam_definition']
+
+
+def question_read_queryset():
+    """
+    Questions with their choices and attachments prefetched, as nested by
+    QuestionSerializer.
+    """
+    return Question.objects.prefetch_related(
+        Prefetch('choices', queryset=Choice.objects.order_by('id')),
+        Prefetch('attachments', queryset=Attachment.objects.select_related('blob').order_by('id')),
+    )
+
+
+def question_list_queryset(fields=None, expand=()):
+    """
+    Questions for listings: only the requested columns, and attachments
+    without their inline content unless expanded.
+    """
+    queryset = Question.objects.all()
+    if fields is not None:
+        queryset = queryset.only('id', *(fields & QUESTION_COLUMNS))
+    if fields is None or 'choices' in fields:
+        queryset = queryset.prefetch_related(Prefetch('choices', queryset=Choice.objects.order_by('id')))
+    if fields is None or 'attachments' in fields:
+        attachments = Attachment.objects.select_related('blob').order_by('id')
+        if 'attachments' not in expand:
+            attachments = attachments.only(*ATTACHMENT_SUMMARY_COLUMNS)
+        queryset = queryset.prefetch_related(Prefetch('attachments', queryset=attachments))
+    return queryset
+
+
+def exam_session_read_queryset():
+    """
+    Exam sessions with every relation nested by ExamSessionSerializer loaded
+    up front, so the query count does not grow with the number of rows.
+    """
+    return ExamSession.objects.select_related(
+        'student', 'specialization', 'admin_exam_definition'
+    ).prefetch_related(
+        Prefetch('answers', queryset=StudentAnswer.objects.order_by('id')),
+        Prefetch('questions', queryset=question_read_queryset().order_by('id')),
+    )
+
+
+def exam_session_list_queryset(fields=None, expand=()):
+    """
+    Sessions for listings: related rows are loaded only when expanded, and
+    only the requested columns are read.
+    """
+    def wanted(name):
+        return fields is None or name in fields
+
+    queryset = ExamSession.objects.all()
+    related = [name for name in SESSION_RELATIONS if name in expand and wanted(name)]
+    if related:
+        queryset = queryset.select_related(*related)
+    if fields is not None:
+        queryset = queryset.only('id', 'completed_at', *(fields & SESSION_COLUMNS), *related)
+    if 'answers' in expand and wanted('answers'):
+        queryset = queryset.prefetch_related(Prefetch('answers', queryset=StudentAnswer.objects.order_by('id')))
+    if 'questions' in expand and wanted('questions'):
+        queryset = queryset.prefetch_related(Prefetch('questions', queryset=question_read_queryset().order_by('id')))
+    return queryset
+
+
+def item_statistics_queryset():
+    """
+    Question statistics with the question and each choice's pick count
+    loaded up front; correct_rate is annotated so listings can sort on it.
+    """
+    return QuestionStatistics.objects.select_related('question').prefetch_related(
+        Prefetch('question__choices', queryset=Choice.objects.select_related('statistics').order_by('id')),
+    ).annotate(
+        correct_rate=Cast(F('correct'), FloatField()) / Cast(F('attempts'), FloatField()),
+    )
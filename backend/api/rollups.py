@@ -0,0 +1,150 @@
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .db import lock_statistics
+from .models import ExamSession, ResultRollup
+
+ROLLUP_FIELDS = ['count', 'score_sum', 'score_sq_sum', 'pass_count', 'histogram', 'leaderboard']
+
+
+def score_percent(score, total_marks):
+    return 100.0 * score / total_marks if total_marks else 0.0
+
+
+def result_entry(session_id, student_id, username, score, percent):
+    return {
+        'session': session_id,
+        'student': student_id,
+        'username': username,
+        'score': score,
+        'percent': round(percent, 2),
+    }
+
+
+def apply_result(rollup, entry, percent, passing_percent):
+    """
+    Fold one session result into a rollup in memory. The leaderboard keeps
+    each student's best attempt; earlier sessions win ties.
+    """
+    bins = settings.RESULT_HISTOGRAM_BINS
+    percent = min(max(percent, 0.0), 100.0)
+    rollup.count += 1
+    rollup.score_sum += percent
+    rollup.score_sq_sum += percent * percent
+    if passing_percent is not None and percent >= passing_percent:
+        rollup.pass_count += 1
+    if len(rollup.histogram) != bins:
+        rollup.histogram = [0] * bins
+    rollup.histogram[min(int(percent * bins / 100), bins - 1)] += 1
+
+    board = rollup.leaderboard
+    previous = next((e for e in board if e['student'] == entry['student']), None)
+    if previous is not None:
+        if previous['percent'] >= entry['percent']:
+            return
+        board.remove(previous)
+    board.append(entry)
+    board.sort(key=lambda e: (-e['percent'], e['session']))
+    del board[settings.RESULT_LEADERBOARD_SIZE:]
+
+
+def _scopes(specialization_id, definition_id):
+    scopes = [('specialization', specialization_id)]
+    if definition_id is not None:
+        scopes.append(('definition', definition_id))
+    return scopes
+
+
+def record_session_result(session, username, total_marks, passing_percent):
+    """
+    Fold a newly created session into its specialization and definition
+    rollups. The rows are locked for the read-modify-write, so call inside
+    the submission transaction; it waits for a running rebuild_rollups. The
+    cost is three queries, plus the shared lock on PostgreSQL.
+    """
+    lock_statistics(shared=True)
+    scopes = _scopes(session.specialization_id, session.admin_exam_definition_id)
+    ResultRollup.objects.bulk_create(
+        [ResultRollup(scope=scope, object_id=pk) for scope, pk in scopes], ignore_conflicts=True,
+    )
+    condition = Q()
+    for scope, pk in scopes:
+        condition |= Q(scope=scope, object_id=pk)
+    rollups = list(ResultRollup.objects.select_for_update().filter(condition).order_by('id'))
+    percent = score_percent(session.score, total_marks)
+    entry = result_entry(session.pk, session.student_id, username, session.score, percent)
+    for rollup in rollups:
+        apply_result(rollup, entry, percent, passing_percent)
+    ResultRollup.objects.bulk_update(rollups, ROLLUP_FIELDS)
+
+
+def summarize(rollup):
+    """Dashboard view of a rollup; an absent rollup reads as no results."""
+    bins = settings.RESULT_HISTOGRAM_BINS
+    if rollup is None:
+        rollup = ResultRollup(histogram=[0] * bins)
+    count = rollup.count
+    mean = rollup.score_sum / count if count else None
+    stddev = math.sqrt(max(rollup.score_sq_sum / count - mean * mean, 0.0)) if count else None
+    histogram = rollup.histogram or [0] * bins
+    width = 100 / len(histogram)
+    return {
+        'count': count,
+        'mean_percent': mean,
+        'stddev_percent': stddev,
+        'pass_count': rollup.pass_count,
+        'pass_rate': rollup.pass_count / count if count else None,
+        'histogram': [
+            {'from': round(i * width, 2), 'to': round((i + 1) * width, 2), 'count': n}
+            for i, n in enumerate(histogram)
+        ],
+        'leaderboard': rollup.leaderboard,
+    }
+
+
+def get_summary(scope, object_id):
+    return summarize(ResultRollup.objects.filter(scope=scope, object_id=object_id).first())
+
+
+def rebuild_rollups(chunk_size=1000):
+    """
+    Recompute every rollup from the stored sessions, in session order so
+    leaderboard ties resolve as they did live. Scan and swap run in one
+    transaction holding the statistics lock, so no submission lands in between
+    and is lost. Returns the number of sessions.
+    """
+    with transaction.atomic():
+        lock_statistics()
+        return _rebuild_rollups(chunk_size)
+
+
+def _rebuild_rollups(chunk_size):
+    rollups = {}
+    Through = ExamSession.questions.through
+    session_ids = list(ExamSession.objects.filter(status='completed').order_by('id').values_list('id', flat=True))
+    for start in range(0, len(session_ids), chunk_size):
+        chunk = session_ids[start:start + chunk_size]
+        totals = dict.fromkeys(chunk, 0)
+        for session_id, mark in Through.objects.filter(examsession_id__in=chunk).values_list(
+            'examsession_id', 'question__mark'
+        ):
+            totals[session_id] += mark
+        rows = ExamSession.objects.filter(id__in=chunk).order_by('id').values_list(
+            'id', 'student_id', 'student__username', 'specialization_id', 'admin_exam_definition_id',
+            'admin_exam_definition__passingGradePercent', 'score',
+        )
+        for session_id, student_id, username, specialization_id, definition_id, passing, score in rows:
+            percent = score_percent(score, totals[session_id])
+            entry = result_entry(session_id, student_id, username, score, percent)
+            for scope, pk in _scopes(specialization_id, definition_id):
+                rollup = rollups.get((scope, pk))
+                if rollup is None:
+                    rollup = rollups[(scope, pk)] = ResultRollup(scope=scope, object_id=pk)
+                apply_result(rollup, entry, percent, passing)
+
+    ResultRollup.objects.all().delete()
+    ResultRollup.objects.bulk_create(rollups.values(), batch_size=chunk_size)
+    return len(session_ids)
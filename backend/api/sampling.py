@@ -0,0 +1,55 @@
+import random
+
+from django.core.cache import cache
+
+from .models import Question
+
+POOL_VERSION_KEY = 'question-pool:version'
+POOL_TIMEOUT = 60 * 60
+
+
+def _pool_version():
+    version = cache.get(POOL_VERSION_KEY)
+    if version is None:
+        cache.add(POOL_VERSION_KEY, 1, None)
+        version = cache.get(POOL_VERSION_KEY, 1)
+    return version
+
+
+def _pool_key(specialization_id, course_year):
+    return f'question-pool:{_pool_version()}:{specialization_id}:{course_year}'
+
+
+def invalidate_question_pools():
+    """
+    Drop every cached pool. Called once any Question write commits, since a
+    save may move a question between pools.
+    """
+    try:
+        cache.incr(POOL_VERSION_KEY)
+    except ValueError:
+        cache.add(POOL_VERSION_KEY, 1, None)
+
+
+def get_question_pool(specialization_id, course_year, refresh=False):
+    """
+    Ids of the non-AI questions for a specialization and course year, loaded
+    once with a single index-only query and then served from the cache.
+    """
+    key = _pool_key(specialization_id, course_year)
+    pool = None if refresh else cache.get(key)
+    if pool is None:
+        pool = list(
+            Question.objects.filter(
+                specialization_id=specialization_id,
+                course_year=course_year,
+                is_ai_generated=False,
+            ).values_list('id', flat=True)
+        )
+        cache.set(key, pool, POOL_TIMEOUT)
+    return pool
+
+
+def sample_question_ids(specialization_id, course_year, num_questions, refresh=False):
+    pool = get_question_pool(specialization_id, course_year, refresh=refresh)
+    return random.sample(pool, min(num_questions, len(pool)))
@@ -0,0 +1,171 @@
+import re
+
+from django.db import connection, transaction
+
+from .models import Question, Choice, Attachment
+
+SEARCH_TABLE = 'api_question_search'
+SEARCH_RESULT_LIMIT = 1000
+
+# Harakat, Quranic annotation marks, superscript alef and tatweel.
+_ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_ARABIC_LETTERS = str.maketrans({
+    '\u0622': '\u0627',  # alef with madda -> alef
+    '\u0623': '\u0627',  # alef with hamza above -> alef
+    '\u0625': '\u0627',  # alef with hamza below -> alef
+    '\u0671': '\u0627',  # alef wasla -> alef
+    '\u0649': '\u064a',  # alef maksura -> yeh
+    '\u0629': '\u0647',  # teh marbuta -> heh
+})
+_TOKEN = re.compile(r'\w+')
+
+
+def normalize(text):
+    """
+    Fold text for indexing and querying: strip Arabic diacritics and tatweel,
+    unify alef/yeh/teh marbuta variants and lowercase Latin.
+    """
+    if not text:
+        return ''
+    return _ARABIC_DIACRITICS.sub('', text).translate(_ARABIC_LETTERS).lower()
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+
+def build_documents(question_ids):
+    """
+    Searchable body for each question: its text, choice texts and attachment
+    content and file names, normalized. Three queries per batch.
+    """
+    parts = {pk: [text] for pk, text in Question.objects.filter(id__in=question_ids).values_list('id', 'text')}
+    for question_id, text in Choice.objects.filter(question_id__in=parts).values_list('question_id', 'text'):
+        parts[question_id].append(text)
+    attachments = Attachment.objects.filter(question_id__in=parts).values_list('question_id', 'content', 'file_name')
+    for question_id, content, file_name in attachments:
+        parts[question_id].extend(filter(None, (content, file_name)))
+    return {pk: normalize('\n'.join(texts)) for pk, texts in parts.items()}
+
+
+class SQLiteSearchBackend:
+    """FTS5 virtual table keyed by rowid = question id, ranked with bm25."""
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5(body, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def delete(self, cursor, question_ids):
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(pk,) for pk in question_ids])
+
+    def insert(self, cursor, documents):
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, body) VALUES (%s, %s)', list(documents.items())
+        )
+
+    def search(self, cursor, tokens, limit):
+        expression = ' '.join(f'"{token}"*' for token in tokens)
+        cursor.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s ORDER BY rank LIMIT %s',
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    """tsvector column with a GIN index, ranked with ts_rank_cd."""
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            f'question_id bigint PRIMARY KEY REFERENCES api_question (id) ON DELETE CASCADE, '
+            f'document tsvector NOT NULL)'
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_gin ON {SEARCH_TABLE} USING gin (document)')
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def delete(self, cursor, question_ids):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE question_id = ANY(%s)', [list(question_ids)])
+
+    def insert(self, cursor, documents):
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (question_id, document) VALUES (%s, to_tsvector('simple', %s))",
+            list(documents.items()),
+        )
+
+    def search(self, cursor, tokens, limit):
+        expression = ' & '.join(f'{token}:*' for token in tokens)
+        cursor.execute(
+            f"SELECT question_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+            f"WHERE document @@ query ORDER BY ts_rank_cd(document, query) DESC, question_id LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(conn=connection):
+    backend = BACKENDS.get(conn.vendor)
+    return backend() if backend else None
+
+
+def reindex_questions(question_ids):
+    """Replace the index entries of the given questions; deleted ones are dropped."""
+    backend = get_backend()
+    if backend is None or not question_ids:
+        return
+    question_ids = list(question_ids)
+    documents = build_documents(question_ids)
+    with connection.cursor() as cursor:
+        backend.delete(cursor, question_ids)
+        backend.insert(cursor, documents)
+
+
+def rebuild_index(chunk_size=1000):
+    """Drop and repopulate the whole index. Returns the number of questions indexed."""
+    backend = get_backend()
+    if backend is None:
+        return 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            backend.drop(cursor)
+            backend.create(cursor)
+        total = 0
+        ids = list(Question.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), chunk_size):
+            total += _insert_batch(backend, ids[start:start + chunk_size])
+    return total
+
+
+def _insert_batch(backend, question_ids):
+    documents = build_documents(question_ids)
+    with connection.cursor() as cursor:
+        backend.insert(cursor, documents)
+    return len(documents)
+
+
+def search_question_ids(query, limit=SEARCH_RESULT_LIMIT):
+    """
+    Question ids matching every word of the query (as prefixes), best match
+    first. Falls back to an unranked icontains scan on other databases.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    backend = get_backend()
+    if backend is None:
+        return list(Question.objects.filter(text__icontains=query).values_list('id', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        return backend.search(cursor, tokens, limit)
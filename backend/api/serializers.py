@@ -1,7 +1,16 @@
+from django.urls import reverse
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .authentication import add_user_claims, get_cached_user
+from .fieldsets import SparseFieldsMixin
+from .adaptive import standard_error
+from .item_stats import correct_rate, discrimination
 from .models import (
     User, Specialization, Question, Choice, Attachment, 
-    AdminExamDefinition, ExamSession, StudentAnswer, AISettings
+    AdminExamDefinition, ExamSession, StudentAnswer, AISettings, QuestionStatistics, Job, ExamPaperVariant,
+    AdaptiveState
 )
 
 class UserSerializer(serializers.ModelSerializer):
@@ -20,11 +29,28 @@ class ChoiceSerializer(serializers.ModelSerializer):
         fields = ['id', 'text', 'is_correct']
 
 class AttachmentSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+
     class Meta:
         model = Attachment
         fields = '__all__'
+        read_only_fields = ['blob']
+
+    def get_url(self, obj):
+        return reverse('blob', args=[obj.blob_id]) if obj.blob_id else None
+
+    def get_thumbnail_url(self, obj):
+        if obj.blob_id and obj.blob.thumbnail:
+            return reverse('blob-thumbnail', args=[obj.blob_id])
+        return None
+
+class AttachmentSummarySerializer(AttachmentSerializer):
+    """Attachment without its inline content, for listings."""
+    class Meta(AttachmentSerializer.Meta):
+        fields = ['id', 'question', 'attachment_type', 'file_name', 'url', 'thumbnail_url']
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     choices = ChoiceSerializer(many=True, read_only=True)
     attachments = AttachmentSerializer(many=True, read_only=True)
 
@@ -32,6 +58,11 @@ class QuestionSerializer(serializers.ModelSerializer):
         model = Question
         fields = ['id', 'text', 'specialization', 'course_year', 'mark', 'is_ai_generated', 'choices', 'attachments']
 
+class QuestionListSerializer(QuestionSerializer):
+    """Question listing; ?expand=attachments includes attachment content."""
+    attachments = AttachmentSummarySerializer(many=True, read_only=True)
+    expandable_fields = {'attachments': (AttachmentSerializer, {'many': True})}
+
 class AdminExamDefinitionSerializer(serializers.ModelSerializer):
     class Meta:
         model = AdminExamDefinition
@@ -42,7 +73,27 @@ class StudentAnswerSerializer(serializers.ModelSerializer):
         model = StudentAnswer
         fields = '__all__'
 
-class ExamSessionSerializer(serializers.ModelSerializer):
+class ExamPaperVariantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExamPaperVariant
+        fields = ['id', 'number', 'layout', 'created_at']
+
+class PaperVariantParamsSerializer(serializers.Serializer):
+    """Either question_ids, or num_questions to draw (optionally from one course_year)."""
+    count = serializers.IntegerField(min_value=1, max_value=500, default=20)
+    question_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, min_length=1, max_length=500,
+    )
+    num_questions = serializers.IntegerField(min_value=1, max_value=500, required=False)
+    course_year = serializers.IntegerField(required=False, allow_null=True, default=None)
+    seed = serializers.IntegerField(required=False, allow_null=True, default=None)
+
+    def validate(self, data):
+        if 'question_ids' not in data and 'num_questions' not in data:
+            raise serializers.ValidationError('Give either question_ids or num_questions.')
+        return data
+
+class ExamSessionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     answers = StudentAnswerSerializer(many=True, read_only=True)
     questions = QuestionSerializer(many=True, read_only=True)
     student = UserSerializer(read_only=True)
@@ -51,9 +102,174 @@ class ExamSessionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ExamSession
-        fields = '__all__'
+        fields = [
+            'id', 'answers', 'questions', 'student', 'specialization', 'admin_exam_definition',
+            'exam_name', 'score', 'completed_at',
+        ]
+
+class ExamSessionListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Session listing with related rows as ids. ?expand= nests student,
+    specialization, admin_exam_definition, answers or questions in full.
+    """
+    expandable_fields = {
+        'student': (UserSerializer, {}),
+        'specialization': (SpecializationSerializer, {}),
+        'admin_exam_definition': (AdminExamDefinitionSerializer, {}),
+        'answers': (StudentAnswerSerializer, {'many': True}),
+        'questions': (QuestionSerializer, {'many': True}),
+    }
+
+    class Meta:
+        model = ExamSession
+        fields = ['id', 'student', 'specialization', 'admin_exam_definition', 'exam_name', 'score', 'completed_at']
 
 class AISettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = AISettings
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class StartStandardExamSerializer(serializers.Serializer):
+    specialization_id = serializers.IntegerField()
+    course_year = serializers.IntegerField()
+    num_questions = serializers.IntegerField(min_value=1, max_value=500)
+
+class SubmittedQuestionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+
+class SubmittedAnswerSerializer(serializers.Serializer):
+    question_id = serializers.IntegerField()
+    selected_choice_id = serializers.IntegerField(allow_null=True, required=False, default=None)
+
+class SessionAnswersSerializer(serializers.Serializer):
+    answers = SubmittedAnswerSerializer(many=True, required=False, default=list, max_length=500)
+
+    def validate_answers(self, answers):
+        question_ids = [answer['question_id'] for answer in answers]
+        if len(question_ids) != len(set(question_ids)):
+            raise serializers.ValidationError('Each question may only be answered once.')
+        return answers
+
+class ExamSubmissionSerializer(SessionAnswersSerializer):
+    specialization_id = serializers.IntegerField()
+    admin_exam_definition_id = serializers.IntegerField(allow_null=True, required=False, default=None)
+    exam_name = serializers.CharField(max_length=255)
+    questions_in_session = SubmittedQuestionSerializer(many=True, required=False, default=list)
+    answers = SubmittedAnswerSerializer(many=True, max_length=500)
+
+class ExamStartSerializer(serializers.Serializer):
+    specialization_id = serializers.IntegerField()
+    admin_exam_definition_id = serializers.IntegerField(allow_null=True, required=False, default=None)
+    exam_name = serializers.CharField(max_length=255)
+    questions_in_session = SubmittedQuestionSerializer(many=True, min_length=1, max_length=500)
+
+class ExamProgressSerializer(serializers.ModelSerializer):
+    """An in-progress session, without its questions and answers."""
+    class Meta:
+        model = ExamSession
+        fields = ['id', 'specialization', 'admin_exam_definition', 'exam_name', 'status', 'started_at']
+
+class AdaptiveStartSerializer(serializers.Serializer):
+    specialization_id = serializers.IntegerField()
+    exam_name = serializers.CharField(max_length=255)
+    num_questions = serializers.IntegerField(min_value=1, max_value=500, default=20)
+
+class AdaptiveAnswerSerializer(serializers.Serializer):
+    question_id = serializers.IntegerField()
+    selected_choice_id = serializers.IntegerField()
+
+class AdaptiveStateSerializer(serializers.ModelSerializer):
+    """Progress of an adaptive session and the student's ability estimate on the Rasch scale."""
+    standard_error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AdaptiveState
+        fields = ['ability', 'standard_error', 'answered', 'length']
+
+    def get_standard_error(self, obj):
+        return standard_error(obj.precision)
+
+class ChangeFeedParamsSerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, required=False, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=2000, required=False, default=500)
+    specialization = serializers.IntegerField(required=False, default=None)
+
+class QuestionTransferSerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(choices=['ndjson', 'csv'], required=False, default='ndjson')
+    specialization = serializers.IntegerField(required=False, default=None)
+
+class RegradeParamsSerializer(serializers.Serializer):
+    specialization = serializers.IntegerField(required=False, default=None)
+
+class DuplicateReportParamsSerializer(serializers.Serializer):
+    threshold = serializers.FloatField(required=False, default=None, min_value=0.0, max_value=1.0)
+    specialization = serializers.IntegerField(required=False, default=None)
+
+class QuestionStatisticsSerializer(serializers.ModelSerializer):
+    question_text = serializers.CharField(source='question.text', read_only=True)
+    correct_rate = serializers.SerializerMethodField()
+    discrimination = serializers.SerializerMethodField()
+    choices = serializers.SerializerMethodField()
+
+    class Meta:
+        model = QuestionStatistics
+        fields = [
+            'question', 'question_text', 'attempts', 'correct', 'skipped',
+            'correct_rate', 'discrimination', 'choices',
+        ]
+
+    def get_correct_rate(self, obj):
+        return correct_rate(obj)
+
+    def get_discrimination(self, obj):
+        return discrimination(obj)
+
+    def get_choices(self, obj):
+        choices = []
+        for choice in obj.question.choices.all():
+            stats = getattr(choice, 'statistics', None)
+            picks = stats.picks if stats is not None else 0
+            choices.append({
+                'id': choice.pk,
+                'text': choice.text,
+                'is_correct': choice.is_correct,
+                'picks': picks,
+                'pick_rate': picks / obj.attempts if obj.attempts else None,
+            })
+        return choices
+
+class RoleTokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    """Token pair carrying the user's role and username, so requests authenticate without a user lookup."""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+class CachedTokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """
+    Issues an access token from a refresh token, checking the user against
+    the cached row instead of the database and re-stamping its current role.
+    Rotation, when enabled, keeps simplejwt's behaviour.
+    """
+
+    def validate(self, attrs):
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            return super().validate(attrs)
+        refresh = self.token_class(attrs['refresh'])
+        user = get_cached_user(refresh.payload.get(jwt_settings.USER_ID_CLAIM))
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        return {'access': str(add_user_claims(refresh.access_token, user))}
+
+class JobSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'url', 'kind', 'status', 'progress', 'progress_message', 'result', 'error', 'attempts',
+            'max_attempts', 'run_after', 'created_at', 'started_at', 'finished_at',
+        ]
+
+    def get_url(self, obj):
+        return reverse('job-detail', args=[obj.pk])
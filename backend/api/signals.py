@@ -0,0 +1,181 @@
+import threading
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .ai.proxy import clear_ai_config
+from .authentication import forget_user
+from .blobs import acquire, release, store
+from .changes import record_change
+from .db import apply_sqlite_pragmas
+from .dedup import index_questions
+from .metrics import watch_queries
+from .papers import forget_papers
+from .models import User, Question, Choice, Attachment, AdminExamDefinition, AISettings
+from .sampling import invalidate_question_pools
+from .search import reindex_questions
+from .snapshots import bump_bank_versions
+
+_local = threading.local()
+
+
+def _flush_question_indexes():
+    pending, _local.pending = getattr(_local, 'pending', set()), set()
+    if pending:
+        reindex_questions(pending)
+        index_questions(pending)
+
+
+def _owning_question(sender, instance):
+    """
+    The question a bank write belongs to and its specialization. Looked up at
+    most once per instance, since several receivers need it.
+    """
+    if sender is Question:
+        return instance.pk, instance.specialization_id
+    if not hasattr(instance, '_owning_specialization_id'):
+        instance._owning_specialization_id = (
+            Question.objects.filter(pk=instance.question_id).values_list('specialization_id', flat=True).first()
+        )
+    return instance.question_id, instance._owning_specialization_id
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, **kwargs):
+    # After commit, so no reader caches a pre-commit pool under the new version.
+    transaction.on_commit(invalidate_question_pools)
+
+
+@receiver([post_save, post_delete], sender=Question)
+@receiver([post_save, post_delete], sender=Choice)
+@receiver([post_save, post_delete], sender=Attachment)
+def reindex_question(sender, instance, **kwargs):
+    """
+    Queue the owning question for the search and duplicate indexes once the
+    transaction commits.
+    The first callback to run drains the queue, so a question saved together
+    with its choices is reindexed only once; ids left behind by a rollback are
+    simply reindexed again with the next commit.
+    """
+    question_id, _ = _owning_question(sender, instance)
+    if not hasattr(_local, 'pending'):
+        _local.pending = set()
+    _local.pending.add(question_id)
+    transaction.on_commit(_flush_question_indexes)
+
+
+@receiver(pre_save, sender=Question)
+def remember_previous_specialization(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._previous_specialization_id = (
+            Question.objects.filter(pk=instance.pk).values_list('specialization_id', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Question)
+@receiver([post_save, post_delete], sender=Choice)
+@receiver([post_save, post_delete], sender=Attachment)
+def bump_question_bank(sender, instance, **kwargs):
+    """
+    Invalidate the bank snapshot of every specialization the write touches,
+    after commit so no reader can cache pre-commit data under the new version.
+    """
+    _, specialization_id = _owning_question(sender, instance)
+    specialization_ids = {specialization_id, getattr(instance, '_previous_specialization_id', None)}
+    specialization_ids.discard(None)
+    if specialization_ids:
+        transaction.on_commit(lambda: bump_bank_versions(specialization_ids))
+
+
+@receiver([post_save, post_delete], sender=Question)
+@receiver([post_save, post_delete], sender=Choice)
+@receiver([post_save, post_delete], sender=Attachment)
+def journal_question_change(sender, instance, signal, **kwargs):
+    """
+    Journal the owning question. Choice and attachment writes are recorded as
+    changes to their question, which the feed serves with choices nested.
+    """
+    question_id, specialization_id = _owning_question(sender, instance)
+    if specialization_id is None:
+        # The owning question is already gone; its own tombstone covers it.
+        return
+    previous = getattr(instance, '_previous_specialization_id', None)
+    if previous is not None and previous != specialization_id:
+        # Clients filtered to the old specialization must drop the question;
+        # written first so unfiltered clients see the upsert as the latest entry.
+        record_change('question', question_id, previous, deleted=True)
+    deleted = sender is Question and signal is post_delete
+    record_change('question', question_id, specialization_id, deleted=deleted)
+
+
+@receiver([post_save, post_delete], sender=AdminExamDefinition)
+def journal_exam_definition_change(sender, instance, signal, **kwargs):
+    record_change(
+        'exam_definition', instance.pk, instance.specialization_id, deleted=signal is post_delete,
+    )
+
+
+@receiver([post_save, post_delete], sender=AdminExamDefinition)
+def exam_definition_changed(sender, instance, **kwargs):
+    """Drop the cached paper list, so a deleted or moved definition stops handing out papers."""
+    definition_id = instance.pk
+    transaction.on_commit(lambda: forget_papers(definition_id))
+
+
+@receiver([post_save, post_delete], sender=AISettings)
+def ai_settings_changed(sender, **kwargs):
+    clear_ai_config()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_sqlite_pragmas(connection)
+    watch_queries(connection)
+
+
+@receiver(pre_save, sender=Attachment)
+def store_attachment_file(sender, instance, **kwargs):
+    """
+    Route a newly uploaded file into content-addressed storage, so identical
+    uploads share one blob, and remember the blob the row pointed at before.
+    store() has already taken the new blob's reference.
+    """
+    instance._stored_blob_id = None
+    if instance.file and not instance.file._committed:
+        blob = store(instance.file, instance.file_name)
+        instance.file = blob.file.name
+        instance.blob = blob
+        instance._stored_blob_id = blob.pk
+    elif not instance.file:
+        instance.blob = None
+    instance._previous_blob_id = None
+    if instance.pk is not None:
+        instance._previous_blob_id = (
+            Attachment.objects.filter(pk=instance.pk).values_list('blob_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Attachment)
+def count_blob_reference(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_blob_id', None)
+    stored = getattr(instance, '_stored_blob_id', None)
+    if previous != instance.blob_id:
+        if stored is None:
+            acquire([instance.blob_id])
+        release([previous])
+    elif stored is not None:
+        # The same bytes again: the row already held a reference.
+        release([stored])
+
+
+@receiver(post_delete, sender=Attachment)
+def release_blob_reference(sender, instance, **kwargs):
+    release([instance.blob_id])
@@ -0,0 +1,60 @@
+import time
+
+from django.core.cache import cache
+
+from .fastpath import question_rows
+from .models import Question
+from .renderers import render_json
+
+SNAPSHOT_TIMEOUT = 24 * 60 * 60
+
+
+def _version_key(specialization_id):
+    return f'question-bank:version:{specialization_id}'
+
+
+def get_bank_version(specialization_id):
+    """
+    Current version of a specialization's question bank. A missing counter is
+    seeded from the clock, so an evicted counter can never reissue an ETag
+    that a client already holds for different content.
+    """
+    key = _version_key(specialization_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_bank_versions(specialization_ids):
+    for specialization_id in specialization_ids:
+        key = _version_key(specialization_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def bank_etag(specialization_id, version):
+    return f'"bank-{specialization_id}-{version}"'
+
+
+def get_bank_snapshot(specialization_id, version):
+    """Rendered JSON for one version of a bank, serialized at most once per version."""
+    key = f'question-bank:snapshot:{specialization_id}:{version}'
+    body = cache.get(key)
+    if body is None:
+        ids = Question.objects.filter(specialization_id=specialization_id).order_by('id').values_list('id', flat=True)
+        body = render_json(question_rows(list(ids)))
+        cache.set(key, body, SNAPSHOT_TIMEOUT)
+    return body
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
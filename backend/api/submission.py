@@ -0,0 +1,232 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ValidationError
+
+from .autosave import (
+    SessionClosed, check_answers, current_answers, forget_session, remember_session, session_questions, upsert_answers
+)
+from .item_stats import rebuild_statistics, record_submission
+from .jobs import job_handler
+from .rollups import rebuild_rollups, record_session_result
+
+from .models import (
+    Question, Specialization, AdminExamDefinition, ExamSession, StudentAnswer, AdaptiveState
+)
+
+
+def load_answer_key(question_ids):
+    """
+    Fetch the mark and the correctness of every choice for the given questions
+    in a single query.
+    Returns {question_id: (mark, specialization_id, {choice_id: is_correct})}.
+    """
+    key = {}
+    rows = Question.objects.filter(id__in=question_ids).values_list(
+        'id', 'mark', 'specialization_id', 'choices__id', 'choices__is_correct'
+    )
+    for question_id, mark, specialization_id, choice_id, is_correct in rows:
+        _, _, choices = key.setdefault(question_id, (mark, specialization_id, {}))
+        if choice_id is not None:
+            choices[choice_id] = is_correct
+    return key
+
+
+def grade(answers, answer_key):
+    """Sum the marks of correctly answered questions. Pure, no queries."""
+    score = 0
+    for answer in answers:
+        mark, _, choices = answer_key[answer['question_id']]
+        if choices.get(answer['selected_choice_id']):
+            score += mark
+    return score
+
+
+def validate_submission(data, answer_key, question_ids):
+    """Raise ValidationError for an inconsistent submission; return the definition's passing grade, if any."""
+    errors = {}
+    missing = [pk for pk in question_ids if pk not in answer_key]
+    if missing:
+        errors['questions_in_session'] = [f'Unknown question ids: {missing}']
+    elif any(answer_key[pk][1] != data['specialization_id'] for pk in question_ids):
+        errors['questions_in_session'] = ['All questions must belong to the exam specialization.']
+
+    answer_errors = []
+    for answer in data['answers']:
+        question_id, choice_id = answer['question_id'], answer['selected_choice_id']
+        if question_id not in answer_key:
+            answer_errors.append(f'Question {question_id} is not part of this exam.')
+        elif choice_id is not None and choice_id not in answer_key[question_id][2]:
+            answer_errors.append(f'Choice {choice_id} does not belong to question {question_id}.')
+    if answer_errors:
+        errors['answers'] = answer_errors
+
+    if not Specialization.objects.filter(pk=data['specialization_id']).exists():
+        errors['specialization_id'] = ['Unknown specialization.']
+    definition_id, passing_percent = data['admin_exam_definition_id'], None
+    if definition_id is not None:
+        passing_percent = AdminExamDefinition.objects.filter(
+            pk=definition_id, specialization_id=data['specialization_id']
+        ).values_list('passingGradePercent', flat=True).first()
+        if passing_percent is None:
+            errors['admin_exam_definition_id'] = ['Unknown exam definition for this specialization.']
+
+    if errors:
+        raise ValidationError(errors)
+    return passing_percent
+
+
+def submit_exam(student, data):
+    """
+    Validate, grade and persist a finished exam, and fold it into the item
+    statistics and result rollups, with a fixed number of queries
+    independent of the number of questions. `student` may be a User or a
+    token user; only its id and username are read.
+    """
+    question_ids = list(dict.fromkeys(
+        [q['id'] for q in data['questions_in_session']]
+        + [answer['question_id'] for answer in data['answers']]
+    ))
+
+    with transaction.atomic():
+        answer_key = load_answer_key(question_ids)
+        passing_percent = validate_submission(data, answer_key, question_ids)
+
+        session = ExamSession.objects.create(
+            student_id=student.id,
+            specialization_id=data['specialization_id'],
+            admin_exam_definition_id=data['admin_exam_definition_id'],
+            exam_name=data['exam_name'],
+            score=grade(data['answers'], answer_key),
+        )
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(
+                exam_session=session,
+                question_id=answer['question_id'],
+                selected_choice_id=answer['selected_choice_id'],
+            )
+            for answer in data['answers']
+        ])
+        Through = ExamSession.questions.through
+        Through.objects.bulk_create([
+            Through(examsession_id=session.pk, question_id=question_id)
+            for question_id in question_ids
+        ])
+        record_submission(question_ids, data['answers'], answer_key, session.score)
+        total_marks = sum(answer_key[pk][0] for pk in question_ids)
+        record_session_result(session, student.username, total_marks, passing_percent)
+    return session
+
+
+def start_session(student, data):
+    """
+    Open an in-progress session on the given questions. Its answers are
+    autosaved (api/autosave.py) until finish_session grades it.
+    """
+    question_ids = list(dict.fromkeys(q['id'] for q in data['questions_in_session']))
+    with transaction.atomic():
+        answer_key = load_answer_key(question_ids)
+        validate_submission({**data, 'answers': []}, answer_key, question_ids)
+        session = ExamSession.objects.create(
+            student_id=student.id,
+            specialization_id=data['specialization_id'],
+            admin_exam_definition_id=data['admin_exam_definition_id'],
+            exam_name=data['exam_name'],
+            status='in_progress',
+            started_at=timezone.now(),
+            completed_at=None,
+        )
+        Through = ExamSession.questions.through
+        Through.objects.bulk_create([
+            Through(examsession_id=session.pk, question_id=question_id)
+            for question_id in question_ids
+        ])
+        choices = {pk: set(answer_key[pk][2]) for pk in question_ids}
+        transaction.on_commit(lambda: remember_session(session.pk, student.id, choices))
+    return session
+
+
+def finish_session(student, session_id, answers):
+    """
+    Grade and complete an in-progress session from its latest answers: those
+    flushed to the database, overlaid by those still in the autosave buffer
+    and then by `answers`, sent with the submission. Costs a fixed number of
+    queries however many questions the exam has.
+    """
+    with transaction.atomic():
+        # Locked, so a concurrent submission or autosave flush waits for this one.
+        session = ExamSession.objects.select_for_update().filter(pk=session_id, student_id=student.id).first()
+        if session is None:
+            raise NotFound('No such exam session.')
+        if session.status != 'in_progress':
+            raise SessionClosed()
+        if answers and AdaptiveState.objects.filter(session_id=session.pk).exists():
+            raise ValidationError({'answers': ['Adaptive sessions are answered one question at a time.']})
+        question_ids = session_questions([session.pk])[session.pk]
+        answer_key = load_answer_key(question_ids)
+        check_answers({pk: answer_key[pk][2] for pk in question_ids}, answers)
+
+        latest = current_answers(session.pk, question_ids)
+        latest.update((answer['question_id'], answer['selected_choice_id']) for answer in answers)
+        graded = [{'question_id': pk, 'selected_choice_id': choice_id} for pk, choice_id in latest.items()]
+        upsert_answers((session.pk, pk, choice_id) for pk, choice_id in latest.items())
+        session.score = grade(graded, answer_key)
+        session.status, session.completed_at = 'completed', timezone.now()
+        session.save(update_fields=['score', 'status', 'completed_at'])
+
+        record_submission(question_ids, graded, answer_key, session.score)
+        passing_percent = None
+        if session.admin_exam_definition_id is not None:
+            passing_percent = AdminExamDefinition.objects.filter(
+                pk=session.admin_exam_definition_id
+            ).values_list('passingGradePercent', flat=True).first()
+        total_marks = sum(answer_key[pk][0] for pk in question_ids)
+        record_session_result(session, student.username, total_marks, passing_percent)
+        transaction.on_commit(lambda: forget_session(session.pk, question_ids))
+    return session
+
+
+def regrade_sessions(specialization_id=None, chunk_size=500, progress=None):
+    """
+    Recompute the score of every stored session (of one specialization, if
+    given) from the current answer key, after marks or correct choices were
+    edited, then rebuild the item statistics and result rollups that derive
+    from scores. `progress(done, total)` is called after each chunk. Returns
+    (sessions checked, sessions whose score changed).
+    """
+    sessions = ExamSession.objects.filter(status='completed').order_by('id')
+    if specialization_id is not None:
+        sessions = sessions.filter(specialization_id=specialization_id)
+    session_ids = list(sessions.values_list('id', flat=True))
+    changed = 0
+    for start in range(0, len(session_ids), chunk_size):
+        chunk = session_ids[start:start + chunk_size]
+        answers = {pk: [] for pk in chunk}
+        for session_id, question_id, choice_id in StudentAnswer.objects.filter(exam_session_id__in=chunk).values_list(
+            'exam_session_id', 'question_id', 'selected_choice_id'
+        ):
+            answers[session_id].append({'question_id': question_id, 'selected_choice_id': choice_id})
+        answer_key = load_answer_key({answer['question_id'] for rows in answers.values() for answer in rows})
+        updates = []
+        for session_id, score in ExamSession.objects.filter(id__in=chunk).values_list('id', 'score'):
+            # Answers to questions deleted since the exam no longer count.
+            graded = [answer for answer in answers[session_id] if answer['question_id'] in answer_key]
+            new_score = grade(graded, answer_key)
+            if new_score != score:
+                updates.append(ExamSession(pk=session_id, score=new_score))
+        ExamSession.objects.bulk_update(updates, ['score'], batch_size=chunk_size)
+        changed += len(updates)
+        if progress is not None:
+            progress(start + len(chunk), len(session_ids))
+    if changed:
+        rebuild_statistics()
+        rebuild_rollups()
+    return len(session_ids), changed
+
+
+@job_handler('sessions.regrade')
+def regrade_job(job):
+    def progress(done, total):
+        job.progress(done, total, f'Regraded {done} of {total} sessions')
+
+    checked, changed = regrade_sessions(job.payload.get('specialization'), progress=progress)
+    return {'sessions': checked, 'changed': changed}
@@ -0,0 +1,195 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from . import dedup, search
+from .blobs import acquire, release, store
+from .changes import record_question_changes
+from .item_stats import rebuild_statistics
+from .models import (
+    User, Specialization, Question, Choice, Attachment, AdminExamDefinition, ExamSession, StudentAnswer
+)
+from .rollups import rebuild_rollups
+from .snapshots import bump_bank_versions
+
+SYNTHETIC_PASSWORD = 'synthetic'
+_SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'su', 'te', 'vo', 'ne', 'di', 'pa', 'zu', 'ho', 'qi', 'be', 'fa', 'xo']
+
+
+def _word(rng):
+    return ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def _sentence(rng, words):
+    return ' '.join(_word(rng) for _ in range(words))
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _file_blobs(rng, count):
+    # A small pool of distinct files shared by many attachments, as with real uploads.
+    blobs = []
+    for index in range(count):
+        content = ContentFile(rng.randbytes(2048 + 512 * index), name=f'figure-{index}.png')
+        content.content_type = 'image/png'
+        blobs.append(store(content))
+    return blobs
+
+
+def make_pdf(page_texts):
+    """A minimal valid PDF with one line of Helvetica text per page."""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in page_texts:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>'
+        )
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'
+    out, offsets = b'%PDF-1.4\n', []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode()
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return out
+
+
+def generate_dataset(specializations=5, questions=1000, students=100, sessions=1000, questions_per_session=20,
+                     choices_per_question=4, attachment_ratio=0.3, file_ratio=0.05, seed=0, label='synthetic',
+                     chunk_size=1000):
+    """
+    Insert a reproducible synthetic dataset: the same arguments always
+    produce the same rows. Rows are written with bulk inserts, so the derived
+    tables (search and duplicate indexes, item statistics, result rollups,
+    change journal) are rebuilt afterwards. Students get the password
+    SYNTHETIC_PASSWORD. Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    tag = f'{label}-{seed}'
+    with transaction.atomic():
+        specs = Specialization.objects.bulk_create([
+            Specialization(name=f'{label.title()} {seed}.{index}') for index in range(specializations)
+        ])
+        definitions = AdminExamDefinition.objects.bulk_create([
+            AdminExamDefinition(
+                name=f'{spec.name} final', description=_sentence(rng, 12), durationMinutes=60,
+                passingGradePercent=rng.choice([50, 60, 70]), specialization=spec,
+            )
+            for spec in specs
+        ])
+
+        question_rows = []
+        for _ in range(questions):
+            question_rows.append(Question(
+                text=f'{_sentence(rng, rng.randint(8, 20))}?', specialization=rng.choice(specs),
+                course_year=rng.randint(1, 5), mark=rng.choice([1, 1, 2, 5]), is_ai_generated=rng.random() < 0.1,
+            ))
+        created = []
+        for chunk in _chunks(question_rows, chunk_size):
+            created += Question.objects.bulk_create(chunk)
+
+        correct, choice_ids = {}, {}
+        for chunk in _chunks(created, chunk_size):
+            rows = []
+            for question in chunk:
+                right = rng.randrange(choices_per_question)
+                rows += [
+                    Choice(question=question, text=_sentence(rng, rng.randint(1, 6)), is_correct=index == right)
+                    for index in range(choices_per_question)
+                ]
+            for choice in Choice.objects.bulk_create(rows):
+                choice_ids.setdefault(choice.question_id, []).append(choice.pk)
+                if choice.is_correct:
+                    correct[choice.question_id] = choice.pk
+
+        blobs = _file_blobs(rng, 4) if file_ratio else []
+        attachments, shared = [], []
+        for question in created:
+            if blobs and rng.random() < file_ratio:
+                blob = rng.choice(blobs)
+                shared.append(blob.pk)
+                attachments.append(Attachment(
+                    question=question, attachment_type='diagram', file=blob.file.name, blob=blob,
+                    file_name=f'figure-{question.pk}.png',
+                ))
+            elif rng.random() < attachment_ratio:
+                attachments.append(Attachment(
+                    question=question, attachment_type='code',
+                    content='\n'.join(f'{_word(rng)} = {rng.randint(0, 99)}' for _ in range(rng.randint(2, 8))),
+                ))
+        Attachment.objects.bulk_create(attachments, batch_size=chunk_size)
+        acquire(shared)
+        # Drop the references store() took for the pool; unused files are collected.
+        release([blob.pk for blob in blobs])
+
+        password = make_password(SYNTHETIC_PASSWORD)
+        users = User.objects.bulk_create([
+            User(username=f'{tag}-student-{index}', email=f'{tag}-student-{index}@example.com', password=password,
+                 first_name=_word(rng).title(), last_name=_word(rng).title(), role='student')
+            for index in range(students)
+        ], batch_size=chunk_size)
+
+        by_spec = {}
+        for question in created:
+            by_spec.setdefault(question.specialization_id, []).append(question)
+        definition_for = {definition.specialization_id: definition for definition in definitions}
+        usable = [spec for spec in specs if by_spec.get(spec.pk)]
+        session_count = answer_count = 0
+        for chunk in _chunks(range(sessions if users and usable else 0), chunk_size):
+            plans = []
+            for _ in chunk:
+                spec = rng.choice(usable)
+                picked = rng.sample(by_spec[spec.pk], min(questions_per_session, len(by_spec[spec.pk])))
+                picks = {
+                    question.pk: (rng.choice(choice_ids[question.pk]) if rng.random() < 0.95 else None)
+                    for question in picked
+                }
+                score = sum(question.mark for question in picked if picks[question.pk] == correct[question.pk])
+                definition = definition_for[spec.pk] if rng.random() < 0.5 else None
+                session = ExamSession(
+                    student=rng.choice(users), specialization=spec, admin_exam_definition=definition,
+                    exam_name=definition.name if definition else f'{spec.name} practice', score=score,
+                )
+                plans.append((session, picks))
+            ExamSession.objects.bulk_create([session for session, _ in plans])
+            Through = ExamSession.questions.through
+            Through.objects.bulk_create([
+                Through(examsession_id=session.pk, question_id=pk) for session, picks in plans for pk in picks
+            ])
+            answers = [
+                StudentAnswer(exam_session_id=session.pk, question_id=pk, selected_choice_id=choice_id)
+                for session, picks in plans for pk, choice_id in picks.items()
+            ]
+            StudentAnswer.objects.bulk_create(answers, batch_size=chunk_size)
+            session_count += len(plans)
+            answer_count += len(answers)
+
+        for spec in specs:
+            record_question_changes([question.pk for question in by_spec.get(spec.pk, [])], spec.pk)
+
+    search.rebuild_index(chunk_size=chunk_size)
+    dedup.rebuild_index(chunk_size=chunk_size)
+    rebuild_statistics(chunk_size=chunk_size)
+    rebuild_rollups(chunk_size=chunk_size)
+    bump_bank_versions([spec.pk for spec in specs])
+    return {
+        'specializations': len(specs),
+        'exam_definitions': len(definitions),
+        'questions': len(created),
+        'choices': sum(len(ids) for ids in choice_ids.values()),
+        'attachments': len(attachments),
+        'students': len(users),
+        'exam_sessions': session_count,
+        'answers': answer_count,
+    }
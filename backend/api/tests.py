@@ -1,3 +1,2286 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
\ No newline at end of file
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import Serializer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    User, Specialization, Question, Choice, Attachment, AdminExamDefinition,
+    ExamSession, StudentAnswer, ChangeLogEntry, AISettings, QuestionSignature, QuestionLSHBucket,
+    QuestionStatistics, ChoiceStatistics, ResultRollup, Blob, Job, AdaptiveState, ItemCalibration
+)
+from . import adaptive, autosave, db, item_stats, jobs, metrics, rollups, sampling
+from .adaptive import start_adaptive_session
+from .ai import pdf
+from .autosave import flush_answers
+from .ai.backends import StubBackend
+from .ai.pdf import chunk_pages
+from .ai.prompts import AIResponseError, parse_generated_questions
+from .ai.proxy import AIConfig, AIProxy, response_cache_key
+from .benchmark import benchmark_users, percentile, run_benchmarks
+from .blobs import Image, generate_thumbnails, store
+from .checks import check_autosave_buffer, check_version_counters
+from .dedup import filter_duplicates, find_near_duplicates
+from .item_stats import rebuild_statistics
+from .loadtest import AUTOSAVE_LOAD_PREFIX, asgi_request, run_ai_load_test, run_autosave_load_test
+from .papers import build_variants
+from .renderers import render_json
+from .rollups import rebuild_rollups
+from .search import normalize, search_question_ids
+from .serializers import QuestionSerializer, RoleTokenObtainPairSerializer
+from .submission import regrade_sessions, start_session
+from .synthetic import SYNTHETIC_PASSWORD, generate_dataset, make_pdf
+from .transfer import import_records, parse_ndjson
+from .views import SubmitExamView
+
+
+def make_question(specialization, text='Question', course_year=1, mark=1, is_ai_generated=False, n_choices=4):
+    question = Question.objects.create(
+        text=text, specialization=specialization, course_year=course_year,
+        mark=mark, is_ai_generated=is_ai_generated,
+    )
+    Choice.objects.bulk_create([
+        Choice(question=question, text=f'{text} choice {i}', is_correct=(i == 0))
+        for i in range(n_choices)
+    ])
+    Attachment.objects.create(question=question, attachment_type='code', content='print(1)')
+    return question
+
+
+def make_session(student, specialization, questions, definition=None, score=0):
+    session = ExamSession.objects.create(
+        student=student, specialization=specialization, admin_exam_definition=definition,
+        exam_name='Exam', score=score,
+    )
+    session.questions.set(questions)
+    for question in questions:
+        StudentAnswer.objects.create(
+            exam_session=session, question=question, selected_choice=question.choices.first(),
+        )
+    return session
+
+
+class APITestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pw', role='admin')
+        cls.student = User.objects.create_user(username='student', password='pw', role='student')
+        cls.specialization = Specialization.objects.create(name='Software Engineering')
+        cls.definition = AdminExamDefinition.objects.create(
+            name='Midterm', description='', durationMinutes=60, passingGradePercent=50,
+            specialization=cls.specialization,
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class QueryBudgetMixin:
+    """
+    Asserts that an endpoint stays within a fixed query budget and that the
+    number of queries does not grow with the number of rows it returns.
+    """
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+    def assertQueryBudget(self, client, url, budget, grow):
+        small = self.count_queries(client, url)
+        grow()
+        large = self.count_queries(client, url)
+        self.assertLessEqual(large, budget)
+        self.assertEqual(small, large, f'{url} query count grew from {small} to {large} with row count')
+
+
+class QuestionQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def grow(self, n=5):
+        for i in range(n):
+            make_question(self.specialization, text=f'Extra {i}')
+
+    def test_list(self):
+        self.grow(2)
+        self.assertQueryBudget(self.client_for(self.student), '/api/questions/', 3, self.grow)
+
+
+class ExamSessionQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def grow(self, n=3):
+        for i in range(n):
+            questions = [make_question(self.specialization, text=f'Q{i}-{j}') for j in range(3)]
+            make_session(self.student, self.specialization, questions, definition=self.definition)
+
+    def test_student_list(self):
+        self.grow(1)
+        self.assertQueryBudget(self.client_for(self.student), '/api/exam-sessions/', 5, self.grow)
+
+    def test_admin_list(self):
+        self.grow(1)
+        self.assertQueryBudget(self.client_for(self.admin), '/api/exam-sessions/', 5, self.grow)
+
+    def test_detail(self):
+        questions = [make_question(self.specialization, text=f'D{j}') for j in range(2)]
+        session = make_session(self.student, self.specialization, questions)
+
+        def grow():
+            extra = [make_question(self.specialization, text=f'E{j}') for j in range(4)]
+            session.questions.add(*extra)
+
+        self.assertQueryBudget(self.client_for(self.student), f'/api/exam-sessions/{session.pk}/', 5, grow)
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.question = make_question(self.specialization, text='Sparse')
+        self.session = make_session(self.student, self.specialization, [self.question], definition=self.definition)
+        self.client = self.client_for(self.admin)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data, ctx.captured_queries
+
+    def test_question_list_omits_attachment_content(self):
+        data, queries = self.get('/api/questions/')
+        attachment = data['results'][0]['attachments'][0]
+        self.assertNotIn('content', attachment)
+        self.assertNotIn('"content"', queries[-1]['sql'])
+        data, _ = self.get('/api/questions/?expand=attachments')
+        self.assertEqual(data['results'][0]['attachments'][0]['content'], 'print(1)')
+        data, _ = self.get(f'/api/questions/{self.question.pk}/')
+        self.assertEqual(data['attachments'][0]['content'], 'print(1)')
+
+    def test_question_fields(self):
+        data, queries = self.get('/api/questions/?fields=id,text')
+        self.assertEqual(data['results'], [{'id': self.question.pk, 'text': 'Sparse'}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"mark"', queries[0]['sql'])
+
+    def test_session_list_is_flat_unless_expanded(self):
+        data, queries = self.get('/api/exam-sessions/')
+        row = data['results'][0]
+        self.assertEqual(row['student'], self.student.pk)
+        self.assertNotIn('questions', row)
+        self.assertEqual(len(queries), 1)
+
+        data, _ = self.get('/api/exam-sessions/?expand=student,questions,answers')
+        row = data['results'][0]
+        self.assertEqual(row['student']['username'], 'student')
+        self.assertEqual([q['id'] for q in row['questions']], [self.question.pk])
+        self.assertEqual(len(row['answers']), 1)
+
+        data, _ = self.get('/api/exam-sessions/?fields=id,score')
+        self.assertEqual(data['results'], [{'id': self.session.pk, 'score': 0}])
+
+    def test_session_detail_is_complete(self):
+        data, _ = self.get(f'/api/exam-sessions/{self.session.pk}/')
+        self.assertEqual(data['questions'][0]['attachments'][0]['content'], 'print(1)')
+        data, _ = self.get(f'/api/exam-sessions/{self.session.pk}/?fields=id,questions')
+        self.assertEqual(set(data), {'id', 'questions'})
+
+
+class FastSerializationTests(APITestCase):
+    """The values()-based read path must emit the same bytes as the serializers."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.question = make_question(self.specialization, text='Line\u2028separator, "quoted" \u00e9')
+        Attachment.objects.create(
+            question=self.question, attachment_type='diagram', file_name='d.png',
+            file=SimpleUploadedFile('d.png', b'png bytes', content_type='image/png'),
+        )
+        other = make_question(self.specialization, text='Other')
+        self.session = make_session(
+            self.student, self.specialization, [self.question, other], definition=self.definition, score=1,
+        )
+        make_session(self.student, self.specialization, [other])
+
+    def assertSameBytes(self, user, url):
+        client = self.client_for(user)
+        with override_settings(API_FAST_SERIALIZATION=False):
+            expected = client.get(url)
+        actual = client.get(url)
+        self.assertEqual(expected.status_code, 200)
+        self.assertEqual(actual.status_code, 200)
+        self.assertEqual(actual.content, expected.content)
+
+    def test_questions(self):
+        pk = self.question.pk
+        for url in [
+            '/api/questions/', '/api/questions/?expand=attachments', '/api/questions/?fields=id,mark,attachments',
+            f'/api/questions/{pk}/', f'/api/questions/{pk}/?fields=text,choices', '/api/questions/?search=other',
+        ]:
+            with self.subTest(url=url):
+                self.assertSameBytes(self.admin, url)
+
+    def test_exam_sessions(self):
+        pk = self.session.pk
+        for user in [self.admin, self.student]:
+            for url in [
+                '/api/exam-sessions/', '/api/exam-sessions/?fields=id,score,student',
+                '/api/exam-sessions/?expand=student,specialization,admin_exam_definition,answers,questions',
+                f'/api/exam-sessions/{pk}/', f'/api/exam-sessions/{pk}/?fields=id,questions,admin_exam_definition',
+            ]:
+                with self.subTest(user=user.username, url=url):
+                    self.assertSameBytes(user, url)
+
+    def test_missing_rows_are_404(self):
+        response = self.client_for(self.admin).get('/api/questions/999999/')
+        self.assertEqual(response.status_code, 404)
+        other = User.objects.create_user(username='other', password='pw', role='student')
+        response = self.client_for(other).get(f'/api/exam-sessions/{self.session.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_render_json_matches_json_renderer(self):
+        data = {'when': self.session.completed_at, 'text': 'a\u2028b\u2029c \u00e9', 1: [None, 1.5, True]}
+        self.assertEqual(render_json(data), JSONRenderer().render(data))
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        # The runner's client talks to "localhost", as outside the test runner.
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media.name, ALLOWED_HOSTS=['localhost', 'testserver'], METRICS_SLOW_REQUEST_SECONDS=60,
+        ))
+
+    def test_generated_data_is_reproducible(self):
+        sizes = {'specializations': 2, 'questions': 30, 'students': 3, 'sessions': 6, 'questions_per_session': 5}
+        counts = generate_dataset(label='first', **sizes)
+        self.assertEqual(counts['questions'], 30)
+        self.assertEqual(counts['choices'], 120)
+        self.assertEqual(counts['exam_sessions'], 6)
+        self.assertEqual(counts['answers'], 30)
+        generate_dataset(label='second', **sizes)
+        texts = list(Question.objects.order_by('id').values_list('text', flat=True))
+        self.assertEqual(texts[:30], texts[30:])
+        self.assertTrue(QuestionStatistics.objects.exists())
+        self.assertEqual(sum(ResultRollup.objects.filter(scope='specialization').values_list('count', flat=True)), 12)
+        response = self.client.post('/api/token/', {'username': 'first-0-student-0', 'password': SYNTHETIC_PASSWORD})
+        self.assertEqual(response.status_code, 200)
+
+    def test_every_route_is_exercised(self):
+        generate_dataset(specializations=2, questions=40, students=3, sessions=6, questions_per_session=5)
+        AISettings.objects.create(gemini_api_key='test-key', selected_model_name='test-model')
+        jobs.enqueue('sessions.regrade', {'specialization': None})
+        _, student = benchmark_users()
+        session = ExamSession.objects.filter(student=student).order_by('-id').first()
+        start_session(student, {
+            'specialization_id': session.specialization_id, 'admin_exam_definition_id': None, 'exam_name': 'Open',
+            'questions_in_session': [{'id': pk} for pk in session.questions.values_list('id', flat=True)],
+        })
+        start_adaptive_session(student, {
+            'specialization_id': session.specialization_id, 'exam_name': 'Adaptive', 'num_questions': 5,
+        })
+        definition = AdminExamDefinition.objects.order_by('id').first()
+        build_variants(definition, count=3, num_questions=5)
+        report = run_benchmarks(iterations=2, warmup=0)
+        failed = [(r['name'], r['status']) for r in report['results'] if r['status'] >= 400]
+        self.assertEqual(failed, [])
+        # Thumbnails need Pillow and an image blob to render.
+        self.assertEqual(report['meta']['uncovered_routes'], ['blob-thumbnail'])
+        result = report['results'][0]
+        self.assertLessEqual({'p50_ms', 'p95_ms', 'p99_ms', 'queries', 'peak_memory_kb'}, set(result))
+        self.assertEqual(report['meta']['dataset']['questions'], 40)
+        json.dumps(report)
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual([percentile(samples, p) for p in (0.5, 0.95, 0.99)], [50, 95, 99])
+        self.assertEqual(percentile([7], 0.99), 7)
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        metrics.reset()
+        self.question = make_question(self.specialization, text='Measured')
+
+    def sample(self, text, name, **labels):
+        label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        prefix = f'exam_api_{name}{{{label_text}'
+        line = next(line for line in text.splitlines() if line.startswith(prefix))
+        return float(line.rsplit(' ', 1)[1])
+
+    def test_records_per_route_and_exports_text_format(self):
+        client = APIClient()
+        token = RoleTokenObtainPairSerializer.get_token(self.student).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        for _ in range(2):
+            self.assertEqual(client.get('/api/questions/').status_code, 200)
+        client.get(f'/api/questions/{self.question.pk}/')
+
+        response = self.client_for(self.admin).get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        labels = {'route': 'question-list', 'method': 'GET', 'status': 200}
+        self.assertEqual(self.sample(text, 'requests_total', **labels), 2)
+        self.assertEqual(self.sample(text, 'request_duration_seconds_bucket', **labels, le='+Inf'), 2)
+        # Page, choices and attachments per request; the role claim spares the user lookup.
+        self.assertEqual(self.sample(text, 'request_queries_sum', **labels), 6)
+        self.assertGreater(self.sample(text, 'response_size_bytes_sum', **labels), 0)
+        for name in ['db_query_duration_seconds_total', 'serialize_duration_seconds_total', 'auth_duration_seconds_total']:
+            self.assertGreater(self.sample(text, name, **labels), 0)
+        self.assertEqual(self.sample(text, 'requests_total', route='question-detail', method='GET', status=200), 1)
+
+    def test_endpoint_is_admin_only(self):
+        self.assertEqual(self.client_for(self.student).get('/api/metrics/').status_code, 403)
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_log_their_top_queries(self):
+        with self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client_for(self.student).get('/api/exam-sessions/?expand=student')
+        record = logs.records[0]
+        self.assertIn('/api/exam-sessions/', record.getMessage())
+        details = record.metrics
+        self.assertEqual(details['route'], 'examsession-list')
+        self.assertEqual(details['queries'], sum(query['count'] for query in details['top_queries']))
+        self.assertIn('SELECT', details['top_queries'][0]['sql'])
+
+    @override_settings(API_FAST_SERIALIZATION=False)
+    def test_serializer_time_is_charged_to_the_view(self):
+        to_representation = QuestionSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(QuestionSerializer, 'to_representation', slow):
+            response = self.client_for(self.student).get(f'/api/questions/{self.question.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(metrics.totals('question-detail')[1]['serialize_duration_seconds'], 0.05)
+        # Only the view's serializer instances are timed; DRF's classes are left alone.
+        self.assertFalse(hasattr(Serializer.__dict__['data'].fget, '__wrapped__'))
+        self.assertNotIn('to_representation', QuestionSerializer(self.question).__dict__)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.client_for(self.student).get('/api/questions/')
+        self.assertNotIn('question-list', metrics.render_metrics())
+
+    def test_query_recording_survives_a_connection_opened_in_a_wrapper_block(self):
+        other = connections.create_connection('default')
+        self.addCleanup(other.close)
+
+        def passthrough(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        with other.execute_wrapper(passthrough):
+            other.ensure_connection()
+        self.assertEqual(other.execute_wrappers, [metrics.record_queries])
+
+
+class StartStandardExamTests(APITestCase):
+    url = '/api/student/exams/start-standard/'
+
+    def setUp(self):
+        cache.clear()
+        self.questions = [make_question(self.specialization, text=f'S{i}') for i in range(6)]
+        make_question(self.specialization, text='AI', is_ai_generated=True)
+        make_question(self.specialization, text='Other year', course_year=2)
+
+    def start(self, num_questions):
+        return self.client_for(self.student).post(self.url, {
+            'specialization_id': self.specialization.pk, 'course_year': 1, 'num_questions': num_questions,
+        }, format='json')
+
+    def test_samples_distinct_standard_questions(self):
+        response = self.start(4)
+        self.assertEqual(response.status_code, 200)
+        ids = [q['id'] for q in response.data]
+        self.assertEqual(len(set(ids)), 4)
+        self.assertTrue(set(ids) <= {q.pk for q in self.questions})
+        self.assertEqual(len(response.data[0]['choices']), 4)
+
+    def test_pool_is_cached_and_refreshed_on_write(self):
+        self.start(2)
+        # Sampled questions, their choices and attachments; the pool itself comes from the cache.
+        with self.assertNumQueries(3):
+            self.start(2)
+
+        version = sampling._pool_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            added = make_question(self.specialization, text='New')
+            # Until the write commits, readers keep the old pool and version.
+            self.assertEqual(sampling._pool_version(), version)
+        response = self.start(10)
+        self.assertIn(added.pk, [q['id'] for q in response.data])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.questions[0].delete()
+        response = self.start(10)
+        self.assertEqual(len(response.data), 6)
+
+    def test_requires_student(self):
+        response = self.client_for(self.admin).post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ConcurrentSubmissionTests(TransactionTestCase):
+    workers = 8
+
+    def setUp(self):
+        self.specialization = Specialization.objects.create(name='Concurrency')
+        self.definition = AdminExamDefinition.objects.create(
+            name='Final', description='', durationMinutes=60, passingGradePercent=50,
+            specialization=self.specialization,
+        )
+        self.questions = [make_question(self.specialization, text=f'C{i}') for i in range(5)]
+        self.students = [
+            User.objects.create_user(username=f'student{i}', password='pw', role='student') for i in range(self.workers)
+        ]
+
+    def submit(self, student, barrier, results):
+        client = APIClient()
+        client.force_authenticate(student)
+        payload = {
+            'specialization_id': self.specialization.pk,
+            'admin_exam_definition_id': self.definition.pk,
+            'exam_name': 'Parallel',
+            'answers': [{'question_id': q.pk, 'selected_choice_id': None} for q in self.questions],
+        }
+        try:
+            barrier.wait()
+            results.append(client.post('/api/student/exam-sessions/submit/', payload, format='json').status_code)
+        except Exception as exc:
+            results.append(repr(exc))
+        finally:
+            connection.close()
+
+    def test_parallel_submissions_all_succeed(self):
+        barrier, results = threading.Barrier(self.workers), []
+        threads = [threading.Thread(target=self.submit, args=(s, barrier, results)) for s in self.students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [201] * self.workers)
+        self.assertEqual(ExamSession.objects.count(), self.workers)
+        self.assertEqual(ResultRollup.objects.get(scope='definition').count, self.workers)
+        self.assertEqual(QuestionStatistics.objects.get(question=self.questions[0]).attempts, self.workers)
+
+    def test_rebuilds_keep_submissions_made_during_the_scan(self):
+        results = []
+        self.submit(self.students[0], threading.Barrier(1), results)
+
+        def submit_midway(module, name, student):
+            original, threads = getattr(module, name), []
+
+            def wrapper(*args):
+                if not threads:
+                    threads.append(threading.Thread(target=self.submit, args=(student, threading.Barrier(1), results)))
+                    threads[0].start()
+                    # Long enough for the submission to commit, unless the rebuild holds it off.
+                    threads[0].join(timeout=0.5)
+                return original(*args)
+            return mock.patch.object(module, name, wrapper), threads
+
+        patch, threads = submit_midway(item_stats, 'score_fraction', self.students[1])
+        with patch:
+            rebuild_statistics()
+        threads[0].join()
+        patch, threads = submit_midway(rollups, 'score_percent', self.students[2])
+        with patch:
+            rebuild_rollups()
+        threads[0].join()
+        self.assertEqual(results, [201] * 3)
+        self.assertEqual(QuestionStatistics.objects.get(question=self.questions[0]).attempts, 3)
+        self.assertEqual(ResultRollup.objects.get(scope='definition').count, 3)
+
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def test_connecting_leaves_the_journal_mode_alone(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'other.sqlite3')
+            other = type(connections['default'])({**connection.settings_dict, 'NAME': path}, alias='other')
+            try:
+                with other.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'delete')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            finally:
+                other.close()
+            self.assertEqual(sorted(os.listdir(directory)), ['other.sqlite3'])
+
+
+class ASGITests(TransactionTestCase):
+    """Requests served by Django's ASGI handler in this process, on committed data."""
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(ALLOWED_HOSTS=['localhost']))
+        self.specialization = Specialization.objects.create(name='ASGI')
+        self.questions = [make_question(self.specialization, text=f'A{i}') for i in range(3)]
+        self.students = [
+            User.objects.create_user(username=f'asgi{i}', password='pw', role='student') for i in range(8)
+        ]
+
+    def test_submit_view_is_async(self):
+        self.assertTrue(iscoroutinefunction(SubmitExamView.as_view()))
+
+    def test_concurrent_submissions(self):
+        body = json.dumps({
+            'specialization_id': self.specialization.pk,
+            'exam_name': 'ASGI',
+            'answers': [
+                {'question_id': q.pk, 'selected_choice_id': q.choices.order_by('id').first().pk}
+                for q in self.questions
+            ],
+        }).encode()
+        tokens = [RoleTokenObtainPairSerializer.get_token(student).access_token for student in self.students]
+
+        async def burst():
+            app = ASGIHandler()
+            return await asyncio.gather(*[
+                asgi_request(app, 'POST', '/api/student/exam-sessions/submit/', body, [
+                    (b'content-type', b'application/json'), (b'authorization', f'Bearer {token}'.encode()),
+                ])
+                for token in tokens
+            ])
+
+        results = asyncio.run(burst())
+        self.assertEqual([status for status, _ in results], [201] * len(self.students))
+        self.assertEqual(json.loads(results[0][1])['score'], 3)
+        self.assertEqual(ExamSession.objects.count(), len(self.students))
+
+    def test_ai_requests_wait_on_upstream_concurrently(self):
+        report = run_ai_load_test(requests=200, delay=0.5)
+        self.assertEqual(report['statuses'], {200: 200})
+        self.assertEqual(report['peak_upstream_in_flight'], 200)
+        # One request at a time would take 100 seconds.
+        self.assertLess(report['elapsed_s'], 10)
+
+    def test_simultaneous_autosaves_are_buffered_then_flushed(self):
+        report = run_autosave_load_test(students=50, clicks=3, questions=3)
+        self.assertEqual(report['statuses'], {202: 150})
+        # The only query of the burst is the INSERT that schedules the flush.
+        self.assertEqual(report['flush_jobs_queued'], 1)
+        self.assertLess(report['queries_per_autosave'], 0.1)
+        self.assertEqual(report['answers_in_db_before_flush'], 0)
+        self.assertEqual(report['sessions_flushed'], 50)
+        self.assertEqual(report['answers_in_db_after_flush'], 150)
+        self.assertFalse(User.objects.filter(username__startswith=AUTOSAVE_LOAD_PREFIX).exists())
+        self.assertFalse(ExamSession.objects.exists())
+
+
+class ReplicaRoutingTests(APITestCase):
+    def reads(self, method, url, **kwargs):
+        seen = []
+
+        def record(router, model, **hints):
+            seen.append(db._use_replica.get())
+
+        with mock.patch.object(db.ReplicaRouter, 'db_for_read', autospec=True, side_effect=record):
+            response = getattr(self.client_for(self.admin), method)(url, **kwargs)
+        self.assertLess(response.status_code, 400)
+        return seen
+
+    def test_read_only_actions_use_the_replica(self):
+        self.assertTrue(all(self.reads('get', '/api/specializations/')))
+        self.assertTrue(all(self.reads('get', f'/api/specializations/{self.specialization.pk}/')))
+        self.assertFalse(any(self.reads('post', '/api/specializations/', data={'name': 'New'})))
+        # The flag does not leak into later work on the same thread.
+        self.assertFalse(db._use_replica.get())
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def test_routes_flagged_reads_outside_transactions(self):
+        router = db.ReplicaRouter()
+        token = db._use_replica.set(True)
+        try:
+            with mock.patch.object(db, 'replica_configured', return_value=True):
+                with mock.patch.object(connection, 'in_atomic_block', False):
+                    self.assertEqual(router.db_for_read(Question), 'replica')
+                with mock.patch.object(connection, 'in_atomic_block', True):
+                    self.assertIsNone(router.db_for_read(Question))
+            self.assertIsNone(router.db_for_read(Question))
+        finally:
+            db._use_replica.reset(token)
+        self.assertEqual(router.db_for_write(Question), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'api'))
+
+
+class StatelessJWTTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def obtain(self, username='student'):
+        response = self.client.post('/api/token/', {'username': username, 'password': 'pw'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def bearer(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def user_queries(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if 'FROM "api_user"' in q['sql']]
+
+    def test_tokens_carry_role_and_skip_user_lookup(self):
+        tokens = self.obtain()
+        access = AccessToken(tokens['access'])
+        self.assertEqual((access['role'], access['username']), ('student', 'student'))
+        client = self.bearer(tokens['access'])
+        self.assertEqual(self.user_queries(client, '/api/exam-sessions/'), [])
+        self.assertEqual(client.get('/api/item-statistics/').status_code, 403)
+        admin = self.bearer(self.obtain('admin')['access'])
+        self.assertEqual(admin.get('/api/item-statistics/').status_code, 200)
+
+    def test_tokens_without_claims_use_the_cached_user(self):
+        client = self.bearer(AccessToken.for_user(self.student))
+        self.assertEqual(len(self.user_queries(client, '/api/exam-sessions/')), 1)
+        self.assertEqual(self.user_queries(client, '/api/exam-sessions/'), [])
+        self.student.is_active = False
+        self.student.save()
+        self.assertEqual(client.get('/api/exam-sessions/').status_code, 401)
+
+    def test_refresh_uses_cached_user_and_current_role(self):
+        refresh = self.obtain()['refresh']
+        self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        User.objects.filter(pk=self.student.pk).update(role='admin')
+        self.student.refresh_from_db()
+        self.student.save()
+        access = AccessToken(self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json').data['access'])
+        self.assertEqual(access['role'], 'admin')
+
+        self.student.is_active = False
+        self.student.save()
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_user_can_submit(self):
+        question = make_question(self.specialization, text='Stateless')
+        client = self.bearer(self.obtain()['access'])
+        response = client.post('/api/student/exam-sessions/submit/', {
+            'specialization_id': self.specialization.pk,
+            'admin_exam_definition_id': self.definition.pk,
+            'exam_name': 'Token user',
+            'answers': [{'question_id': question.pk, 'selected_choice_id': question.choices.get(is_correct=True).pk}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(ExamSession.objects.get(pk=response.data['id']).student_id, self.student.pk)
+        rollup = ResultRollup.objects.get(scope='definition', object_id=self.definition.pk)
+        self.assertEqual(rollup.leaderboard[0]['username'], 'student')
+
+
+class SubmitExamTests(APITestCase):
+    url = '/api/student/exam-sessions/submit/'
+
+    def payload(self, questions, pick_correct=True):
+        return {
+            'specialization_id': self.specialization.pk,
+            'admin_exam_definition_id': self.definition.pk,
+            'exam_name': 'Midterm',
+            'questions_in_session': [{'id': q.pk} for q in questions],
+            'answers': [
+                {
+                    'question_id': q.pk,
+                    'selected_choice_id': q.choices.get(is_correct=pick_correct).pk if i % 2 == 0 else None,
+                }
+                for i, q in enumerate(questions)
+            ],
+        }
+
+    def submit(self, payload):
+        return self.client_for(self.student).post(self.url, payload, format='json')
+
+    def test_grades_and_stores_session(self):
+        questions = [make_question(self.specialization, text=f'G{i}', mark=i + 1) for i in range(4)]
+        response = self.submit(self.payload(questions))
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['score'], 1 + 3)
+        session = ExamSession.objects.get(pk=response.data['id'])
+        self.assertEqual(session.student, self.student)
+        self.assertEqual(session.answers.count(), 4)
+        self.assertEqual(session.questions.count(), 4)
+
+    def test_query_count_is_independent_of_exam_length(self):
+        def count(n):
+            questions = [make_question(self.specialization, text=f'N{n}-{i}') for i in range(n)]
+            payload = self.payload(questions)
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.submit(payload).status_code, 201)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(2), count(20))
+
+    def test_rejects_foreign_choice(self):
+        first, second = make_question(self.specialization, text='A'), make_question(self.specialization, text='B')
+        payload = self.payload([first])
+        payload['answers'][0]['selected_choice_id'] = second.choices.first().pk
+        response = self.submit(payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('answers', response.data)
+        self.assertFalse(ExamSession.objects.exists())
+
+    def test_rejects_duplicate_answers(self):
+        question = make_question(self.specialization)
+        payload = self.payload([question])
+        payload['answers'] *= 2
+        self.assertEqual(self.submit(payload).status_code, 400)
+
+
+@override_settings(AUTOSAVE_BUFFERED=True)
+class ExamAutosaveTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.questions = [make_question(self.specialization, text=f'S{i}', mark=i + 1) for i in range(3)]
+        self.api = self.client_for(self.student)
+
+    def start(self):
+        response = self.api.post('/api/exam-sessions/start/', {
+            'specialization_id': self.specialization.pk,
+            'admin_exam_definition_id': self.definition.pk,
+            'exam_name': 'Midterm',
+            'questions_in_session': [{'id': q.pk} for q in self.questions],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def answer(self, index, correct=True):
+        question = self.questions[index]
+        choice = question.choices.filter(is_correct=correct).order_by('id').first()
+        return {'question_id': question.pk, 'selected_choice_id': choice.pk}
+
+    def autosave(self, session_id, *answers, client=None):
+        return (client or self.api).post(
+            f'/api/exam-sessions/{session_id}/autosave/', {'answers': list(answers)}, format='json',
+        )
+
+    def test_in_progress_session_is_kept_out_of_results(self):
+        session_id = self.start()
+        session = ExamSession.objects.get(pk=session_id)
+        self.assertEqual((session.status, session.score, session.completed_at), ('in_progress', None, None))
+        self.assertIsNotNone(session.started_at)
+        self.assertEqual(self.api.get('/api/exam-sessions/').data['results'], [])
+        self.assertEqual(self.api.get(f'/api/exam-sessions/{session_id}/').status_code, 404)
+        self.assertEqual([s['id'] for s in self.api.get('/api/exam-sessions/in-progress/').data], [session_id])
+        self.assertEqual(rebuild_rollups(), 0)
+        self.assertEqual(regrade_sessions(), (0, 0))
+
+    @override_settings(AUTOSAVE_FLUSH_INTERVAL=10)
+    def test_autosave_is_buffered_without_queries(self):
+        session_id = self.start()
+        first, second = self.answer(0), self.answer(1)
+        self.assertEqual(self.autosave(session_id, first).status_code, 202)
+        with self.assertNumQueries(0):
+            response = self.autosave(session_id, second)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'saved': 1})
+        self.assertFalse(StudentAnswer.objects.exists())
+        job = Job.objects.get()
+        self.assertEqual(job.kind, 'sessions.flush_answers')
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+
+    def test_flush_upserts_changed_sessions_only(self):
+        session_id = self.start()
+        self.autosave(session_id, self.answer(0), self.answer(1))
+        self.assertEqual(flush_answers(), 1)
+        self.assertEqual(flush_answers(), 0)
+        self.autosave(session_id, self.answer(0, correct=False))
+        self.assertEqual(flush_answers(), 1)
+        saved = dict(StudentAnswer.objects.values_list('question_id', 'selected_choice_id'))
+        self.assertEqual(saved, {
+            self.questions[0].pk: self.answer(0, correct=False)['selected_choice_id'],
+            self.questions[1].pk: self.answer(1)['selected_choice_id'],
+        })
+
+    def test_flush_job(self):
+        session_id = self.start()
+        self.autosave(session_id, self.answer(2))
+        Job.objects.update(run_after=timezone.now())
+        job = run_next()
+        self.assertEqual((job.status, job.result), ('succeeded', {'sessions': 1}))
+        self.assertEqual(StudentAnswer.objects.get().question_id, self.questions[2].pk)
+
+    def test_resume_returns_flushed_and_buffered_answers(self):
+        session_id = self.start()
+        self.autosave(session_id, self.answer(0), self.answer(1))
+        flush_answers()
+        self.autosave(session_id, {'question_id': self.questions[1].pk, 'selected_choice_id': None})
+        response = self.api.get(f'/api/exam-sessions/{session_id}/resume/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([q['id'] for q in response.data['questions']], [q.pk for q in self.questions])
+        self.assertEqual(response.data['answers'], [
+            self.answer(0), {'question_id': self.questions[1].pk, 'selected_choice_id': None},
+        ])
+
+    def test_submit_grades_the_latest_answers(self):
+        session_id = self.start()
+        self.autosave(session_id, self.answer(0), self.answer(1))
+        flush_answers()
+        self.autosave(session_id, self.answer(1, correct=False))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post(
+                f'/api/exam-sessions/{session_id}/submit/', {'answers': [self.answer(2)]}, format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['score'], 1 + 3)
+        self.assertEqual(len(response.data['answers']), 3)
+        session = ExamSession.objects.get(pk=session_id)
+        self.assertEqual(session.status, 'completed')
+        self.assertIsNotNone(session.completed_at)
+        self.assertEqual([s['id'] for s in self.api.get('/api/exam-sessions/').data['results']], [session_id])
+        self.assertEqual(ResultRollup.objects.get(scope='definition').pass_count, 1)
+        self.assertEqual(QuestionStatistics.objects.get(question=self.questions[1]).attempts, 1)
+
+        again = self.api.post(f'/api/exam-sessions/{session_id}/submit/', {}, format='json')
+        self.assertEqual(again.status_code, 409)
+        self.assertEqual(self.autosave(session_id, self.answer(0)).status_code, 409)
+        self.assertEqual(flush_answers(), 0)
+
+    def test_flush_leaves_submitted_sessions_alone(self):
+        session_id = self.start()
+        self.autosave(session_id, self.answer(0))
+        # The buffer outlives the submission here, as it does until the commit callback runs.
+        self.api.post(f'/api/exam-sessions/{session_id}/submit/', {'answers': [self.answer(0, False)]}, format='json')
+        self.assertEqual(flush_answers(), 0)
+        self.assertEqual(StudentAnswer.objects.get().selected_choice_id, self.answer(0, False)['selected_choice_id'])
+
+    def test_rejects_foreign_choices_and_sessions(self):
+        session_id = self.start()
+        other = make_question(self.specialization, text='Other')
+        foreign = {'question_id': self.questions[0].pk, 'selected_choice_id': other.choices.first().pk}
+        response = self.autosave(session_id, foreign)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.autosave(session_id, {'question_id': other.pk}).status_code, 400)
+        intruder = User.objects.create_user(username='intruder', password='pw', role='student')
+        self.assertEqual(self.autosave(session_id, self.answer(0), client=self.client_for(intruder)).status_code, 404)
+        self.assertEqual(self.autosave(session_id, self.answer(0), client=self.client_for(self.admin)).status_code, 403)
+        self.assertEqual(self.client_for(intruder).post(f'/api/exam-sessions/{session_id}/submit/').status_code, 404)
+        self.assertFalse(StudentAnswer.objects.exists())
+
+    @override_settings(AUTOSAVE_BUFFERED=None)
+    def test_process_local_cache_writes_through(self):
+        self.assertFalse(autosave.buffering_enabled())
+        session_id = self.start()
+        self.assertEqual(self.autosave(session_id, self.answer(0), self.answer(1)).status_code, 202)
+        self.autosave(session_id, self.answer(0, correct=False))
+        self.assertFalse(Job.objects.exists())
+        saved = dict(StudentAnswer.objects.values_list('question_id', 'selected_choice_id'))
+        self.assertEqual(saved[self.questions[0].pk], self.answer(0, correct=False)['selected_choice_id'])
+        self.assertEqual(len(saved), 2)
+        response = self.api.post(f'/api/exam-sessions/{session_id}/submit/', {}, format='json')
+        self.assertEqual(response.data['score'], 2)
+        # Another process may still hold the session in its local cache; the write checks the row.
+        autosave.remember_session(session_id, self.student.pk, {q.pk: set() for q in self.questions})
+        with self.assertRaises(autosave.SessionClosed):
+            autosave.save_answers(session_id, [self.answer(2)])
+
+    def test_buffering_without_a_shared_cache_is_flagged(self):
+        self.assertEqual([e.id for e in check_autosave_buffer(None)], ['api.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertTrue(autosave.cache_is_shared())
+            self.assertEqual(check_autosave_buffer(None), [])
+        with override_settings(AUTOSAVE_BUFFERED=None):
+            self.assertEqual(check_autosave_buffer(None), [])
+
+
+class ExamPaperVariantTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.questions = [make_question(self.specialization, text=f'P{i}') for i in range(6)]
+        self.url = f'/api/exam-definitions/{self.definition.pk}/'
+
+    def build(self, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.admin).post(f'{self.url}variants/', params, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def start(self, user=None):
+        return self.client_for(user or self.student).post(f'{self.url}start/')
+
+    def test_variants_shuffle_one_question_set(self):
+        variants = self.build(count=4, num_questions=5, seed=1)
+        self.assertEqual([v['number'] for v in variants], [1, 2, 3, 4])
+        question_sets = {frozenset(pk for pk, _ in v['layout']) for v in variants}
+        self.assertEqual(len(question_sets), 1)
+        self.assertEqual(len(next(iter(question_sets))), 5)
+        self.assertGreater(len({tuple(pk for pk, _ in v['layout']) for v in variants}), 1)
+        for question_id, choice_ids in variants[0]['layout']:
+            self.assertEqual(sorted(choice_ids), list(Choice.objects.filter(
+                question_id=question_id,
+            ).order_by('id').values_list('id', flat=True)))
+        listed = self.client_for(self.admin).get(f'{self.url}variants/').data
+        self.assertEqual([v['layout'] for v in listed], [v['layout'] for v in variants])
+
+    def test_start_hands_out_variants_in_turn_from_the_cache(self):
+        variants = {v['number']: v['layout'] for v in self.build(count=3, question_ids=[q.pk for q in self.questions])}
+        papers = []
+        with self.assertNumQueries(0):
+            for _ in range(6):
+                response = self.start()
+                self.assertEqual(response.status_code, 200)
+                papers.append(json.loads(response.content))
+        numbers = [paper['variant'] for paper in papers]
+        self.assertEqual(sorted(numbers), [1, 1, 2, 2, 3, 3])
+        self.assertEqual(numbers[:3], numbers[3:])
+        paper = papers[0]
+        self.assertEqual(
+            [[q['id'], [c['id'] for c in q['choices']]] for q in paper['questions']], variants[paper['variant']],
+        )
+        self.assertEqual(set(paper['questions'][0]), set(QuestionSerializer(self.questions[0]).data))
+
+    def test_edited_questions_are_rendered_again(self):
+        self.build(count=1, question_ids=[self.questions[0].pk])
+        self.assertEqual(json.loads(self.start().content)['questions'][0]['text'], 'P0')
+        with self.captureOnCommitCallbacks(execute=True):
+            question = Question.objects.get(pk=self.questions[0].pk)
+            question.text = 'Edited'
+            question.save()
+        self.assertEqual(json.loads(self.start().content)['questions'][0]['text'], 'Edited')
+
+    def test_rebuilding_replaces_the_papers(self):
+        self.build(count=2, question_ids=[self.questions[0].pk])
+        self.build(count=1, question_ids=[self.questions[1].pk])
+        for _ in range(2):
+            paper = json.loads(self.start().content)
+            self.assertEqual(paper['variant'], 1)
+            self.assertEqual([q['id'] for q in paper['questions']], [self.questions[1].pk])
+
+    def test_deleted_definition_stops_handing_out_papers(self):
+        self.build(count=1, num_questions=2)
+        self.assertEqual(self.start().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            AdminExamDefinition.objects.filter(pk=self.definition.pk).get().delete()
+        self.assertEqual(self.start().status_code, 404)
+
+    def test_validation_and_permissions(self):
+        self.assertEqual(self.start().status_code, 404)
+        admin = self.client_for(self.admin)
+        self.assertEqual(admin.post(f'{self.url}variants/', {'count': 2}, format='json').status_code, 400)
+        other = make_question(Specialization.objects.create(name='Other'), text='Elsewhere')
+        response = admin.post(f'{self.url}variants/', {'question_ids': [other.pk]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('question_ids', response.data)
+        self.assertEqual(
+            self.client_for(self.student).post(f'{self.url}variants/', {'num_questions': 2}, format='json').status_code,
+            403,
+        )
+        self.build(count=1, num_questions=2)
+        self.assertEqual(self.start(self.admin).status_code, 403)
+
+
+class AdaptiveExamTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        adaptive._indexes.clear()
+        self.api = self.client_for(self.student)
+        # Calibrated from easiest to hardest.
+        self.questions = [make_question(self.specialization, text=f'A{i}', mark=i + 1) for i in range(7)]
+        now = timezone.now()
+        ItemCalibration.objects.bulk_create([
+            ItemCalibration(question=q, difficulty=i - 3.0, responses=10, calibrated_at=now)
+            for i, q in enumerate(self.questions)
+        ])
+        self.difficulty = {q.pk: i - 3.0 for i, q in enumerate(self.questions)}
+
+    def start(self, num_questions=4):
+        response = self.api.post('/api/exam-sessions/adaptive/', {
+            'specialization_id': self.specialization.pk, 'exam_name': 'Adaptive', 'num_questions': num_questions,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def answer(self, progress, correct=True, question_id=None):
+        question = progress['question']
+        choice = next(c for c in question['choices'] if c['is_correct'] == correct)
+        return self.api.post(f'/api/exam-sessions/{progress["id"]}/answer/', {
+            'question_id': question_id or question['id'], 'selected_choice_id': choice['id'],
+        }, format='json')
+
+    def test_select_question_bisects_to_the_nearest_unasked_question(self):
+        index = ([-2.0, -1.0, 0.0, 1.0, 2.0], [10, 11, 12, 13, 14])
+        self.assertEqual(adaptive.select_question(index, 0.9, (), width=1), (13, 1.0))
+        self.assertEqual(adaptive.select_question(index, 0.9, {13}, width=1), (12, 0.0))
+        self.assertEqual(adaptive.select_question(index, 9.0, {13, 14}, width=1), (12, 0.0))
+        self.assertEqual(adaptive.select_question(index, -9.0, (), width=1), (10, -2.0))
+        self.assertIsNone(adaptive.select_question(index, 0.0, {10, 11, 12, 13, 14}))
+        picks = {adaptive.select_question(index, 0.1, {12}, width=2)[0] for _ in range(50)}
+        self.assertEqual(picks, {11, 13})
+
+    def test_ability_moves_with_each_answer_and_stays_finite(self):
+        ability, precision = adaptive.update_ability(0.0, 1.0, 0.0, True)
+        self.assertGreater(ability, 0)
+        self.assertEqual(precision, 1.25)
+        self.assertLess(adaptive.update_ability(0.0, 1.0, 0.0, False)[0], 0)
+        for _ in range(200):
+            ability, precision = adaptive.update_ability(ability, precision, ability, True)
+        self.assertTrue(0 < ability < 100)
+        self.assertLess(adaptive.standard_error(precision), 0.2)
+
+    def test_index_falls_back_to_statistics_and_follows_calibration(self):
+        easy, hard = (make_question(self.specialization, text=text) for text in ('Easy', 'Hard'))
+        QuestionStatistics.objects.create(question=easy, attempts=12, correct=9, skipped=2)
+        QuestionStatistics.objects.create(question=hard, attempts=10, correct=1)
+        self.assertAlmostEqual(adaptive.estimated_difficulty(12, 9, 2), math.log(2 / 10))
+        self.assertEqual(adaptive.estimated_difficulty(0, 0, 0), 0.0)
+        difficulties, question_ids, choices = adaptive.difficulty_index(self.specialization.pk)
+        self.assertEqual(difficulties, sorted(difficulties))
+        self.assertEqual(choices[easy.pk], {c.pk: c.is_correct for c in easy.choices.all()})
+        self.assertEqual(len(question_ids), 9)
+        self.assertLess(difficulties[question_ids.index(easy.pk)], 0)
+        self.assertGreater(difficulties[question_ids.index(hard.pk)], 0)
+        with self.assertNumQueries(0):
+            adaptive.difficulty_index(self.specialization.pk)
+
+        ItemCalibration.objects.create(question=easy, difficulty=5.0, responses=3, calibrated_at=timezone.now())
+        self.assertNotEqual(adaptive.difficulty_index(self.specialization.pk)[1][-1], easy.pk)
+        adaptive.invalidate_difficulty_indexes()
+        self.assertEqual(adaptive.difficulty_index(self.specialization.pk)[1][-1], easy.pk)
+
+        QuestionStatistics.objects.filter(question=hard).update(correct=10)
+        self.assertGreater(adaptive.difficulty_index(self.specialization.pk)[0][question_ids.index(hard.pk)], 0)
+        with override_settings(ADAPTIVE_INDEX_REFRESH=-1):
+            difficulties, question_ids, _ = adaptive.difficulty_index(self.specialization.pk)
+        self.assertLess(difficulties[question_ids.index(hard.pk)], 0)
+
+    def test_answers_cost_a_fixed_number_of_queries(self):
+        progress = self.answer(self.start(num_questions=4)).data
+        for question in self.questions:
+            adaptive.question_payload(question.pk, self.specialization.pk)
+        # Locked read, answer upsert, next question and state update, within a
+        # savepoint; the index and the question payload come from the caches.
+        with self.assertNumQueries(6):
+            response = self.answer(progress)
+        self.assertEqual(response.status_code, 200, response.data)
+        state = AdaptiveState.objects.get(pk=progress['id'])
+        self.assertEqual(sorted(state.asked), sorted(state.session.questions.values_list('id', flat=True)))
+        self.assertEqual(state.asked[-1], response.data['question']['id'])
+
+    @override_settings(ADAPTIVE_SELECTION_WIDTH=1)
+    def test_adaptive_exam_follows_the_student(self):
+        progress = self.start()
+        first = progress['question']['id']
+        self.assertEqual(self.difficulty[first], 0.0)
+        self.assertEqual(progress['adaptive'], {'ability': 0.0, 'standard_error': 1.0, 'answered': 0, 'length': 4})
+        self.assertEqual(progress['status'], 'in_progress')
+
+        response = self.answer(progress, correct=True)
+        self.assertEqual(response.status_code, 200, response.data)
+        progress = response.data
+        self.assertGreater(progress['adaptive']['ability'], 0)
+        self.assertLess(progress['adaptive']['standard_error'], 1.0)
+        self.assertGreater(self.difficulty[progress['question']['id']], 0)
+
+        response = self.answer(progress, correct=False)
+        self.assertEqual(response.status_code, 200, response.data)
+        second, progress = progress['question']['id'], response.data
+        self.assertNotIn(progress['question']['id'], (first, second))
+        resumed = self.api.get(f'/api/exam-sessions/{progress["id"]}/resume/').data
+        self.assertEqual(len(resumed['questions']), 3)
+        self.assertEqual(len(resumed['answers']), 2)
+
+        while progress['question'] is not None:
+            progress = self.answer(progress, correct=True).data
+        self.assertEqual(progress['adaptive']['answered'], 4)
+        state = AdaptiveState.objects.get(pk=progress['id'])
+        self.assertIsNone(state.current_question_id)
+        self.assertEqual(state.session.questions.count(), 4)
+
+        response = self.api.post(f'/api/exam-sessions/{progress["id"]}/submit/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        answers = StudentAnswer.objects.filter(exam_session_id=progress['id']).select_related('question')
+        self.assertEqual(response.data['score'], sum(a.question.mark for a in answers if a.question_id != second))
+        self.assertEqual(QuestionStatistics.objects.get(pk=second).attempts, 1)
+
+    def test_answers_are_checked_one_question_at_a_time(self):
+        progress = self.start(num_questions=1)
+        session_id = progress['id']
+        other = next(q for q in self.questions if q.pk != progress['question']['id'])
+        response = self.answer(progress, question_id=other.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('question_id', response.data)
+        response = self.api.post(f'/api/exam-sessions/{session_id}/answer/', {
+            'question_id': progress['question']['id'], 'selected_choice_id': other.choices.first().pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('selected_choice_id', response.data)
+        question = progress['question']
+        saved = {'question_id': question['id'], 'selected_choice_id': question['choices'][0]['id']}
+        self.assertEqual(self.api.post(
+            f'/api/exam-sessions/{session_id}/autosave/', {'answers': [saved]}, format='json',
+        ).status_code, 400)
+        self.assertEqual(self.api.post(
+            f'/api/exam-sessions/{session_id}/submit/', {'answers': [saved]}, format='json',
+        ).status_code, 400)
+        other_student = User.objects.create_user(username='other', password='pw', role='student')
+        self.assertEqual(self.client_for(other_student).post(
+            f'/api/exam-sessions/{session_id}/answer/', saved, format='json',
+        ).status_code, 404)
+
+        done = self.answer(progress).data
+        self.assertIsNone(done['question'])
+        self.assertEqual(self.answer(progress).status_code, 400)
+        self.assertEqual(self.api.post(f'/api/exam-sessions/{session_id}/submit/', {}, format='json').status_code, 200)
+        self.assertEqual(self.answer(progress).status_code, 409)
+
+    def test_start_validation_and_permissions(self):
+        empty = Specialization.objects.create(name='Empty')
+        for data in ({'specialization_id': empty.pk}, {'specialization_id': 0}, {'num_questions': 0}):
+            response = self.api.post('/api/exam-sessions/adaptive/', {
+                'specialization_id': self.specialization.pk, 'exam_name': 'Adaptive', **data,
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client_for(self.admin).post('/api/exam-sessions/adaptive/', {
+            'specialization_id': self.specialization.pk, 'exam_name': 'Adaptive',
+        }, format='json').status_code, 403)
+        self.assertEqual(self.start(num_questions=50)['adaptive']['length'], 7)
+
+    def simulate_answers(self):
+        """Ten completed sessions on three questions, the first answered right most often and the last least."""
+        easy, middle, hard = self.questions[:3]
+        correct = {q.pk: q.choices.get(is_correct=True) for q in (easy, middle, hard)}
+        wrong = {q.pk: q.choices.filter(is_correct=False).order_by('id').first() for q in (easy, middle, hard)}
+        for n in range(10):
+            session = make_session(self.student, self.specialization, [])
+            StudentAnswer.objects.bulk_create([
+                StudentAnswer(exam_session=session, question=q, selected_choice=(correct if n < right else wrong)[q.pk])
+                for q, right in ((easy, 9), (middle, 5), (hard, 1))
+            ])
+        return easy, middle, hard
+
+    @skipUnless(adaptive.np, 'numpy is not installed')
+    def test_calibration_orders_questions_by_difficulty(self):
+        easy, middle, hard = self.simulate_answers()
+        # An in-progress session carries no evidence yet.
+        ExamSession.objects.create(
+            student=self.student, specialization=self.specialization, exam_name='Open', status='in_progress',
+        ).answers.create(question=self.questions[6], selected_choice=self.questions[6].choices.first())
+        before = adaptive.difficulty_index(self.specialization.pk)
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('calibrate_items', stdout=out)
+        self.assertIn('Calibrated 3 questions', out.getvalue())
+        fitted = {c.question_id: c for c in ItemCalibration.objects.filter(question__in=(easy, middle, hard))}
+        self.assertLess(fitted[easy.pk].difficulty, fitted[middle.pk].difficulty)
+        self.assertLess(fitted[middle.pk].difficulty, fitted[hard.pk].difficulty)
+        self.assertAlmostEqual(fitted[middle.pk].difficulty, 0.0, delta=0.5)
+        self.assertEqual(fitted[easy.pk].responses, 10)
+        self.assertEqual(ItemCalibration.objects.get(question=self.questions[6]).difficulty, 3.0)
+        self.assertNotEqual(adaptive.difficulty_index(self.specialization.pk), before)
+
+    def test_calibration_needs_numpy(self):
+        with mock.patch.object(adaptive, 'np', None), self.assertRaisesMessage(CommandError, 'numpy'):
+            call_command('calibrate_items', stdout=StringIO())
+
+
+class ItemStatisticsTests(APITestCase):
+    url = '/api/item-statistics/'
+
+    def setUp(self):
+        self.first = make_question(self.specialization, text='First')
+        self.second = make_question(self.specialization, text='Second')
+        choices = {q.pk: list(q.choices.order_by('id')) for q in (self.first, self.second)}
+        # (first, second) picked choice index per session; choice 0 is correct, None is skipped.
+        for picked in [(0, 0), (0, 1), (2, None)]:
+            answers = [
+                {'question_id': q.pk, 'selected_choice_id': choices[q.pk][i].pk if i is not None else None}
+                for q, i in zip((self.first, self.second), picked)
+            ]
+            response = self.client_for(self.student).post('/api/student/exam-sessions/submit/', {
+                'specialization_id': self.specialization.pk, 'admin_exam_definition_id': None,
+                'exam_name': 'Quiz', 'questions_in_session': [{'id': self.first.pk}, {'id': self.second.pk}],
+                'answers': answers,
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+
+    def fetch(self, query=''):
+        response = self.client_for(self.admin).get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_statistics_are_maintained_on_submission(self):
+        first, second = self.fetch()
+        self.assertEqual((first['attempts'], first['correct'], first['skipped']), (3, 2, 0))
+        self.assertAlmostEqual(first['correct_rate'], 2 / 3)
+        # Scores 1.0 and 0.5 when correct, 0.0 when wrong.
+        self.assertAlmostEqual(first['discrimination'], 0.866, places=3)
+        self.assertEqual([c['picks'] for c in first['choices']], [2, 0, 1, 0])
+        self.assertAlmostEqual(first['choices'][2]['pick_rate'], 1 / 3)
+        self.assertEqual((second['attempts'], second['correct'], second['skipped']), (3, 1, 1))
+
+    def test_ordering_and_filters(self):
+        self.assertEqual([r['question'] for r in self.fetch('?ordering=correct_rate')], [self.second.pk, self.first.pk])
+        self.assertEqual(self.fetch('?min_attempts=4'), [])
+        response = self.client_for(self.admin).get(self.url + '?ordering=text')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client_for(self.student).get(self.url).status_code, 403)
+
+    def test_rebuild_matches_incremental(self):
+        before = self.fetch()
+        QuestionStatistics.objects.all().delete()
+        ChoiceStatistics.objects.all().delete()
+        call_command('rebuild_item_statistics', stdout=StringIO())
+        self.assertEqual(self.fetch(), before)
+
+    def test_migration_backfills_existing_sessions(self):
+        before = self.fetch()
+        QuestionStatistics.objects.all().delete()
+        ChoiceStatistics.objects.all().delete()
+        migration = importlib.import_module('api.migrations.0006_item_statistics')
+        historical = MigrationLoader(connection).project_state(('api', '0006_item_statistics')).apps
+        migration.backfill_statistics(historical, None)
+        self.assertEqual(self.fetch(), before)
+
+
+@override_settings(RESULT_LEADERBOARD_SIZE=2)
+class ResultRollupTests(APITestCase):
+    def setUp(self):
+        self.questions = [make_question(self.specialization, text=f'R{i}', mark=1) for i in range(4)]
+        self.other = User.objects.create_user(username='other', password='pw', role='student')
+        self.third = User.objects.create_user(username='third', password='pw', role='student')
+
+    def submit(self, student, n_correct, definition=True):
+        response = self.client_for(student).post('/api/student/exam-sessions/submit/', {
+            'specialization_id': self.specialization.pk,
+            'admin_exam_definition_id': self.definition.pk if definition else None,
+            'exam_name': 'Midterm',
+            'questions_in_session': [{'id': q.pk} for q in self.questions],
+            'answers': [
+                {'question_id': q.pk, 'selected_choice_id': q.choices.filter(is_correct=i < n_correct).first().pk}
+                for i, q in enumerate(self.questions)
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def results(self, url):
+        response = self.client_for(self.admin).get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_rollup_is_maintained_on_submission(self):
+        first = self.submit(self.student, 1)
+        second = self.submit(self.other, 3)
+        self.submit(self.student, 4)
+        self.submit(self.third, 2, definition=False)
+
+        results = self.results(f'/api/exam-definitions/{self.definition.pk}/results/')
+        self.assertEqual(results['count'], 3)
+        self.assertAlmostEqual(results['mean_percent'], (25 + 75 + 100) / 3)
+        self.assertEqual((results['pass_count'], results['pass_rate']), (2, 2 / 3))
+        self.assertEqual(results['histogram'][2]['count'], 1)
+        self.assertEqual(results['histogram'][9]['count'], 1)
+        self.assertEqual(
+            [(e['username'], e['percent']) for e in results['leaderboard']], [('student', 100.0), ('other', 75.0)]
+        )
+        self.assertNotIn(first, [e['session'] for e in results['leaderboard']])
+        self.assertIn(second, [e['session'] for e in results['leaderboard']])
+
+        results = self.results(f'/api/specializations/{self.specialization.pk}/results/')
+        self.assertEqual(results['count'], 4)
+        self.assertEqual(results['pass_count'], 2)
+
+    def test_results_are_served_with_one_lookup(self):
+        self.submit(self.student, 2)
+        client = self.client_for(self.admin)
+        with CaptureQueriesContext(connection) as ctx:
+            client.get(f'/api/exam-definitions/{self.definition.pk}/results/')
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+
+    def test_empty_rollup_and_permissions(self):
+        results = self.results(f'/api/exam-definitions/{self.definition.pk}/results/')
+        self.assertEqual((results['count'], results['mean_percent'], results['leaderboard']), (0, None, []))
+        response = self.client_for(self.student).get(f'/api/specializations/{self.specialization.pk}/results/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_rebuild_matches_incremental(self):
+        for student, n in [(self.student, 1), (self.other, 3), (self.third, 3), (self.student, 4)]:
+            self.submit(student, n)
+        url = f'/api/exam-definitions/{self.definition.pk}/results/'
+        before = self.results(url)
+        ResultRollup.objects.all().delete()
+        call_command('rebuild_result_rollups', stdout=StringIO())
+        self.assertEqual(self.results(url), before)
+
+    def test_migration_backfills_existing_sessions(self):
+        for student, n in [(self.student, 1), (self.other, 3), (self.third, 3), (self.student, 4)]:
+            self.submit(student, n, definition=n != 4)
+        urls = [
+            f'/api/exam-definitions/{self.definition.pk}/results/',
+            f'/api/specializations/{self.specialization.pk}/results/',
+        ]
+        before = [self.results(url) for url in urls]
+        ResultRollup.objects.all().delete()
+        migration = importlib.import_module('api.migrations.0007_result_rollups')
+        historical = MigrationLoader(connection).project_state(('api', '0007_result_rollups')).apps
+        migration.backfill_rollups(historical, None)
+        self.assertEqual([self.results(url) for url in urls], before)
+
+    def test_token_submissions_keep_one_leaderboard_entry_per_student(self):
+        token = RoleTokenObtainPairSerializer.get_token(self.student).access_token
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        def submit(n_correct):
+            response = client.post('/api/student/exam-sessions/submit/', {
+                'specialization_id': self.specialization.pk, 'admin_exam_definition_id': self.definition.pk,
+                'exam_name': 'Midterm', 'questions_in_session': [{'id': q.pk} for q in self.questions],
+                'answers': [
+                    {'question_id': q.pk, 'selected_choice_id': q.choices.filter(is_correct=i < n_correct).first().pk}
+                    for i, q in enumerate(self.questions)
+                ],
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+
+        submit(1)
+        rebuild_rollups()
+        submit(3)
+        leaderboard = ResultRollup.objects.get(scope='definition', object_id=self.definition.pk).leaderboard
+        self.assertEqual([(e['student'], e['percent']) for e in leaderboard], [(self.student.pk, 75.0)])
+
+
+class ListingPaginationTests(APITestCase):
+    def test_question_cursor_walks_filtered_results(self):
+        expected = [make_question(self.specialization, text=f'P{i}').pk for i in range(5)]
+        make_question(self.specialization, text='Other year', course_year=3)
+        make_question(self.specialization, text='AI', is_ai_generated=True)
+
+        client = self.client_for(self.admin)
+        url = '/api/questions/?course_year=1&is_ai_generated=false&page_size=2'
+        seen = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [q['id'] for q in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_session_filters(self):
+        question = make_question(self.specialization)
+        other = User.objects.create_user(username='other', password='pw', role='student')
+        mine = make_session(self.student, self.specialization, [question])
+        make_session(other, self.specialization, [question])
+
+        response = self.client_for(self.admin).get(f'/api/exam-sessions/?student={self.student.pk}')
+        self.assertEqual([s['id'] for s in response.data['results']], [mine.pk])
+
+        response = self.client_for(self.admin).get('/api/exam-sessions/?completed_before=2000-01-01')
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_filter_value(self):
+        response = self.client_for(self.admin).get('/api/questions/?course_year=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('course_year', response.data)
+
+
+class QuestionSearchTests(APITestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.loops = make_question(self.specialization, text='ما هي الحلقات التكرارية في بايثون؟')
+            self.sorting = make_question(self.specialization, text='Explain quicksort partitioning', n_choices=0)
+            self.other = make_question(self.specialization, text='Describe TCP handshake', course_year=2)
+            Attachment.objects.create(question=self.other, attachment_type='code', content='socket.connect(addr)')
+
+    def search(self, query, extra=''):
+        response = self.client_for(self.admin).get(f'/api/questions/?search={query}{extra}')
+        self.assertEqual(response.status_code, 200)
+        return [q['id'] for q in response.data['results']]
+
+    def test_normalize(self):
+        self.assertEqual(normalize('أَحْمَدُ إلى مدرسةٍ'), 'احمد الي مدرسه')
+
+    def test_migration_backfills_with_historical_models(self):
+        migration = importlib.import_module('api.migrations.0003_question_search_index')
+        self.assertEqual(migration.normalize('أَحْمَدُ إلى مدرسةٍ'), normalize('أَحْمَدُ إلى مدرسةٍ'))
+        historical = MigrationLoader(connection).project_state(('api', '0003_question_search_index')).apps
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {migration.SEARCH_TABLE}')
+        self.assertEqual(self.search('socket'), [])
+        # SQLite refuses a schema editor inside the test transaction; only its connection is used.
+        migration.create_search_index(historical, mock.Mock(connection=connection))
+        self.assertEqual(self.search('الحَلَقَات'), [self.loops.pk])
+        self.assertEqual(self.search('socket'), [self.other.pk])
+
+    def test_arabic_search_ignores_diacritics_and_alef_variants(self):
+        self.assertEqual(self.search('الحَلَقَات'), [self.loops.pk])
+        self.assertEqual(self.search('بايث'), [self.loops.pk])
+
+    def test_search_covers_attachments_and_respects_filters(self):
+        self.assertEqual(self.search('socket'), [self.other.pk])
+        self.assertEqual(self.search('socket', '&course_year=1'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sorting.text = 'Explain mergesort'
+            self.sorting.save()
+        self.assertEqual(self.search('quicksort'), [])
+        self.assertEqual(self.search('mergesort'), [self.sorting.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sorting.delete()
+        self.assertEqual(self.search('mergesort'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM api_question_search')
+        self.assertEqual(self.search('quicksort'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('quicksort'), [self.sorting.pk])
+
+
+class QuestionBankSnapshotTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = make_question(self.specialization)
+        self.url = f'/api/question-bank/{self.specialization.pk}/'
+        self.client = self.client_for(self.student)
+
+    def test_serves_bank_with_etag_and_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([q['id'] for q in json.loads(response.content)], [self.question.pk])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            choice = self.question.choices.first()
+            choice.text = 'Edited'
+            choice.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Edited', [c['text'] for c in json.loads(response.content)[0]['choices']])
+
+    def test_moving_a_question_invalidates_both_banks(self):
+        other = Specialization.objects.create(name='Networks')
+        other_url = f'/api/question-bank/{other.pk}/'
+        etag, other_etag = self.client.get(self.url)['ETag'], self.client.get(other_url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.specialization = other
+            self.question.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(other_url, HTTP_IF_NONE_MATCH=other_etag).status_code, 200)
+
+    def test_process_local_version_counters_are_flagged_for_deployment(self):
+        self.assertEqual([e.id for e in check_version_counters(None)], ['api.W002'])
+        self.assertIn('api.W002', [e.id for e in run_checks(include_deployment_checks=True)])
+        self.assertNotIn('api.W002', [e.id for e in run_checks()])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertEqual(check_version_counters(None), [])
+
+
+class ChangeFeedTests(APITestCase):
+    url = '/api/sync/'
+
+    def sync(self, user, since=0, extra=''):
+        response = self.client_for(user).get(f'{self.url}?since={since}{extra}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_returns_only_changes_since_cursor(self):
+        first = make_question(self.specialization, text='First')
+        cursor = self.sync(self.admin)['cursor']
+        second = make_question(self.specialization, text='Second')
+
+        feed = self.sync(self.admin, cursor)
+        self.assertEqual([q['id'] for q in feed['questions']], [second.pk])
+        self.assertFalse(feed['has_more'])
+
+        choice = first.choices.first()
+        choice.text = 'Edited'
+        choice.save()
+        feed = self.sync(self.admin, feed['cursor'])
+        self.assertEqual([q['id'] for q in feed['questions']], [first.pk])
+
+    def test_deletes_become_tombstones(self):
+        question = make_question(self.specialization)
+        cursor = self.sync(self.admin)['cursor']
+        question_id, definition_id = question.pk, self.definition.pk
+        question.delete()
+        self.definition.delete()
+        feed = self.sync(self.admin, cursor)
+        self.assertEqual(feed['questions'], [])
+        self.assertEqual(feed['deleted'], {'questions': [question_id], 'exam_definitions': [definition_id]})
+
+    def test_paging_and_specialization_filter(self):
+        other = Specialization.objects.create(name='Networks')
+        mine = [make_question(self.specialization, text=f'M{i}') for i in range(3)]
+        make_question(other)
+        feed = self.sync(self.student, extra=f'&specialization={self.specialization.pk}&limit=10')
+        self.assertEqual([q['id'] for q in feed['questions']], [q.pk for q in mine])
+        self.assertNotIn('exam_definitions', feed)
+
+        cursor, seen = 0, []
+        while True:
+            feed = self.sync(self.student, cursor, '&limit=2')
+            seen += [q['id'] for q in feed['questions']]
+            cursor = feed['cursor']
+            if not feed['has_more']:
+                break
+        self.assertEqual(set(seen), set(Question.objects.values_list('id', flat=True)))
+
+    def test_moved_question_is_dropped_from_old_specialization(self):
+        other = Specialization.objects.create(name='Networks')
+        question = make_question(self.specialization)
+        cursor = self.sync(self.admin)['cursor']
+        question.specialization = other
+        question.save()
+        old = self.sync(self.admin, cursor, f'&specialization={self.specialization.pk}')
+        self.assertEqual(old['deleted']['questions'], [question.pk])
+        unfiltered = self.sync(self.admin, cursor)
+        self.assertEqual([q['id'] for q in unfiltered['questions']], [question.pk])
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=60)
+    def test_recent_entries_wait_out_the_settle_window(self):
+        question = make_question(self.specialization)
+        feed = self.sync(self.admin)
+        self.assertEqual((feed['questions'], feed['cursor']), ([], 0))
+        ChangeLogEntry.objects.update(changed_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual([q['id'] for q in self.sync(self.admin)['questions']], [question.pk])
+
+    def test_prune_compacts_and_expires_old_cursors(self):
+        kept, edited = make_question(self.specialization, text='Kept'), make_question(self.specialization)
+        for text in ('Once', 'Twice'):
+            edited.text = text
+            edited.save()
+        before = self.sync(self.admin)
+        call_command('prune_change_log', stdout=StringIO())
+        self.assertEqual(ChangeLogEntry.objects.filter(object_id=edited.pk, entity='question').count(), 1)
+        self.assertEqual(self.sync(self.admin)['questions'], before['questions'])
+
+        ChangeLogEntry.objects.filter(object_id=kept.pk).update(changed_at=timezone.now() - timedelta(days=91))
+        out = StringIO()
+        call_command('prune_change_log', stdout=out)
+        self.assertIn('Deleted', out.getvalue())
+        self.assertFalse(ChangeLogEntry.objects.filter(object_id=kept.pk, entity='question').exists())
+        response = self.client_for(self.admin).get(f'{self.url}?since=0')
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.data['cursor'], before['cursor'])
+        edited_id = edited.pk
+        edited.delete()
+        feed = self.sync(self.admin, response.data['cursor'])
+        self.assertEqual(feed['deleted']['questions'], [edited_id])
+
+
+class QuestionTransferTests(APITestCase):
+    def setUp(self):
+        self.questions = [make_question(self.specialization, text=f'Export {i}', mark=i + 1) for i in range(3)]
+
+    def export(self, extra=''):
+        response = self.client_for(self.admin).get(f'/api/questions/export/{extra}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def reimport(self, content, name):
+        Question.objects.all().delete()
+        upload = SimpleUploadedFile(name, content)
+        return self.client_for(self.admin).post('/api/questions/import/', {'file': upload}, format='multipart')
+
+    def assertRoundTrip(self, content, name):
+        response = self.reimport(content, name)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 3)
+        imported = Question.objects.order_by('id')
+        self.assertEqual([q.text for q in imported], ['Export 0', 'Export 1', 'Export 2'])
+        self.assertEqual([q.mark for q in imported], [1, 2, 3])
+        self.assertEqual(Choice.objects.filter(question__in=imported).count(), 12)
+        self.assertEqual(Choice.objects.filter(question__in=imported, is_correct=True).count(), 3)
+        self.assertEqual(Attachment.objects.filter(question__in=imported).count(), 3)
+
+    def test_ndjson_round_trip(self):
+        content = self.export()
+        self.assertEqual(len(content.splitlines()), 3)
+        self.assertRoundTrip(content, 'bank.ndjson')
+
+    def test_csv_round_trip(self):
+        self.assertRoundTrip(self.export('?file_format=csv'), 'bank.csv')
+
+    def test_import_reports_bad_records_and_refreshes_indexes(self):
+        lines = [
+            json.dumps({'text': 'Imported', 'specialization': 'Networks', 'course_year': 2, 'mark': 1,
+                        'choices': [{'text': 'yes', 'is_correct': True}]}),
+            '{not json',
+            json.dumps({'text': 'No mark', 'specialization': 'Networks', 'course_year': 2}),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.reimport('\n'.join(lines).encode(), 'bank.ndjson')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([e['record'] for e in response.data['errors']], [2, 3])
+        question = Question.objects.get(text='Imported')
+        self.assertEqual(question.specialization.name, 'Networks')
+        self.assertEqual(search_question_ids('imported'), [question.pk])
+        self.assertTrue(ChangeLogEntry.objects.filter(entity='question', object_id=question.pk).exists())
+
+    def test_import_rejects_malformed_records_one_by_one(self):
+        def record(**overrides):
+            fields = {'text': 'Imported', 'specialization': 'Networks', 'course_year': 2, 'mark': 1,
+                      'choices': [{'text': 'yes', 'is_correct': 'true'}, {'text': 'no', 'is_correct': 'false'}]}
+            return json.dumps({**fields, **overrides}).encode()
+
+        lines = [
+            record(specialization=None),
+            record(choices=[{'text': 'x' * 256}]),
+            b'{"text": "\xff\xfe"}',
+            record(attachments=[{'attachment_type': 'video'}]),
+            record(specialization='x' * 101),
+            record(is_ai_generated='false'),
+        ]
+        response = self.reimport(b'\n'.join(lines), 'bank.ndjson')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([e['record'] for e in response.data['errors']], [1, 2, 3, 4, 5])
+        self.assertIn('not valid utf-8', response.data['errors'][2]['error'])
+        question = Question.objects.get(text='Imported')
+        self.assertFalse(question.is_ai_generated)
+        self.assertEqual(list(question.choices.order_by('id').values_list('is_correct', flat=True)), [True, False])
+        self.assertEqual(set(Specialization.objects.values_list('name', flat=True)), {'Networks', self.specialization.name})
+
+    def test_csv_import_reports_undecodable_lines(self):
+        content = self.export('?file_format=csv').replace(b'Export 1', b'Export \xff')
+        response = self.reimport(content, 'bank.csv')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([e['record'] for e in response.data['errors']], [2])
+
+    def test_import_query_count_is_bounded_per_chunk(self):
+        record = json.dumps({'text': 'Bulk', 'specialization': self.specialization.name, 'course_year': 1, 'mark': 1,
+                             'choices': [{'text': 'a', 'is_correct': True}, {'text': 'b'}]})
+
+        def count(n):
+            with CaptureQueriesContext(connection) as ctx:
+                result = import_records(parse_ndjson([record] * n), chunk_size=1000)
+            self.assertEqual(result['created'], n)
+            return len(ctx.captured_queries)
+
+        # 20 records keep the 16 LSH bucket rows per question within one SQLite insert batch.
+        self.assertEqual(count(5), count(20))
+
+    def test_management_commands(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bank.ndjson')
+            call_command('export_questions', output=path)
+            Question.objects.all().delete()
+            out = StringIO()
+            call_command('import_questions', path, stdout=out)
+        self.assertIn('Imported 3 questions', out.getvalue())
+        self.assertEqual(Question.objects.count(), 3)
+
+    def test_requires_admin(self):
+        response = self.client_for(self.student).get('/api/questions/export/')
+        self.assertEqual(response.status_code, 403)
+
+
+class AIProxyTests(TestCase):
+    config = AIConfig(api_key='test-key', model='test-model')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_coalesces_identical_prompts_and_caches(self):
+        backend = StubBackend(delay=0.05)
+        proxy = AIProxy(backend, max_concurrency=4, cache_timeout=60)
+
+        async def run():
+            results = await asyncio.gather(*[
+                proxy.generate(self.config, 'same 2 أسئلة', temperature=0.7) for _ in range(10)
+            ])
+            again = await proxy.generate(self.config, 'same 2 أسئلة', temperature=0.7)
+            return results, again
+
+        results, again = asyncio.run(run())
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(len(set(results + [again])), 1)
+
+    def test_bounds_outstanding_upstream_calls(self):
+        backend = StubBackend(delay=0.02)
+        proxy = AIProxy(backend, max_concurrency=3, cache_timeout=60)
+
+        async def run():
+            await asyncio.gather(*[
+                proxy.generate(self.config, f'prompt {i}', temperature=0.7) for i in range(12)
+            ])
+
+        asyncio.run(run())
+        self.assertEqual(backend.calls, 12)
+        self.assertEqual(backend.peak, 3)
+
+    def test_cache_key_depends_on_model(self):
+        self.assertNotEqual(response_cache_key('a', 'prompt'), response_cache_key('b', 'prompt'))
+
+    def test_parse_forces_single_correct_choice(self):
+        text = '```json\n[{"text": "Q", "choices": [{"text": "a", "is_correct": true}, {"text": "b", "is_correct": true}]}]\n```'
+        [question] = parse_generated_questions(text)
+        self.assertEqual([c['is_correct'] for c in question['choices']], [True, False])
+        with self.assertRaises(AIResponseError):
+            parse_generated_questions('{"not": "a list"}')
+
+    def test_parse_rejects_bad_numbers_and_choices(self):
+        two_choices = '[{"text": "a", "is_correct": true}, {"text": "b"}]'
+        for question in [
+            f'{{"text": "Q", "choices": {two_choices}, "mark": "five"}}',
+            f'{{"text": "Q", "choices": {two_choices}, "course_year": [2]}}',
+            '{"text": "Q", "choices": "a, b"}',
+            '{"text": "Q", "choices": [{"text": "a", "is_correct": true}, "b", 3]}',
+        ]:
+            with self.subTest(question=question), self.assertRaises(AIResponseError):
+                parse_generated_questions(f'[{question}]')
+        [question] = parse_generated_questions(f'[{{"text": "Q", "choices": {two_choices}, "mark": "2"}}]')
+        self.assertEqual(question['mark'], 2)
+
+
+@override_settings(AI_BACKEND='api.ai.backends.StubBackend', AI_STUB_DELAY=0)
+class GenerateFromExamplesTests(APITestCase):
+    url = '/api/ai/generate-questions-from-examples/'
+
+    def setUp(self):
+        cache.clear()
+        AISettings.objects.create(gemini_api_key='test-key', selected_model_name='test-model')
+        self.payload = {
+            'example_questions': [{'text': 'مثال', 'choices': [{'text': 'a', 'is_correct': True}], 'mark': 5}],
+            'specialization_name': self.specialization.name,
+            'num_questions': 3,
+        }
+
+    def post(self, user, payload=None):
+        token = AccessToken.for_user(user)
+        return self.client.post(
+            self.url, json.dumps(payload or self.payload), content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+
+    def test_admin_generation_is_saved(self):
+        response = self.post(self.admin)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(Question.objects.filter(is_ai_generated=True).count(), 3)
+
+    def test_student_generation_is_not_saved(self):
+        response = self.post(self.student)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        self.assertFalse(Question.objects.exists())
+
+    def test_requires_authentication_and_key(self):
+        self.assertEqual(self.client.post(self.url, '{}', content_type='application/json').status_code, 401)
+        AISettings.objects.all().delete()
+        with mock.patch.dict(os.environ, {'GEMINI_API_KEY': ''}):
+            self.assertEqual(self.post(self.student).status_code, 503)
+
+    def test_invalid_payload(self):
+        self.assertEqual(self.post(self.student, {'num_questions': 0}).status_code, 400)
+
+    def test_malformed_model_output_is_a_bad_gateway(self):
+        output = '[{"text": "Q", "choices": [{"text": "a", "is_correct": true}, {"text": "b"}], "mark": "five"}]'
+        with mock.patch.object(StubBackend, 'generate', mock.AsyncMock(return_value=output)):
+            self.assertEqual(self.post(self.admin).status_code, 502)
+        self.assertFalse(Question.objects.exists())
+
+
+@skipUnless(pdf.PdfReader, 'pypdf is not installed')
+@override_settings(AI_BACKEND='api.ai.backends.StubBackend', AI_STUB_DELAY=0)
+class PDFIngestionTests(APITestCase):
+    url = '/api/ai/generate-questions-from-pdf/'
+
+    def setUp(self):
+        cache.clear()
+        AISettings.objects.create(gemini_api_key='test-key', selected_model_name='test-model')
+
+    def test_chunk_pages_respects_budget_and_stops_early(self):
+        consumed = []
+
+        def pages():
+            for index in range(100):
+                consumed.append(index)
+                yield 'x' * 30
+
+        chunks = chunk_pages(pages(), token_budget=10, max_chunks=2)
+        self.assertEqual([len(c) for c in chunks], [40, 40])
+        self.assertLess(len(consumed), 10)
+
+    @override_settings(AI_PDF_PARALLEL_PAGES=3, AI_PDF_BATCH_PAGES=2)
+    def test_parallel_extraction_keeps_page_order(self):
+        texts = [f'Page {i}' for i in range(7)]
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as handle:
+            handle.write(make_pdf(texts))
+            handle.flush()
+            self.assertEqual(list(pdf.iter_page_texts(handle.name, workers=2)), texts)
+            executor = pdf.get_executor()
+            self.assertEqual(list(pdf.iter_page_texts(handle.name, workers=2)), texts)
+            self.assertIs(pdf.get_executor(), executor)
+            self.assertEqual(list(pdf.iter_page_texts(handle.name, workers=1)), texts)
+        with override_settings(AI_PDF_WORKERS=1):
+            self.assertIsNot(pdf.get_executor(), executor)
+
+    def test_page_extraction_errors_are_extraction_errors(self):
+        content = make_pdf(['Page 0', 'Page 1'])
+        token = AccessToken.for_user(self.admin)
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as handle, \
+                mock.patch('pypdf.PageObject.extract_text', side_effect=KeyError('/Contents')):
+            handle.write(content)
+            handle.flush()
+            with self.assertRaisesMessage(pdf.PDFExtractionError, 'page 1'):
+                list(pdf.iter_page_texts(handle.name, workers=1))
+            with self.assertRaisesMessage(pdf.PDFExtractionError, 'page 2'):
+                pdf._extract_range(handle.name, 1, 2)
+            response = self.client.post(self.url, {
+                'file': SimpleUploadedFile('lecture.pdf', content),
+                'specialization_name': self.specialization.name, 'num_questions': 2,
+            }, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('page 1', response.json()['detail'])
+
+    def test_extraction_is_cached_by_content_hash(self):
+        content = make_pdf(['Operating systems schedule processes'])
+        first = pdf.extract_chunks(SimpleUploadedFile('a.pdf', content))
+        with mock.patch.object(pdf, 'iter_page_texts') as extract:
+            second = pdf.extract_chunks(SimpleUploadedFile('renamed.pdf', content))
+        extract.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertIn('schedule processes', first[0])
+
+    def test_endpoint_generates_from_pdf(self):
+        token = AccessToken.for_user(self.admin)
+        upload = SimpleUploadedFile('lecture.pdf', make_pdf(['Graphs', 'Trees']), content_type='application/pdf')
+        response = self.client.post(self.url, {
+            'file': upload, 'specialization_name': self.specialization.name, 'num_questions': 2,
+        }, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_rejects_unreadable_pdf(self):
+        token = AccessToken.for_user(self.student)
+        upload = SimpleUploadedFile('broken.pdf', b'not a pdf')
+        response = self.client.post(self.url, {
+            'file': upload, 'specialization_name': self.specialization.name, 'num_questions': 2,
+        }, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AI_BACKEND='api.ai.backends.StubBackend', AI_STUB_DELAY=0)
+class DuplicateDetectionTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.original = make_question(self.specialization, text='ما هو التعقيد الزمني للبحث الثنائي في مصفوفة مرتبة؟')
+            self.reworded = make_question(self.specialization, text='ما هو التعقيد الزمني للبحث الثنائي في مصفوفة مرتّبة')
+            self.other = make_question(self.specialization, text='Describe the TCP three-way handshake')
+
+    def test_find_near_duplicates(self):
+        text = 'ما هو التعقيد الزمني للبحث الثنائي في مصفوفة مرتبة؟'
+        choices = [f'{text} choice {i}' for i in range(4)]
+        matches = find_near_duplicates(text, choices)
+        self.assertEqual(matches[0], (self.original.pk, 1.0))
+        self.assertEqual({pk for pk, _ in matches}, {self.original.pk, self.reworded.pk})
+        self.assertEqual(find_near_duplicates(text, choices, specialization_id=0), [])
+
+    def test_migration_indexes_existing_questions(self):
+        indexed = list(QuestionLSHBucket.objects.order_by('question_id', 'key').values_list('question_id', 'key'))
+        QuestionSignature.objects.all().delete()
+        QuestionLSHBucket.objects.all().delete()
+        text = 'ما هو التعقيد الزمني للبحث الثنائي في مصفوفة مرتبة؟'
+        self.assertEqual(find_near_duplicates(text, [f'{text} choice {i}' for i in range(4)]), [])
+        migration = importlib.import_module('api.migrations.0005_question_duplicate_index')
+        historical = MigrationLoader(connection).project_state(('api', '0005_question_duplicate_index')).apps
+        migration.index_existing_questions(historical, None)
+        self.assertEqual(
+            list(QuestionLSHBucket.objects.order_by('question_id', 'key').values_list('question_id', 'key')), indexed,
+        )
+        self.assertEqual(find_near_duplicates(text, [f'{text} choice {i}' for i in range(4)])[0][0], self.original.pk)
+
+    def test_filter_duplicates_checks_bank_and_batch(self):
+        fresh = {'text': 'Explain how a B-tree stays balanced on insert', 'choices': [{'text': 'Splits'}]}
+        copy = {'text': 'Describe the TCP three-way handshake', 'choices': [
+            {'text': f'Describe the TCP three-way handshake choice {i}'} for i in range(4)
+        ]}
+        unique, duplicates = filter_duplicates([fresh, copy, dict(fresh)], self.specialization.pk)
+        self.assertEqual(unique, [fresh])
+        self.assertEqual(len(duplicates), 2)
+
+    def test_report_clusters(self):
+        response = self.client_for(self.admin).get('/api/questions/duplicates/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['clusters'][0]['question_ids'], [self.original.pk, self.reworded.pk])
+        response = self.client_for(self.admin).get('/api/questions/duplicates/?threshold=1')
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(self.client_for(self.student).get('/api/questions/duplicates/').status_code, 403)
+
+    def test_index_follows_edits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reworded.text = 'Explain quicksort partitioning'
+            self.reworded.save()
+        self.assertEqual(self.client_for(self.admin).get('/api/questions/duplicates/').data['count'], 0)
+
+    def test_ai_generation_skips_duplicates(self):
+        AISettings.objects.create(gemini_api_key='test-key', selected_model_name='test-model')
+        payload = {
+            'example_questions': [{'text': 'مثال', 'choices': [{'text': 'a', 'is_correct': True}]}],
+            'specialization_name': self.specialization.name,
+            'num_questions': 3,
+        }
+        token = AccessToken.for_user(self.admin)
+        for expected_saved, expected_skipped in [(3, '0'), (0, '3')]:
+            response = self.client.post(
+                '/api/ai/generate-questions-from-examples/', json.dumps(payload),
+                content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}',
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.json()), expected_saved)
+            self.assertEqual(response['X-Duplicates-Skipped'], expected_skipped)
+        self.assertEqual(Question.objects.filter(is_ai_generated=True).count(), 3)
+
+    def test_rebuild_command(self):
+        QuestionSignature.objects.all().delete()
+        self.assertEqual(self.client_for(self.admin).get('/api/questions/duplicates/').data['count'], 0)
+        call_command('rebuild_duplicate_index', stdout=StringIO())
+        self.assertEqual(self.client_for(self.admin).get('/api/questions/duplicates/').data['count'], 1)
+
+
+class BlobStorageTests(APITestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.question = make_question(self.specialization, text='Diagram question')
+        self.content = b'0123456789' * 10
+
+    def attach(self, name='diagram.png', content=None):
+        upload = SimpleUploadedFile(name, content or self.content, content_type='image/png')
+        return Attachment.objects.create(question=self.question, attachment_type='diagram', file=upload, file_name=name)
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self.attach(), self.attach('copy.png')
+        blob = Blob.objects.get()
+        self.assertEqual((first.blob_id, second.blob_id), (blob.pk, blob.pk))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual((blob.ref_count, blob.size, blob.content_type), (2, 100, 'image/png'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(blob.file.path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(blob.file.path))
+
+    def test_replacing_a_file_moves_the_reference(self):
+        attachment = self.attach()
+        old = attachment.blob_id
+        attachment.file = SimpleUploadedFile('new.png', b'other bytes')
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.save()
+        self.assertNotEqual(attachment.blob_id, old)
+        self.assertEqual(list(Blob.objects.values_list('ref_count', flat=True)), [1])
+
+    def test_store_takes_the_reference_before_collection(self):
+        attachment = self.attach()
+        with self.captureOnCommitCallbacks() as callbacks:
+            attachment.delete()
+        # An upload of the same bytes lands before the queued collection runs.
+        blob = store(SimpleUploadedFile('again.png', self.content))
+        self.assertEqual(blob.ref_count, 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(blob.file.path))
+
+    def test_rolled_back_upload_leaves_no_file(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            attachment = self.attach()
+            path = attachment.file.path
+            self.assertTrue(os.path.exists(path))
+            raise RuntimeError
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+        # A committed blob keeps its file when a later write of the same bytes rolls back.
+        kept = self.attach()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.attach('copy.png')
+            raise RuntimeError
+        self.assertTrue(os.path.exists(kept.file.path))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+    def test_serving_with_ranges_and_immutable_caching(self):
+        attachment = self.attach()
+        client = self.client_for(self.student)
+        url = f'/api/blobs/{attachment.blob_id}/'
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        response = client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+        self.assertEqual(client.get(url, HTTP_RANGE='bytes=500-').status_code, 416)
+
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(client.get(f'/api/blobs/{attachment.blob_id}/thumbnail/').status_code, 404)
+        self.assertEqual(APIClient().get(url).status_code, 401)
+
+    @override_settings(ATTACHMENT_SENDFILE='x-accel-redirect')
+    def test_sendfile_hands_off_to_front_end_server(self):
+        attachment = self.attach()
+        response = self.client_for(self.student).get(f'/api/blobs/{attachment.blob_id}/')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{attachment.file.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_question_listing_links_blobs(self):
+        attachment = self.attach()
+        response = self.client_for(self.student).get(f'/api/questions/{self.question.pk}/')
+        urls = [a['url'] for a in response.data['attachments']]
+        self.assertIn(f'/api/blobs/{attachment.blob_id}/', urls)
+
+    def test_imported_attachments_share_existing_blobs(self):
+        attachment = self.attach()
+        record = json.dumps({
+            'text': 'Imported', 'specialization': self.specialization.name, 'course_year': 1, 'mark': 1,
+            'attachments': [{'attachment_type': 'diagram', 'file': attachment.file.name}],
+        })
+        self.assertEqual(import_records(parse_ndjson([record]))['created'], 1)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    @skipUnless(Image, 'Pillow is not installed')
+    def test_thumbnails_are_generated_offline(self):
+        image = tempfile.SpooledTemporaryFile()
+        Image.new('RGB', (800, 600), 'red').save(image, 'PNG')
+        image.seek(0)
+        attachment = self.attach(content=image.read())
+        self.assertEqual(generate_thumbnails(workers=1), (1, 0))
+        response = self.client_for(self.student).get(f'/api/blobs/{attachment.blob_id}/thumbnail/')
+        self.assertEqual(response.status_code, 200)
+
+
+def run_next(worker='test-worker'):
+    """Claim and run one job on this thread, inside the test's transaction."""
+    claimed = jobs.claim(worker)
+    if claimed:
+        jobs.run_job(claimed[0], worker)
+    return Job.objects.get(pk=claimed[0].pk) if claimed else None
+
+
+@override_settings(JOB_RETRY_BASE_DELAY=10, JOB_RETRY_JITTER=0)
+class JobQueueTests(APITestCase):
+    def setUp(self):
+        self.enterContext(mock.patch.dict(jobs._kinds))
+
+    def test_regrade_is_queued_and_polled(self):
+        self.assertEqual(self.client_for(self.student).post('/api/exam-sessions/regrade/').status_code, 403)
+        response = self.client_for(self.admin).post('/api/exam-sessions/regrade/', {}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], f'/api/jobs/{response.data["id"]}/')
+        self.assertEqual(response.data['status'], 'queued')
+        detail = self.client_for(self.admin).get(response['Location'])
+        self.assertEqual(detail.data['kind'], 'sessions.regrade')
+        self.assertEqual(self.client_for(self.student).get(response['Location']).status_code, 404)
+        self.assertEqual(self.client_for(self.student).get('/api/jobs/').data['results'], [])
+
+    def test_regrade_rescores_sessions(self):
+        question = make_question(self.specialization, mark=2)
+        session = make_session(self.student, self.specialization, [question], score=2)
+        question.choices.update(is_correct=False)
+        jobs.enqueue('sessions.regrade', {'specialization': self.specialization.pk}, user=self.admin)
+        job = run_next()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(job.result, {'sessions': 1, 'changed': 1})
+        self.assertEqual(job.progress, 1.0)
+        session.refresh_from_db()
+        self.assertEqual(session.score, 0)
+        self.assertEqual(ResultRollup.objects.get(scope='specialization', object_id=self.specialization.pk).count, 1)
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        @jobs.job_handler('test.flaky')
+        def flaky(job):
+            raise RuntimeError('upstream down')
+
+        queued = jobs.enqueue('test.flaky', {}, max_attempts=2)
+        job = run_next()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('upstream down', job.error)
+        self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), 10, delta=2)
+        self.assertEqual(jobs.claim('test-worker'), [])
+        Job.objects.filter(pk=queued.pk).update(run_after=timezone.now())
+        with self.assertLogs('api.jobs', 'WARNING'):
+            job = run_next()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(JOB_RETRY_MAX_DELAY=15)
+    def test_retry_delay_is_exponential_and_capped(self):
+        self.assertEqual([jobs.retry_delay(n) for n in (1, 2, 3)], [10, 15, 15])
+
+    def test_job_error_is_not_retried(self):
+        @jobs.job_handler('test.invalid')
+        def invalid(job):
+            raise jobs.JobError('bad input')
+
+        jobs.enqueue('test.invalid', {})
+        with self.assertLogs('api.jobs', 'WARNING'):
+            job = run_next()
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+
+    def test_cancel(self):
+        cleaned = []
+
+        @jobs.job_handler('test.cancelled', cleanup=cleaned.append)
+        def cancelled(job):
+            Job.objects.filter(pk=job.job_id).update(status='cancelled')
+            job.progress(1, 2)
+
+        job = jobs.enqueue('test.cancelled', {'n': 1}, user=self.admin)
+        url = f'/api/jobs/{job.pk}/cancel/'
+        self.assertEqual(self.client_for(self.admin).post(url).data['status'], 'cancelled')
+        self.assertEqual(self.client_for(self.admin).post(url).status_code, 409)
+        self.assertEqual(cleaned, [{'n': 1}])
+        self.assertIsNone(run_next())
+
+        # A running job stops at its next progress report and keeps its cancelled status.
+        jobs.enqueue('test.cancelled', {'n': 2})
+        self.assertEqual(run_next().status, 'cancelled')
+
+    def test_expired_lease_is_reclaimed(self):
+        @jobs.job_handler('test.echo')
+        def echo(job):
+            return job.payload
+
+        job = jobs.enqueue('test.echo', {'value': 1})
+        [first] = jobs.claim('worker-a')
+        self.assertEqual(jobs.claim('worker-b'), [])
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        [second] = jobs.claim('worker-b')
+        self.assertEqual(second.attempts, 2)
+        # The first worker lost the job; its outcome is discarded.
+        jobs.run_job(first, 'worker-a')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'running')
+        jobs.run_job(second, 'worker-b')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('succeeded', {'value': 1}))
+
+    @override_settings(AI_BACKEND='api.ai.backends.StubBackend', AI_STUB_DELAY=0)
+    def test_background_generation(self):
+        cache.clear()
+        AISettings.objects.create(gemini_api_key='test-key', selected_model_name='test-model')
+        response = self.client.post('/api/ai/generate-questions-from-examples/', json.dumps({
+            'example_questions': [{'text': 'Example', 'choices': [{'text': 'a', 'is_correct': True}]}],
+            'specialization_name': self.specialization.name, 'num_questions': 2, 'background': True,
+        }), content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Question.objects.exists())
+        job = run_next()
+        self.assertEqual(job.status, 'succeeded', job.error)
+        self.assertTrue(job.result['saved'])
+        self.assertEqual(len(job.result['questions']), 2)
+        self.assertEqual(Question.objects.filter(is_ai_generated=True).count(), 2)
+
+    @skipUnless(pdf.PdfReader, 'pypdf is not installed')
+    @override_settings(AI_BACKEND='api.ai.backends.StubBackend', AI_STUB_DELAY=0)
+    def test_background_pdf_ingestion_removes_upload(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        AISettings.objects.create(gemini_api_key='test-key', selected_model_name='test-model')
+        upload = SimpleUploadedFile('notes.pdf', make_pdf(['Graphs', 'Trees']), content_type='application/pdf')
+        response = self.client.post('/api/ai/generate-questions-from-pdf/', {
+            'file': upload, 'specialization_name': self.specialization.name, 'num_questions': 2, 'background': True,
+        }, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.student)}')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(len(os.listdir(os.path.join(media.name, 'jobs'))), 1)
+        job = run_next()
+        self.assertEqual(job.status, 'succeeded', job.error)
+        self.assertFalse(job.result['saved'])
+        self.assertEqual(len(job.result['questions']), 2)
+        self.assertEqual(os.listdir(os.path.join(media.name, 'jobs')), [])
+
+
+class JobWorkerTests(TransactionTestCase):
+    def test_workers_share_the_queue(self):
+        seen, lock = [], threading.Lock()
+
+        def record(job):
+            with lock:
+                seen.append(job.job_id)
+            return job.payload
+
+        with mock.patch.dict(jobs._kinds):
+            jobs.job_handler('test.record')(record)
+            ids = [jobs.enqueue('test.record', {'n': n}).pk for n in range(20)]
+
+            def run(name):
+                try:
+                    jobs.work(concurrency=3, burst=True, poll_interval=0.01, name=name)
+                finally:
+                    connection.close()
+
+            workers = [threading.Thread(target=run, args=(f'worker-{n}',)) for n in range(2)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.assertEqual(sorted(seen), ids)
+        self.assertEqual(Job.objects.filter(status='succeeded').count(), 20)
+        self.assertEqual(set(Job.objects.values_list('attempts', flat=True)), {1})
+
+    def test_command_runs_in_burst_mode(self):
+        jobs.enqueue('sessions.regrade', {'specialization': None})
+        out = StringIO()
+        call_command('run_worker', '--burst', '--concurrency=1', '--name=cli', stdout=out)
+        self.assertIn('Worker cli ran 1 jobs.', out.getvalue())
+        self.assertEqual(Job.objects.get().status, 'succeeded')
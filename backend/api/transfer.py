@@ -0,0 +1,278 @@
+import csv
+import io
+import json
+
+from django.db import transaction
+
+from .blobs import acquire, blob_key
+from .changes import record_question_changes
+from .dedup import index_questions
+from .models import Specialization, Question, Choice, Attachment, Blob
+from .sampling import invalidate_question_pools
+from .search import reindex_questions
+from .snapshots import bump_bank_versions
+
+EXPORT_CHUNK_SIZE = 1000
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+CSV_FIELDS = ['text', 'specialization', 'course_year', 'mark', 'is_ai_generated', 'choices', 'attachments']
+
+
+class RecordError(ValueError):
+    pass
+
+
+def iter_export_records(specialization_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one dict per question with its choices and attachments. Questions
+    are streamed from a server-side cursor and children are loaded per chunk,
+    so memory is bounded by chunk_size whatever the size of the bank.
+    """
+    questions = Question.objects.order_by('id').values(
+        'id', 'text', 'specialization__name', 'course_year', 'mark', 'is_ai_generated'
+    )
+    if specialization_id is not None:
+        questions = questions.filter(specialization_id=specialization_id)
+
+    chunk = []
+    for row in questions.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield from _export_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from _export_chunk(chunk)
+
+
+def _export_chunk(rows):
+    ids = [row['id'] for row in rows]
+    choices, attachments = {}, {}
+    for question_id, text, is_correct in Choice.objects.filter(question_id__in=ids).order_by('id').values_list(
+        'question_id', 'text', 'is_correct'
+    ):
+        choices.setdefault(question_id, []).append({'text': text, 'is_correct': is_correct})
+    for question_id, attachment_type, content, file_name, file in Attachment.objects.filter(
+        question_id__in=ids
+    ).order_by('id').values_list('question_id', 'attachment_type', 'content', 'file_name', 'file'):
+        attachments.setdefault(question_id, []).append({
+            'attachment_type': attachment_type, 'content': content, 'file_name': file_name, 'file': file or None,
+        })
+    for row in rows:
+        yield {
+            'id': row['id'],
+            'text': row['text'],
+            'specialization': row['specialization__name'],
+            'course_year': row['course_year'],
+            'mark': row['mark'],
+            'is_ai_generated': row['is_ai_generated'],
+            'choices': choices.get(row['id'], []),
+            'attachments': attachments.get(row['id'], []),
+        }
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def iter_csv(records):
+    """CSV with one row per question; choices and attachments are JSON-encoded columns."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        record = dict(record)
+        record['choices'] = json.dumps(record['choices'], ensure_ascii=False)
+        record['attachments'] = json.dumps(record['attachments'], ensure_ascii=False)
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def parse_ndjson(lines):
+    """Yield a dict per line, or a RecordError for a line that is not valid text or JSON."""
+    for line in lines:
+        if isinstance(line, RecordError):
+            yield line
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            yield RecordError(f'Invalid JSON: {exc}')
+
+
+def parse_csv(lines):
+    """Yield a dict per row, or a RecordError for a row with malformed JSON columns or an undecodable line."""
+    undecoded = []
+
+    def text_lines():
+        for line in lines:
+            if isinstance(line, RecordError):
+                undecoded.append(line)
+            else:
+                yield line
+
+    for row in csv.DictReader(text_lines()):
+        # Lines that failed to decode are reported where they were skipped.
+        yield from undecoded
+        undecoded.clear()
+        try:
+            row['choices'] = json.loads(row.get('choices') or '[]')
+            row['attachments'] = json.loads(row.get('attachments') or '[]')
+        except ValueError as exc:
+            yield RecordError(f'Invalid JSON column: {exc}')
+            continue
+        yield row
+    yield from undecoded
+
+
+def decode_lines(stream, encoding='utf-8'):
+    """
+    Decode a binary stream (an upload or an open file) line by line. A line
+    that does not decode comes out as a RecordError instead.
+    """
+    for number, line in enumerate(stream, start=1):
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError as exc:
+            yield RecordError(f'Line {number} is not valid {encoding}: {exc.reason}.')
+
+
+def _parse_bool(value):
+    """"true" and "1", in any case, are true; so are JSON true and 1."""
+    return value is True or str(value).lower() in ('true', '1')
+
+
+def _check_fields(instance):
+    """Reject values the column would truncate or refuse, before they reach the database."""
+    for field in instance._meta.concrete_fields:
+        value = getattr(instance, field.attname)
+        # File fields hold a FieldFile; its name is what gets stored.
+        value = getattr(value, 'name', value)
+        if not isinstance(value, str):
+            continue
+        if field.max_length is not None and len(value) > field.max_length:
+            raise RecordError(
+                f'{instance._meta.model_name}.{field.name} is longer than {field.max_length} characters.'
+            )
+        if field.choices and value not in dict(field.choices):
+            raise RecordError(f'{instance._meta.model_name}.{field.name} "{value}" is not a valid choice.')
+
+
+def _clean_record(record, specializations):
+    try:
+        name = record['specialization']
+        if not isinstance(name, str) or not name.strip():
+            raise RecordError('Specialization name is missing.')
+        _check_fields(Specialization(name=name))
+        question = Question(
+            text=record['text'],
+            course_year=int(record['course_year']),
+            mark=int(record['mark']),
+            is_ai_generated=_parse_bool(record.get('is_ai_generated', False)),
+        )
+        choices = [
+            Choice(text=choice['text'], is_correct=_parse_bool(choice.get('is_correct', False)))
+            for choice in record.get('choices') or []
+        ]
+        attachments = [
+            Attachment(
+                attachment_type=attachment['attachment_type'],
+                content=attachment.get('content'),
+                file_name=attachment.get('file_name'),
+                file=attachment.get('file') or None,
+                blob_id=blob_key(attachment.get('file')),
+            )
+            for attachment in record.get('attachments') or []
+        ]
+    except RecordError:
+        raise
+    except (KeyError, TypeError, ValueError) as exc:
+        raise RecordError(f'{type(exc).__name__}: {exc}')
+    if not isinstance(question.text, str) or not question.text:
+        raise RecordError('Question text is empty.')
+    if any(not isinstance(choice.text, str) for choice in choices):
+        raise RecordError('Choice text must be a string.')
+    for instance in [question, *choices, *attachments]:
+        _check_fields(instance)
+    # Created only once the record is known to be valid.
+    if name not in specializations:
+        specializations[name] = Specialization.objects.get_or_create(name=name)[0].pk
+    question.specialization_id = specializations[name]
+    return question, choices, attachments
+
+
+def insert_questions(chunk):
+    """
+    Insert (question, choices, attachments) tuples with three bulk INSERTs,
+    then refresh the derived indexes for them. Returns the saved questions.
+    """
+    with transaction.atomic():
+        questions = Question.objects.bulk_create([question for question, _, _ in chunk])
+        children_choices, children_attachments = [], []
+        for question, (_, choices, attachments) in zip(questions, chunk):
+            for choice in choices:
+                choice.question_id = question.pk
+                children_choices.append(choice)
+            for attachment in attachments:
+                attachment.question_id = question.pk
+                children_attachments.append(attachment)
+        Choice.objects.bulk_create(children_choices)
+        blob_ids = {attachment.blob_id for attachment in children_attachments if attachment.blob_id}
+        if blob_ids:
+            # Files exported from another installation have no blob here.
+            known = set(Blob.objects.filter(pk__in=blob_ids).values_list('pk', flat=True))
+            for attachment in children_attachments:
+                if attachment.blob_id not in known:
+                    attachment.blob_id = None
+        Attachment.objects.bulk_create(children_attachments)
+
+        # bulk_create bypasses the model signals, so keep the derived indexes in step here.
+        by_specialization = {}
+        for question in questions:
+            by_specialization.setdefault(question.specialization_id, []).append(question.pk)
+        for specialization_id, question_ids in by_specialization.items():
+            record_question_changes(question_ids, specialization_id)
+        reindex_questions([question.pk for question in questions])
+        index_questions([question.pk for question in questions])
+        acquire([attachment.blob_id for attachment in children_attachments])
+        transaction.on_commit(invalidate_question_pools)
+        transaction.on_commit(lambda: bump_bank_versions(by_specialization))
+    return questions
+
+
+def import_records(records, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Insert questions from an iterable of records in chunks of chunk_size,
+    each chunk in its own transaction. Invalid records are skipped and
+    reported by their 1-based position in the stream.
+    """
+    created, error_count, errors = 0, 0, []
+    specializations = {}
+    chunk = []
+    for position, record in enumerate(records, start=1):
+        try:
+            if isinstance(record, RecordError):
+                raise record
+            chunk.append(_clean_record(record, specializations))
+        except RecordError as exc:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'record': position, 'error': str(exc)})
+            continue
+        if len(chunk) == chunk_size:
+            created += len(insert_questions(chunk))
+            chunk = []
+    if chunk:
+        created += len(insert_questions(chunk))
+    return {'created': created, 'error_count': error_count, 'errors': errors}
+
+
+def parse_upload(stream, file_format):
+    lines = decode_lines(stream)
+    return parse_csv(lines) if file_format == 'csv' else parse_ndjson(lines)
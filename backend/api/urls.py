@@ -1,8 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .ai.views import generate_questions_from_examples, generate_questions_from_pdf
 from .views import (
     UserViewSet, SpecializationViewSet, QuestionViewSet, 
-    AdminExamDefinitionViewSet, ExamSessionViewSet, AISettingsViewSet
+    AdminExamDefinitionViewSet, ExamSessionViewSet, AISettingsViewSet, ItemStatisticsViewSet, JobViewSet,
+    StartStandardExamView, SubmitExamView, QuestionBankView,
+    ChangeFeedView, BlobView, MetricsView
 )
 
 router = DefaultRouter()
@@ -12,7 +15,18 @@ router.register(r'questions', QuestionViewSet)
 router.register(r'exam-definitions', AdminExamDefinitionViewSet, basename='admin-exam-definition')
 router.register(r'exam-sessions', ExamSessionViewSet)
 router.register(r'ai-settings', AISettingsViewSet)
+router.register(r'item-statistics', ItemStatisticsViewSet, basename='item-statistics')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('student/exams/start-standard/', StartStandardExamView.as_view(), name='start-standard-exam'),
+    path('student/exam-sessions/submit/', SubmitExamView.as_view(), name='submit-exam'),
+    path('question-bank/<int:specialization_id>/', QuestionBankView.as_view(), name='question-bank'),
+    path('sync/', ChangeFeedView.as_view(), name='change-feed'),
+    path('blobs/<str:sha256>/', BlobView.as_view(), name='blob'),
+    path('blobs/<str:sha256>/thumbnail/', BlobView.as_view(thumbnail=True), name='blob-thumbnail'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('ai/generate-questions-from-examples/', generate_questions_from_examples, name='ai-generate-from-examples'),
+    path('ai/generate-questions-from-pdf/', generate_questions_from_pdf, name='ai-generate-from-pdf'),
 ]
\ No newline at end of file
@@ -1,54 +1,548 @@
-from rest_framework import viewsets, permissions
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .adaptive import answer_question, question_payload, start_adaptive_session
+from .asyncviews import AsyncAPIView
+from .autosave import check_answers, current_answers, open_session, save_answers
 from .permissions import IsAdminUser, IsStudentUser
 from .models import (
-    User, Specialization, Question, AdminExamDefinition, ExamSession, AISettings
+    User, Specialization, Question, AdminExamDefinition, ExamSession, AISettings, Blob, Job
 )
 from .serializers import (
     UserSerializer, SpecializationSerializer, QuestionSerializer, 
-    AdminExamDefinitionSerializer, ExamSessionSerializer, AISettingsSerializer
+    AdminExamDefinitionSerializer, ExamSessionSerializer, AISettingsSerializer,
+    StartStandardExamSerializer, ExamSubmissionSerializer, ChangeFeedParamsSerializer,
+    QuestionTransferSerializer, DuplicateReportParamsSerializer, QuestionStatisticsSerializer,
+    QuestionListSerializer, ExamSessionListSerializer, JobSerializer, RegradeParamsSerializer,
+    ExamStartSerializer, ExamProgressSerializer, SessionAnswersSerializer, ExamPaperVariantSerializer,
+    PaperVariantParamsSerializer, AdaptiveStartSerializer, AdaptiveAnswerSerializer, AdaptiveStateSerializer
 )
+from .blobs import serve_file
+from .changes import CursorExpired, changes_since
+from .db import ReplicaReadMixin
+from .dedup import duplicate_clusters
+from .fastpath import build_exam_sessions, build_questions, question_rows, question_values, session_values
+from .fieldsets import SparseFieldsetViewMixin
+from .filters import QueryParamFilterBackend, parse_bool, parse_int, parse_timestamp
+from .jobs import cancel, enqueue
+from .metrics import SerializationTimingMixin, render_metrics
+from .papers import assign_paper, build_variants
+from .querysets import (
+    question_read_queryset, question_list_queryset, exam_session_read_queryset, exam_session_list_queryset,
+    item_statistics_queryset
+)
+from .pagination import (
+    QuestionCursorPagination, ExamSessionCursorPagination, QuestionSearchPagination, ItemStatisticsPagination,
+    JobCursorPagination
+)
+from .rollups import get_summary
+from .sampling import sample_question_ids
+from .search import search_question_ids
+from .snapshots import bank_etag, etag_matches, get_bank_snapshot, get_bank_version
+from .submission import finish_session, start_session, submit_exam
+from .transfer import iter_csv, iter_export_records, iter_ndjson, import_records, parse_upload
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadMixin, SerializationTimingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminUser]
 
-class SpecializationViewSet(viewsets.ModelViewSet):
+class SpecializationViewSet(ReplicaReadMixin, SerializationTimingMixin, viewsets.ModelViewSet):
     queryset = Specialization.objects.all()
     serializer_class = SpecializationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ('list', 'retrieve', 'results')
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def results(self, request, pk=None):
+        """Precomputed result rollup and leaderboard across all exams of the specialization."""
+        return Response(get_summary('specialization', self.get_object().pk))
 
-class QuestionViewSet(viewsets.ModelViewSet):
+class QuestionViewSet(ReplicaReadMixin, SparseFieldsetViewMixin, SerializationTimingMixin, viewsets.ModelViewSet):
+    """
+    Listings use the slim QuestionListSerializer (attachments without their
+    content); ?fields= limits the fields and ?expand=attachments restores them.
+    """
     queryset = Question.objects.all()
     serializer_class = QuestionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = QuestionCursorPagination
+    replica_actions = ('list', 'retrieve', 'duplicates')
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'specialization': ('specialization_id', parse_int),
+        'course_year': ('course_year', parse_int),
+        'is_ai_generated': ('is_ai_generated', parse_bool),
+    }
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return question_list_queryset(self.requested_fields, self.requested_expand)
+        return question_read_queryset()
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return QuestionListSerializer
+        return QuestionSerializer
+
+    def fast_options(self, detail=False):
+        return {
+            'summary': not detail and 'attachments' not in self.requested_expand,
+            'request': self.request,
+            'fields': self.requested_fields,
+        }
+
+    def fast_queryset(self):
+        return self.filter_queryset(Question.objects.values(*question_values(self.requested_fields)))
+
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('search', '').strip()
+        if not query:
+            if not settings.API_FAST_SERIALIZATION:
+                return super().list(request, *args, **kwargs)
+            page = self.paginate_queryset(self.fast_queryset())
+            return self.get_paginated_response(build_questions(page, **self.fast_options()))
+
+        ranked = search_question_ids(query)
+        matched = set(self.filter_queryset(Question.objects.filter(id__in=ranked)).values_list('id', flat=True))
+        paginator = QuestionSearchPagination()
+        page = paginator.paginate_queryset([pk for pk in ranked if pk in matched], request, view=self)
+        if settings.API_FAST_SERIALIZATION:
+            return paginator.get_paginated_response(question_rows(page, **self.fast_options()))
+        by_id = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer([by_id[pk] for pk in page if pk in by_id], many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.API_FAST_SERIALIZATION:
+            return super().retrieve(request, *args, **kwargs)
+        row = get_object_or_404(self.fast_queryset(), pk=kwargs['pk'])
+        return Response(build_questions([row], **self.fast_options(detail=True))[0])
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'export', 'bulk_import', 'duplicates']:
             self.permission_classes = [IsAdminUser]
         else:
             self.permission_classes = [permissions.IsAuthenticated]
         return super().get_permissions()
 
-class AdminExamDefinitionViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the bank as NDJSON (default) or CSV via ?file_format=csv."""
+        params = QuestionTransferSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        file_format = params.validated_data['file_format']
+        records = iter_export_records(params.validated_data['specialization'])
+        if file_format == 'csv':
+            response = StreamingHttpResponse(iter_csv(records), content_type='text/csv; charset=utf-8')
+        else:
+            response = StreamingHttpResponse(iter_ndjson(records), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="questions.{file_format}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """Import an uploaded NDJSON or CSV file in bounded-memory chunks."""
+        params = QuestionTransferSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = params.validated_data['file_format']
+        if 'file_format' not in request.data and upload.name.endswith('.csv'):
+            file_format = 'csv'
+        result = import_records(parse_upload(upload, file_format))
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def duplicates(self, request):
+        """Clusters of near-duplicate questions, optionally within one specialization."""
+        params = DuplicateReportParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        clusters = duplicate_clusters(params.validated_data['threshold'], params.validated_data['specialization'])
+        return Response({'count': len(clusters), 'clusters': clusters})
+
+class AdminExamDefinitionViewSet(ReplicaReadMixin, SerializationTimingMixin, viewsets.ModelViewSet):
     queryset = AdminExamDefinition.objects.all()
     serializer_class = AdminExamDefinitionSerializer
     permission_classes = [IsAdminUser]
+    lookup_value_regex = r'\d+'
+    replica_actions = ('list', 'retrieve', 'results')
+
+    @action(detail=True, methods=['get'])
+    def results(self, request, pk=None):
+        """Precomputed result rollup and leaderboard for the definition."""
+        return Response(get_summary('definition', self.get_object().pk))
+
+    @action(detail=True, methods=['get', 'post'])
+    def variants(self, request, pk=None):
+        """
+        The definition's pre-built paper variants. POST replaces them with
+        freshly shuffled ones, rendered into the cache before the exam opens.
+        """
+        definition = self.get_object()
+        if request.method == 'GET':
+            variants = definition.paper_variants.order_by('number')
+            return Response(ExamPaperVariantSerializer(variants, many=True).data)
+        params = PaperVariantParamsSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        variants = build_variants(definition, **params.validated_data)
+        return Response(ExamPaperVariantSerializer(variants, many=True).data, status=status.HTTP_201_CREATED)
 
-class ExamSessionViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'], permission_classes=[IsStudentUser])
+    def start(self, request, pk=None):
+        """
+        A paper of this exam for the student: the next pre-built variant in
+        turn, served from the cache without a query.
+        """
+        body = assign_paper(int(pk))
+        if body is None:
+            raise Http404('This exam has no paper variants.')
+        return HttpResponse(body, content_type='application/json')
+
+class ExamSessionViewSet(ReplicaReadMixin, SparseFieldsetViewMixin, SerializationTimingMixin, viewsets.ModelViewSet):
+    """
+    Listings return related rows as ids; ?expand= nests them and ?fields=
+    limits the fields. Detail responses are complete. Sessions still being
+    taken are only reached through start, adaptive, in_progress, resume,
+    autosave, answer and submit.
+    """
     queryset = ExamSession.objects.all()
     serializer_class = ExamSessionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ExamSessionCursorPagination
+    lookup_value_regex = r'\d+'
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'student': ('student_id', parse_int),
+        'specialization': ('specialization_id', parse_int),
+        'admin_exam_definition': ('admin_exam_definition_id', parse_int),
+        'completed_after': ('completed_at__gte', parse_timestamp),
+        'completed_before': ('completed_at__lt', parse_timestamp),
+    }
 
-    def get_queryset(self):
+    def scope(self, queryset):
         user = self.request.user
+        queryset = queryset.filter(status='completed')
         if user.role == 'student':
-            return ExamSession.objects.filter(student=user)
+            return queryset.filter(student_id=user.id)
         elif user.role == 'admin':
-            return ExamSession.objects.all()
-        return ExamSession.objects.none()
+            return queryset
+        return queryset.none()
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return self.scope(exam_session_list_queryset(self.requested_fields, self.requested_expand))
+        return self.scope(exam_session_read_queryset())
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ExamSessionListSerializer
+        return ExamSessionSerializer
+
+    def fast_queryset(self, columns):
+        return self.filter_queryset(self.scope(ExamSession.objects.values(*columns)))
+
+    def list(self, request, *args, **kwargs):
+        if not settings.API_FAST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        columns = session_values(self.requested_expand, fields=self.requested_fields)
+        page = self.paginate_queryset(self.fast_queryset(columns))
+        return self.get_paginated_response(build_exam_sessions(
+            page, expand=self.requested_expand, request=request, fields=self.requested_fields,
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.API_FAST_SERIALIZATION:
+            return super().retrieve(request, *args, **kwargs)
+        columns = session_values(detail=True, fields=self.requested_fields)
+        row = get_object_or_404(self.fast_queryset(columns), pk=kwargs['pk'])
+        return Response(build_exam_sessions([row], detail=True, request=request, fields=self.requested_fields)[0])
+
+    def get_permissions(self):
+        if self.action == 'regrade':
+            self.permission_classes = [IsAdminUser]
+        return super().get_permissions()
+
+    @action(detail=False, methods=['post'])
+    def regrade(self, request):
+        """
+        Queue a background job that rescores stored sessions (all, or one
+        specialization's) against the current answer key. Poll the returned job.
+        """
+        params = RegradeParamsSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        job = JobSerializer(enqueue('sessions.regrade', params.validated_data, user=request.user)).data
+        return Response(job, status=status.HTTP_202_ACCEPTED, headers={'Location': job['url']})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsStudentUser])
+    def start(self, request):
+        """Open an in-progress session on the given questions, to be autosaved and then submitted."""
+        params = ExamStartSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        session = start_session(request.user, params.validated_data)
+        return Response(ExamProgressSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='in-progress', permission_classes=[IsStudentUser])
+    def in_progress(self, request):
+        """The student's sessions still being taken, to find one again after losing the page."""
+        sessions = ExamSession.objects.filter(student_id=request.user.id, status='in_progress').order_by('-id')
+        return Response(ExamProgressSerializer(sessions, many=True).data)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsStudentUser])
+    def adaptive(self, request):
+        """
+        Open an adaptive session: each question is picked to suit the ability
+        shown by the answers so far. Answer them one at a time through answer,
+        then submit the session.
+        """
+        params = AdaptiveStartSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        state = start_adaptive_session(request.user, params.validated_data)
+        return Response(self._adaptive_progress(state), status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsStudentUser])
+    def answer(self, request, pk=None):
+        """Answer the current question of an adaptive session and receive the next, if any."""
+        params = AdaptiveAnswerSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        state = answer_question(
+            request.user, int(pk), params.validated_data['question_id'], params.validated_data['selected_choice_id'],
+        )
+        return Response(self._adaptive_progress(state))
 
-class AISettingsViewSet(viewsets.ModelViewSet):
+    def _adaptive_progress(self, state):
+        question = None
+        if state.current_question_id:
+            question = question_payload(state.current_question_id, state.session.specialization_id)
+        return {
+            **ExamProgressSerializer(state.session).data,
+            'adaptive': AdaptiveStateSerializer(state).data,
+            'question': question,
+        }
+
+    @action(detail=True, methods=['get'], permission_classes=[IsStudentUser])
+    def resume(self, request, pk=None):
+        """An in-progress session with its questions and latest answers, autosaved ones included."""
+        question_ids = sorted(open_session(int(pk), request.user.id, adaptive=True))
+        session = ExamSession.objects.get(pk=pk)
+        questions = question_read_queryset().filter(id__in=question_ids).order_by('id')
+        answers = current_answers(session.pk, question_ids)
+        return Response({
+            **ExamProgressSerializer(session).data,
+            'questions': QuestionSerializer(questions, many=True).data,
+            'answers': [
+                {'question_id': question_id, 'selected_choice_id': choice_id}
+                for question_id, choice_id in sorted(answers.items())
+            ],
+        })
+
+    @action(detail=True, methods=['post'], permission_classes=[IsStudentUser])
+    def autosave(self, request, pk=None):
+        """
+        Record answer changes of an in-progress session. With a cache shared
+        between processes they wait there and reach the database in periodic
+        batches, so a save usually costs no query at all; otherwise they are
+        written at once.
+        """
+        params = SessionAnswersSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        answers = params.validated_data['answers']
+        check_answers(open_session(int(pk), request.user.id), answers)
+        save_answers(int(pk), answers)
+        return Response({'saved': len(answers)}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsStudentUser])
+    def submit(self, request, pk=None):
+        """Grade and complete an in-progress session from its autosaved answers and any sent along."""
+        params = SessionAnswersSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        session = finish_session(request.user, int(pk), params.validated_data['answers'])
+        return Response(ExamSessionSerializer(exam_session_read_queryset().get(pk=session.pk)).data)
+
+class ItemStatisticsViewSet(ReplicaReadMixin, SerializationTimingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Per-question difficulty, discrimination and choice pick rates, read
+    straight from the incrementally maintained statistics tables.
+    Sort with ?ordering=correct_rate (or attempts; prefix "-" to reverse).
+    """
+    serializer_class = QuestionStatisticsSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdminUser]
+    pagination_class = ItemStatisticsPagination
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'specialization': ('question__specialization_id', parse_int),
+        'course_year': ('question__course_year', parse_int),
+        'is_ai_generated': ('question__is_ai_generated', parse_bool),
+        'min_attempts': ('attempts__gte', parse_int),
+    }
+    orderings = ['correct_rate', '-correct_rate', 'attempts', '-attempts']
+
+    def get_queryset(self):
+        ordering = self.request.query_params.get('ordering', '')
+        if ordering and ordering not in self.orderings:
+            raise ValidationError({'ordering': [f'Must be one of {self.orderings}.']})
+        fields = [ordering] if ordering else []
+        return item_statistics_queryset().order_by(*fields, 'question_id')
+
+class JobViewSet(SerializationTimingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Background jobs, for polling: status, progress, result and error.
+    Admins see every job, other users the jobs they queued.
+    """
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = JobCursorPagination
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'status': ('status', str),
+        'kind': ('kind', str),
+    }
+
+    def get_queryset(self):
+        jobs = Job.objects.defer('payload')
+        if self.request.user.role != 'admin':
+            jobs = jobs.filter(created_by_id=self.request.user.id)
+        return jobs
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancel a queued or running job; a running job stops at its next progress report."""
+        job = self.get_object()
+        if not cancel(job):
+            return Response({'detail': f'Job is already {job.status}.'}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(JobSerializer(job).data)
+
+class AISettingsViewSet(SerializationTimingMixin, viewsets.ModelViewSet):
     queryset = AISettings.objects.all()
     serializer_class = AISettingsSerializer
-    permission_classes = [IsAdminUser]
\ No newline at end of file
+    permission_classes = [IsAdminUser]
+
+class StartStandardExamView(APIView):
+    """
+    Draws a random set of non-AI questions for a specialization and course
+    year from the cached id pool, then loads only the sampled rows.
+    """
+    permission_classes = [IsStudentUser]
+
+    def post(self, request):
+        params = StartStandardExamSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        args = (data['specialization_id'], data['course_year'], data['num_questions'])
+
+        ids = sample_question_ids(*args)
+        questions = self._load(ids, data)
+        if len(questions) < len(ids):
+            # The cached pool can briefly lag a concurrent write; rebuild it once.
+            ids = sample_question_ids(*args, refresh=True)
+            questions = self._load(ids, data)
+        return Response(QuestionSerializer(questions, many=True).data)
+
+    def _load(self, ids, data):
+        by_id = question_read_queryset().filter(
+            id__in=ids,
+            specialization_id=data['specialization_id'],
+            course_year=data['course_year'],
+            is_ai_generated=False,
+        ).in_bulk()
+        return [by_id[pk] for pk in ids if pk in by_id]
+
+class SubmitExamView(AsyncAPIView):
+    """
+    Grades a finished exam and stores the session, its answers and its
+    questions in one transaction with a fixed number of queries. Async, so
+    under ASGI the event loop keeps serving other requests while the
+    transaction runs in a thread.
+    """
+    permission_classes = [IsStudentUser]
+
+    async def post(self, request):
+        payload = ExamSubmissionSerializer(data=request.data)
+        payload.is_valid(raise_exception=True)
+        data = await sync_to_async(self.submit)(request.user, payload.validated_data)
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def submit(self, student, data):
+        session = submit_exam(student, data)
+        session = exam_session_read_queryset().get(pk=session.pk)
+        return ExamSessionSerializer(session).data
+
+class QuestionBankView(APIView):
+    """
+    Whole question bank of a specialization, served from a versioned snapshot.
+    Clients revalidate with If-None-Match; an unchanged bank answers 304 from
+    a single cache read.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, specialization_id):
+        version = get_bank_version(specialization_id)
+        etag = bank_etag(specialization_id, version)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            body = get_bank_snapshot(specialization_id, version)
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+class ChangeFeedView(APIView):
+    """
+    Rows created, updated or deleted since the client's cursor. Clients start
+    from since=0 and keep the returned cursor, paging while has_more is set.
+    A cursor from before the journal was last pruned gets 410 Gone with the
+    cursor to continue from once the bank is reloaded (/api/question-bank/).
+    Exam definitions are only included for admins.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        params = ChangeFeedParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        try:
+            feed = changes_since(
+                data['since'],
+                limit=data['limit'],
+                specialization_id=data['specialization'],
+                include_definitions=request.user.role == 'admin',
+            )
+        except CursorExpired as exc:
+            return Response({
+                'detail': 'The change log no longer reaches back to this cursor; load the question bank afresh.',
+                'code': 'cursor_expired',
+                'cursor': exc.cursor,
+            }, status=status.HTTP_410_GONE)
+        return Response(feed)
+
+class BlobView(APIView):
+    """
+    Attachment bytes (or their thumbnail) by content hash. The URL changes
+    whenever the content does, so responses are cacheable forever.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    thumbnail = False
+
+    def get(self, request, sha256):
+        blob = Blob.objects.filter(pk=sha256).first()
+        if blob is None or (self.thumbnail and not blob.thumbnail):
+            raise Http404
+        if self.thumbnail:
+            return serve_file(request, blob.thumbnail.name, 'image/jpeg', f'"{sha256}-thumb"', blob.thumbnail.size)
+        return serve_file(request, blob.file.name, blob.content_type, f'"{sha256}"', blob.size)
+
+class MetricsView(APIView):
+    """Request metrics of this worker process in the Prometheus text format."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,3 +1,5 @@
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -31,6 +33,7 @@ INSTALLED_APPS = [
     ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,11 +67,84 @@ WSGI_APPLICATION = 'main.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres switches to PostgreSQL configured from POSTGRES_*
+# variables; POSTGRES_REPLICA_HOST adds a read replica used by the read-only
+# viewset actions (api.db.ReplicaRouter).
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgres':
+    _postgres = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'exam'),
+        'USER': os.environ.get('POSTGRES_USER', 'exam'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
+    DATABASES = {'default': _postgres}
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **_postgres,
+            'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+            'PORT': os.environ.get('POSTGRES_REPLICA_PORT', _postgres['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Take the write lock when a transaction starts, so concurrent
+                # writers wait on busy_timeout instead of failing to upgrade
+                # a read lock.
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # A file rather than the in-memory default, so tests exercise WAL
+            # and concurrent connections.
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), f'exam-api-test-{os.getpid()}.sqlite3')},
+        }
+    }
+
+DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+
+# Cache
+
+# REDIS_URL switches to Redis, shared by every web and worker process. The
+# process-local default suits a single server process only: autosaved exam
+# answers wait in the cache until a worker flushes them (api/autosave.py), and
+# the question bank, sampling pool and paper versions are counted there
+# (api/snapshots.py; `check --deploy` warns about this as api.W002).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # One entry per autosaved answer; the default of 300 would evict
+            # answers before they are flushed.
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 200000))},
+        }
+    }
+
+# Applied to every new SQLite connection (api.signals.tune_connection). These
+# last only as long as the connection; the WAL journal mode is persistent and
+# set once by migration api.0015_sqlite_wal_journal.
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000)),
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
 
 
@@ -108,6 +184,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -117,10 +196,18 @@ AUTH_USER_MODEL = 'api.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'api.authentication.JWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Build question and exam-session read responses from .values() rows
+# (api/fastpath.py) instead of nested ModelSerializers.
+API_FAST_SERIALIZATION = True
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -146,10 +233,111 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-    'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
+    'TOKEN_USER_CLASS': 'api.authentication.TokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.CachedTokenRefreshSerializer',
 
     'JTI_CLAIM': 'jti',
 
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
-}
\ No newline at end of file
+}
+
+# Authenticate tokens carrying a role claim without loading the user; role
+# and deactivation changes then apply when the access token is refreshed.
+JWT_STATELESS_AUTH = True
+# Seconds a User row loaded for authentication or token refresh is cached.
+AUTH_USER_CACHE_TTL = 60
+
+# AI generation proxy
+
+AI_BACKEND = os.environ.get('AI_BACKEND', 'api.ai.backends.GeminiBackend')
+AI_DEFAULT_MODEL = 'gemini-2.5-flash-preview-04-17'
+AI_MAX_CONCURRENT_REQUESTS = int(os.environ.get('AI_MAX_CONCURRENT_REQUESTS', 8))
+AI_REQUEST_TIMEOUT = 60
+AI_RESPONSE_CACHE_TIMEOUT = 24 * 60 * 60
+AI_SETTINGS_CACHE_TTL = 60
+AI_STUB_DELAY = float(os.environ.get('AI_STUB_DELAY', 0))
+AI_DUPLICATE_THRESHOLD = 0.8
+AI_PDF_TOKEN_BUDGET = 12000
+AI_PDF_MAX_CHUNKS = 4
+AI_PDF_PARALLEL_PAGES = 50
+AI_PDF_BATCH_PAGES = 25
+AI_PDF_WORKERS = int(os.environ.get('AI_PDF_WORKERS', min(4, os.cpu_count() or 1)))
+AI_PDF_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# Exam result rollups
+
+RESULT_HISTOGRAM_BINS = 10
+RESULT_LEADERBOARD_SIZE = 10
+
+# Attachment storage
+
+# 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd) hands blob
+# downloads to the front-end server; unset serves them from Django.
+ATTACHMENT_SENDFILE = os.environ.get('ATTACHMENT_SENDFILE') or None
+ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+ATTACHMENT_THUMBNAIL_SIZE = (320, 320)
+ATTACHMENT_THUMBNAIL_WORKERS = int(os.environ.get('ATTACHMENT_THUMBNAIL_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Request metrics
+
+METRICS_ENABLED = True
+METRICS_PREFIX = 'exam_api'
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+METRICS_SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+# Requests at least this slow are logged (logger "api.metrics") with their
+# most expensive SQL statements.
+METRICS_SLOW_REQUEST_SECONDS = float(os.environ.get('METRICS_SLOW_REQUEST_SECONDS', 1.0))
+METRICS_SLOW_REQUEST_TOP_QUERIES = 5
+
+# Background jobs (api/jobs.py, run by "manage.py run_worker")
+
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', min(4, os.cpu_count() or 1)))
+JOB_POLL_INTERVAL = 1.0
+JOB_MAX_ATTEMPTS = 3
+# Retries wait JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1) seconds, capped at
+# JOB_RETRY_MAX_DELAY and shortened by up to JOB_RETRY_JITTER of itself.
+JOB_RETRY_BASE_DELAY = 5
+JOB_RETRY_MAX_DELAY = 300
+JOB_RETRY_JITTER = 0.1
+# A running job whose worker has not reported progress for this long is
+# presumed lost and claimed again.
+JOB_LEASE_SECONDS = 300
+
+# Exam answer autosave (api/autosave.py)
+
+# Buffer autosaved answers in the cache: None buffers only when the default
+# cache is shared between processes (Redis), since the flush worker and every
+# web process must see the buffer; otherwise answers are written through.
+AUTOSAVE_BUFFERED = None
+# Buffered answers are written to the database by a "sessions.flush_answers"
+# job this many seconds after the first unflushed change, so a worker must run.
+AUTOSAVE_FLUSH_INTERVAL = 10
+AUTOSAVE_FLUSH_BATCH = 500
+AUTOSAVE_BUFFER_TIMEOUT = 24 * 60 * 60
+
+# Adaptive exams (api/adaptive.py)
+
+# Each next question is drawn at random from this many unasked questions
+# nearest the student's ability, so students of one level do not all get the
+# same exam.
+ADAPTIVE_SELECTION_WIDTH = 5
+# An adaptive exam ends early once the standard error of the ability estimate
+# is this small.
+ADAPTIVE_STOP_STANDARD_ERROR = 0.3
+# Each process rebuilds its difficulty index after this many seconds, so
+# difficulties estimated from the statistics follow new submissions.
+ADAPTIVE_INDEX_REFRESH = 5 * 60
+
+# Change feed (api/changes.py)
+
+# The feed only serves journal entries at least this many seconds old.
+# PostgreSQL allocates ids at INSERT rather than at commit, so a transaction
+# can commit an id below one a client already synced past; the lag must
+# outlast the longest transaction that writes the bank. SQLite commits
+# writers one at a time, in id order, and needs none.
+CHANGE_FEED_SETTLE_SECONDS = 0 if DATABASES['default']['ENGINE'].endswith('sqlite3') else 10
+# "manage.py prune_change_log" drops entries older than this.
+CHANGE_LOG_RETENTION_DAYS = 90